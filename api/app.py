@@ -1,12 +1,42 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, has_request_context, request, jsonify
+from werkzeug.wsgi import wrap_file
 import subprocess
 import sys
 import json
 import os
+import re
+import selectors
+import threading
+import time
 import tempfile
 import random
 import base64
+import hmac
 from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+# Helper modules live next to this file; the Vercel handler loads us by path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from format_records import classify_formats, encode_formats_response, url_expiry
+from extraction_profile import (
+    YOUTUBE_PLAYER_CLIENTS, assemble_video_info, decode_extraction_line, get_extraction_profile, get_record_line_count
+)
+from response_cache import PreparedResponse
+from cache_backends import create_cache
+from routing import FORWARDED_HEADER, NodeRouter
+import media_proxy
+import media_cache
+import muxer
+import live_proxy
+from bandwidth import BandwidthScheduler
+from child_usage import ChildUsage, parse_limits
+from zip_stream import ZipStream
+from proxy_pool import NO_PROXY, ProxyPool, ProxyUnavailable, cookie_account
+from jobs import JobError, JobQueue, JobStore
+from refresh_scheduler import AccessTracker, CircuitBreaker, RefreshBudget, RefreshScheduler
+from warmup import WarmUp
+from video_ids import VIDEO_ID_RE, get_request_video_id, get_video_id
 
 app = Flask(__name__)
 
@@ -18,6 +48,157 @@ USER_AGENTS = [
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 ]
 
+# yt-dlp command: the slim launcher loads only the YouTube extractors, which cuts the
+# spawn cost of every extraction (see ytdlp_launcher.py; 0 runs `python -m yt_dlp`)
+SLIM_YTDLP = os.environ.get('DEBUTUBE_SLIM_YTDLP', '1') not in ('0', 'false')
+YTDLP_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ytdlp_launcher.py')] \
+    if SLIM_YTDLP else [sys.executable, '-m', 'yt_dlp']
+# yt-dlp's cache (the preprocessed player JS and signature solutions) is kept across
+# extractions, so only the first one after a player update derives them
+YTDLP_CACHE_DIR = os.environ.get('DEBUTUBE_YTDLP_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'debutube_ytdlp_cache'))
+# Resource limits for each yt-dlp child, comma-separated RLIMIT_* names without the prefix:
+# cpu= in CPU seconds, data= and as= in bytes with an optional K/M/G suffix. data= caps what
+# it allocates; as= also counts address space a JavaScript runtime only reserves, so keep it generous
+YTDLP_LIMITS = parse_limits(os.environ.get('DEBUTUBE_YTDLP_LIMITS', 'cpu=30,data=2G'))
+
+def note_child_usage(entry):
+    """Attach a yt-dlp run's usage to the request that started it, for the request log"""
+    if has_request_context():
+        g.setdefault('child_usage', []).append(entry)
+
+# Every yt-dlp run goes through this, which logs its CPU time, peak RSS and wall time
+YTDLP_CHILDREN = ChildUsage('yt-dlp', YTDLP_LIMITS, listener=note_child_usage)
+
+# Extraction profile for /api/formats: 'trimmed' asks yt-dlp for only the fields we read,
+# 'full' falls back to the complete --dump-json document
+EXTRACTION_PROFILE = os.environ.get('DEBUTUBE_EXTRACTION_PROFILE', 'trimmed')
+
+# Cache shared by /api/formats results and direct URLs, entries live until shortly before
+# their URLs expire: memory:// (default), shm:// (shared by the workers on one host),
+# sqlite:///path/to.db or redis://[:password@]host:port/db; comma-separate URLs to tier them
+CACHE = create_cache(
+    os.environ.get('DEBUTUBE_CACHE_URL'),
+    max_bytes=int(os.environ['DEBUTUBE_CACHE_MAX_BYTES']) if os.environ.get('DEBUTUBE_CACHE_MAX_BYTES') else None
+)
+# Consistent-hash routing of video IDs across API nodes: DEBUTUBE_NODES lists every
+# node's base URL and DEBUTUBE_NODE_URL is this node's own (see routing.py)
+NODE_URLS = [node.strip() for node in os.environ.get('DEBUTUBE_NODES', '').split(',') if node.strip()]
+ROUTER = NodeRouter(NODE_URLS, os.environ.get('DEBUTUBE_NODE_URL')) if NODE_URLS and os.environ.get('DEBUTUBE_NODE_URL') else None
+# Outbound proxies for extractions and media fetches (see proxy_pool.py): comma-separated
+# http://, socks5:// or socks5h:// URLs, or "direct" for the server's own address. Each has
+# a budget of DEBUTUBE_PROXY_CONCURRENCY extractions at once and DEBUTUBE_PROXY_RATE a
+# minute, overridable per proxy with ?concurrency=&rate= on its URL. Extractions with the
+# server's own cookies share its account, and are spread over DEBUTUBE_SHARED_ACCOUNT_PROXIES
+PROXY_URLS = [proxy.strip() for proxy in os.environ.get('DEBUTUBE_PROXIES', '').split(',') if proxy.strip()]
+PROXIES = ProxyPool(
+    PROXY_URLS,
+    concurrency=int(os.environ.get('DEBUTUBE_PROXY_CONCURRENCY', 2)),
+    rate=float(os.environ.get('DEBUTUBE_PROXY_RATE', 20)),
+    # How long an extraction waits for a proxy with budget to spare
+    wait=float(os.environ.get('DEBUTUBE_PROXY_WAIT', 10)),
+    cache=CACHE,
+    shared_owners=int(os.environ.get('DEBUTUBE_SHARED_ACCOUNT_PROXIES', 3))
+) if PROXY_URLS else None
+media_proxy.PROXIES = PROXIES
+
+FORMATS_CACHE_MAX_TTL = 6 * 3600
+FORMATS_CACHE_DEFAULT_TTL = 600  # When no format URL carries an expire= timestamp
+URL_EXPIRY_MARGIN = 1800  # Don't hand out URLs with less than this left before expiry
+FORMATS_REFRESH_AHEAD = 600  # Re-extract in the background once cached URLs get this close to expiring
+
+# Video metadata and the format listing outlive the signed URLs: they're cached without
+# URLs for this long and served while fresh URLs are extracted in the background
+METADATA_CACHE_TTL = int(os.environ.get('DEBUTUBE_METADATA_TTL', 2 * 86400))
+MAX_BACKGROUND_REFRESHES = int(os.environ.get('DEBUTUBE_MAX_BACKGROUND_REFRESHES', 4))
+BACKGROUND_REFRESHES = set()  # Formats cache keys being refreshed in this process
+BACKGROUND_REFRESH_LOCK = threading.Lock()
+
+# Hot videos are re-extracted before their URLs expire, within this many extractions a
+# minute per process (0 disables it; background threads don't outlive a Vercel invocation)
+REFRESH_BUDGET_PER_MINUTE = int(os.environ.get('DEBUTUBE_REFRESH_BUDGET', 0 if os.environ.get('VERCEL') else 6))
+HOT_VIDEO_COUNT = int(os.environ.get('DEBUTUBE_HOT_VIDEOS', 50))
+HOT_VIDEOS = AccessTracker()
+# After /api/formats, direct URLs for the formats the UI is most likely to download next
+# are cached so the follow-up /api/direct-url is a lookup. URLs come from the formats
+# extraction itself; picks without one are resolved in the background within this budget
+PREFETCH_DIRECT_URLS = os.environ.get('DEBUTUBE_PREFETCH_DIRECT_URLS', '1') not in ('0', 'false')
+PREFETCH_BUDGET = RefreshBudget(int(os.environ.get('DEBUTUBE_PREFETCH_BUDGET', 0 if os.environ.get('VERCEL') else 20)))
+# Pauses background extraction while the server's cookies keep hitting bot detection
+EXTRACTION_BREAKER = CircuitBreaker()
+
+# /api/download fetches large formats over several connections unless ?segmented=0
+SEGMENTED_DOWNLOADS = os.environ.get('DEBUTUBE_SEGMENTED_DOWNLOADS', '1') not in ('0', 'false')
+# Optional disk cache of downloaded media, so popular videos are fetched from googlevideo
+# once per segment instead of once per download (see media_cache.py)
+MEDIA_CACHE = media_cache.MediaCache(
+    os.environ['DEBUTUBE_MEDIA_CACHE_DIR'],
+    int(os.environ.get('DEBUTUBE_MEDIA_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+) if os.environ.get('DEBUTUBE_MEDIA_CACHE_DIR') else None
+
+# Node egress in bytes/s shared fairly between clients (weighted fair queueing), and an
+# optional cap and burst allowance per client; both 0 (the default) disables scheduling.
+# DEBUTUBE_CLIENT_WEIGHTS gives some clients a bigger share: "1.2.3.4=2,5.6.7.8=0.5".
+# Each worker process schedules its own downloads, so the node's egress is split evenly
+# between DEBUTUBE_EGRESS_WORKERS (default WEB_CONCURRENCY, else 1) workers. The client
+# cap and burst apply per process, so a client whose downloads land on several workers
+# can get up to that many times its cap
+EGRESS_RATE = int(os.environ.get('DEBUTUBE_EGRESS_RATE', 0))
+EGRESS_WORKERS = max(1, int(os.environ.get('DEBUTUBE_EGRESS_WORKERS', os.environ.get('WEB_CONCURRENCY', 1))))
+CLIENT_RATE = int(os.environ.get('DEBUTUBE_CLIENT_RATE', 0))
+# Proxies in front of this app that append to X-Forwarded-For (Vercel's edge is one);
+# clients are told apart by the address the outermost of them saw
+TRUSTED_PROXY_HOPS = int(os.environ.get('DEBUTUBE_TRUSTED_PROXIES', 1 if os.environ.get('VERCEL') else 0))
+BANDWIDTH = BandwidthScheduler(
+    rate=EGRESS_RATE // EGRESS_WORKERS,
+    client_rate=CLIENT_RATE,
+    client_burst=int(os.environ.get('DEBUTUBE_CLIENT_BURST', 4 * 1024 * 1024)),
+    weights={
+        client.split('=', 1)[0].strip(): float(client.split('=', 1)[1])
+        for client in os.environ.get('DEBUTUBE_CLIENT_WEIGHTS', '').split(',') if '=' in client
+    }
+) if EGRESS_RATE or CLIENT_RATE else None
+
+# Live HLS streams are polled once per node however many viewers there are, keeping
+# the newest segments in memory (see live_proxy.py); at most DEBUTUBE_LIVE_STREAMS
+# streams per process, the least recently watched dropped first
+LIVE_PROXY = live_proxy.LiveProxy(
+    window=int(os.environ.get('DEBUTUBE_LIVE_WINDOW', live_proxy.LIVE_WINDOW_SEGMENTS)),
+    ring=int(os.environ.get('DEBUTUBE_LIVE_SEGMENTS', live_proxy.LIVE_RING_SEGMENTS)),
+    max_streams=int(os.environ.get('DEBUTUBE_LIVE_STREAMS', live_proxy.LIVE_MAX_STREAMS))
+)
+FORMAT_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# /api/archive takes at most this many videoId:formatId items
+MAX_ARCHIVE_ITEMS = int(os.environ.get('DEBUTUBE_MAX_ARCHIVE_ITEMS', 50))
+# File extensions for the mime= parameter of googlevideo URLs
+MIME_EXTENSIONS = {'video/mp4': 'mp4', 'video/webm': 'webm', 'audio/mp4': 'm4a', 'audio/webm': 'webm'}
+
+# Background jobs for playlists, channels and batches (see jobs.py), kept in a SQLite
+# database shared by the workers on one host; 0 workers disables them (background
+# threads don't outlive a Vercel invocation). Finished jobs are deleted after DEBUTUBE_JOB_TTL
+JOB_WORKERS = int(os.environ.get('DEBUTUBE_JOB_WORKERS', 0 if os.environ.get('VERCEL') else 2))
+JOBS_DB = os.environ.get('DEBUTUBE_JOBS_DB', os.path.join(tempfile.gettempdir(), 'debutube_jobs.db'))
+MAX_JOB_ITEMS = int(os.environ.get('DEBUTUBE_MAX_JOB_ITEMS', 500))
+JOB_TTL = int(os.environ.get('DEBUTUBE_JOB_TTL', 86400))
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com')
+
+# Browsers may reuse a CORS preflight for this long (Chrome caps it at 2 hours)
+CORS_MAX_AGE = 86400
+
+# Warm-up of yt-dlp, cookies, connections and the player JS (see warmup.py): at process
+# start with DEBUTUBE_WARMUP=1, or on POST /api/internal/warmup. DEBUTUBE_WARMUP_VIDEOS
+# lists hot video IDs to pre-extract into the cache; the player JS is primed by extracting
+# the first of them, or DEBUTUBE_WARMUP_PROBE_VIDEO when none are listed ('' to skip it)
+WARMUP_AT_BOOT = os.environ.get('DEBUTUBE_WARMUP', '0') not in ('0', 'false')
+WARMUP_VIDEO_IDS = [
+    video_id.strip() for video_id in os.environ.get('DEBUTUBE_WARMUP_VIDEOS', '').split(',')
+    if VIDEO_ID_RE.fullmatch(video_id.strip())
+]
+WARMUP_PROBE_VIDEO = os.environ.get('DEBUTUBE_WARMUP_PROBE_VIDEO', 'jNQXAC9IVRw')
+# Internal endpoints require this token in X-Debutube-Token; when it isn't set they only
+# answer local callers
+INTERNAL_TOKEN = os.environ.get('DEBUTUBE_INTERNAL_TOKEN')
+
 class CookieManager:
     """Secure cookie management for YouTube authentication"""
     
@@ -106,14 +287,15 @@ def load_youtube_cookies():
     print("❌ No YouTube cookies found! Please create youtube_cookies.txt or set YTDLP_COOKIES environment variable")
     return None
 
-def get_ytdlp_base_options(url, cookie_file=None):
+def get_ytdlp_base_options(url, cookie_file=None, extractor_args=None):
     """Get base yt-dlp options optimized for Vercel serverless environment with cookie support"""
-    temp_cache_dir = tempfile.mkdtemp(prefix='ytdlp_cache_')
     user_agent = random.choice(USER_AGENTS)
     
+    # yt-dlp keeps only the last --extractor-args per extractor, so all youtube args go in one
+    youtube_args = {'player_client': YOUTUBE_PLAYER_CLIENTS, **(extractor_args or {})}
+    
     base_options = [
-        '--no-cache-dir',  # Disable cache completely
-        '--cache-dir', temp_cache_dir,  # Use temp directory for any cache needs
+        '--cache-dir', YTDLP_CACHE_DIR,  # Shared player JS and signature cache
         '--user-agent', user_agent,
         '--referer', 'https://www.youtube.com/',
         '--extractor-retries', '5',  # Increased retries
@@ -124,8 +306,7 @@ def get_ytdlp_base_options(url, cookie_file=None):
         '--no-warnings',  # Reduce noise in logs
         '--add-header', 'Accept-Language:en-US,en;q=0.9',  # Add language header
         '--add-header', 'Accept:text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',  # Add accept header
-        # Use modern YouTube player clients to avoid "not available on this app" errors
-        '--extractor-args', 'youtube:player_client=tv,android_sdkless,web,ios,android,web_safari',
+        '--extractor-args', 'youtube:' + ';'.join(f'{key}={value}' for key, value in youtube_args.items()),
     ]
     
     # Add cookie support - prioritize file-based cookies
@@ -138,7 +319,7 @@ def get_ytdlp_base_options(url, cookie_file=None):
             file_cookie_file = cookie_manager.save_cookies(file_cookies, 'file_session')
             if file_cookie_file:
                 base_options.extend(['--cookies', file_cookie_file])
-                return base_options, temp_cache_dir, file_cookie_file
+                return base_options, file_cookie_file
         else:
             print("⚠️ No default cookies available - requests may fail due to bot detection")
     
@@ -146,7 +327,118 @@ def get_ytdlp_base_options(url, cookie_file=None):
     if cookie_file and os.path.exists(cookie_file):
         base_options.extend(['--cookies', cookie_file])
     
-    return base_options, temp_cache_dir, None
+    return base_options, None
+
+def acquire_proxy(cookie_file=None, shared=False):
+    """Lease an outbound proxy for an extraction with the cookies in cookie_file; raises ProxyUnavailable
+    
+    shared is whether they're the server's own cookies rather than a client's.
+    """
+    if PROXIES is None:
+        return NO_PROXY
+    account = None
+    if cookie_file:
+        try:
+            with open(cookie_file, 'r', encoding='utf-8') as f:
+                account = cookie_account(f.read())
+        except OSError:
+            pass
+    return PROXIES.acquire(account, shared)
+
+# yt-dlp's error for a video it found no formats for; live streams have formats only in
+# their manifests, so trimmed extractions without them are retried with them
+NO_FORMATS_ERROR = 'No video formats found'
+
+# Hard cap on how much a single extraction may print before the child is killed
+MAX_EXTRACTOR_OUTPUT_BYTES = int(os.environ.get('DEBUTUBE_MAX_EXTRACTOR_OUTPUT', 16 * 1024 * 1024))
+MAX_EXTRACTOR_STDERR_BYTES = 64 * 1024
+EXTRACTOR_READ_CHUNK = 64 * 1024
+
+class ExtractorOutputTooLarge(Exception):
+    """Raised when yt-dlp prints more than MAX_EXTRACTOR_OUTPUT_BYTES"""
+
+def run_extraction(cmd, timeout=45, max_output_bytes=MAX_EXTRACTOR_OUTPUT_BYTES, label=None, proxy=NO_PROXY):
+    """Run yt-dlp and stream-parse its output into the info dict of the first video
+    
+    Output is read incrementally and each line is decoded as soon as it is complete,
+    so only one line of raw text is held at a time. The child is killed once the first
+    video is complete (playlists print one record per entry), when the deadline passes,
+    or when it prints more than max_output_bytes. Its usage is recorded with label
+    (the video ID) in YTDLP_CHILDREN. proxy is the lease whose proxy the child uses.
+    
+    Returns (video_info or None, returncode, stderr)
+    """
+    process = YTDLP_CHILDREN.popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=proxy.env({**os.environ, 'HOME': '/tmp'})  # Set HOME to /tmp for any home directory writes
+    )
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, 'stdout')
+    selector.register(process.stderr, selectors.EVENT_READ, 'stderr')
+    
+    deadline = time.monotonic() + timeout
+    record_lines = get_record_line_count(EXTRACTION_PROFILE)
+    documents = []
+    pending = bytearray()
+    search_from = 0
+    output_bytes = 0
+    stderr_tail = bytearray()
+    timed_out = False
+    
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fileobj.fileno(), EXTRACTOR_READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                
+                if key.data == 'stderr':
+                    stderr_tail += chunk
+                    del stderr_tail[:-MAX_EXTRACTOR_STDERR_BYTES]
+                    continue
+                
+                output_bytes += len(chunk)
+                if output_bytes > max_output_bytes:
+                    raise ExtractorOutputTooLarge(f'yt-dlp output exceeded {max_output_bytes} bytes')
+                
+                pending += chunk
+                while True:
+                    newline = pending.find(b'\n', search_from)
+                    if newline < 0:
+                        search_from = len(pending)
+                        break
+                    line = bytes(pending[:newline])
+                    del pending[:newline + 1]
+                    search_from = 0
+                    if line.strip():
+                        documents.append(decode_extraction_line(line))
+                    if len(documents) == record_lines:
+                        return assemble_video_info(documents, EXTRACTION_PROFILE), 0, stderr_tail.decode('utf-8', 'replace')
+        
+        # Output ended without a trailing newline
+        if pending.strip():
+            documents.append(decode_extraction_line(bytes(pending)))
+        returncode = process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+        video_info = assemble_video_info(documents, EXTRACTION_PROFILE) if documents and returncode == 0 else None
+        return video_info, returncode, stderr_tail.decode('utf-8', 'replace')
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        raise
+    finally:
+        selector.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        YTDLP_CHILDREN.record('formats', label, process, stderr_tail.decode('utf-8', 'replace'), timed_out)
 
 def validate_cookie_content(cookie_content):
     """Validate if cookie content has essential YouTube authentication tokens"""
@@ -170,13 +462,421 @@ def validate_cookie_content(cookie_content):
     
     return True, f"Found {len(found_essential)} essential cookies: {', '.join(found_essential)}"
 
-def cleanup_temp_dir(temp_dir):
-    """Clean up temporary directory"""
+def get_client_id(flask_request):
+    """Client address for bandwidth sharing
+    
+    Clients can put anything in X-Forwarded-For, so only the address appended by the
+    outermost of our own TRUSTED_PROXY_HOPS proxies is used; without any, the peer address.
+    """
+    if TRUSTED_PROXY_HOPS:
+        hops = [hop.strip() for hop in flask_request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return flask_request.remote_addr or 'unknown'
+
+def get_urls_expiry(urls):
+    """Time until which results containing these URLs may be served, from the earliest URL expiry"""
+    now = time.time()
+    expiries = [expiry for expiry in map(url_expiry, urls) if expiry]
+    if not expiries:
+        return now + FORMATS_CACHE_DEFAULT_TTL
+    return min(min(expiries) - URL_EXPIRY_MARGIN, now + FORMATS_CACHE_MAX_TTL)
+
+def get_formats_expiry(formats):
+    """Time until which a formats result may be served"""
+    return get_urls_expiry(f.url for f in formats)
+
+def get_cached_response(key):
+    """PreparedResponse stored under key in the shared cache, or None"""
+    data = CACHE.get(key)
+    return PreparedResponse.from_bytes(data) if data else None
+
+def cache_response(key, prepared):
+    CACHE.set(key, prepared.to_bytes(), prepared.ttl())
+
+def make_prepared_response(prepared, cache_status, cacheable=False):
+    """Send a PreparedResponse in the best content coding the client accepts
+    
+    Conditional GET and HEAD requests whose If-None-Match names any encoding of the
+    same body get 304 Not Modified; other methods always get the body (RFC 9110
+    13.1.2). With cacheable, clients and shared caches may reuse the response until
+    it expires.
+    """
+    body, encoding = prepared.for_encoding(request.accept_encodings)
+    if request.method in ('GET', 'HEAD') and any(
+            request.if_none_match.contains_weak(etag) for etag in prepared.etags()):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    
+    response.headers['ETag'] = f'"{prepared.etag_for(encoding)}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Cache'] = cache_status
+    if cacheable:
+        response.headers['Cache-Control'] = f'public, max-age={max(int(prepared.ttl()), 0)}'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag, X-Cache')
+    return response
+
+class ExtractionError(Exception):
+    """yt-dlp couldn't extract a video; carries the error body to send to the client"""
+    
+    def __init__(self, error_response):
+        super().__init__(error_response['error'])
+        self.error_response = error_response
+
+def describe_extraction_error(error_msg, custom_cookies):
+    """Turn yt-dlp's error output into an error body with help for the user"""
+    # Provide more helpful error messages
+    if 'not available on this app' in error_msg.lower() or 'watch on the latest version' in error_msg.lower():
+        return {
+            'error': 'This video is not available with the current YouTube client.',
+            'help': 'YouTube may require a newer client version or the video may be restricted.',
+            'solution': 'Try updating yt-dlp with: pip install -U yt-dlp, or the video may require authentication',
+            'technical': 'The error suggests YouTube is blocking the request due to client version. Multiple player clients are being tried automatically.'
+        }
+    elif 'Sign in to confirm' in error_msg or 'bot' in error_msg.lower():
+        if not custom_cookies:
+            return {
+                'error': 'YouTube bot detection triggered. Using file-based cookies but they may be expired.',
+                'help': 'The YouTube cookies in youtube_cookies.txt may need refreshing.',
+                'guide': 'Update youtube_cookies.txt with fresh cookies or provide cookies in the request',
+                'solution': 'File-based cookies are being used but may be expired'
+            }
+        return {
+            'error': 'YouTube bot detection triggered despite cookies. Your cookies may be invalid or expired.',
+            'help': 'Please re-export your cookies following the exact process.',
+            'guide': 'Run: python cookie_helper.py export-guide',
+            'solution': 'Make sure to: 1) Use private/incognito window, 2) Login to YouTube, 3) Navigate to robots.txt, 4) Export cookies, 5) Close private window immediately'
+        }
+    elif 'Private video' in error_msg or 'members-only' in error_msg.lower():
+        return {
+            'error': 'This video requires authentication or special access.',
+            'help': 'Please provide valid YouTube cookies from an account that has access to this content.',
+            'solution': 'Make sure your account has access to this private/members-only content'
+        }
+    elif 'age-restricted' in error_msg.lower():
+        return {
+            'error': 'This video is age-restricted.',
+            'help': 'Please provide valid YouTube cookies from an age-verified account.',
+            'solution': 'Make sure your YouTube account is verified for age-restricted content'
+        }
+    return {
+        'error': f'yt-dlp failed: {error_msg}',
+        'help': 'Check the error message above for specific details.'
+    }
+
+def get_formats_cache_key(video_id, include_manifests=False, include_alternates=False):
+    return f'formats:{video_id}:{int(include_manifests)}{int(include_alternates)}'
+
+def get_listing_cache_key(video_id, include_manifests=False, include_alternates=False):
+    return f'listing:{video_id}:{int(include_manifests)}{int(include_alternates)}'
+
+def extract_video_info(url, cookie_file=None, include_manifests=False):
+    """Run the /api/formats extraction of a video
+    
+    Returns (video_info or None, stderr, whether the server's cookie file was used)
+    """
+    # Run yt-dlp to get video information with Vercel-compatible options
+    extractor_args, output_options = get_extraction_profile(EXTRACTION_PROFILE, include_manifests)
+    base_options, file_cookie_file = get_ytdlp_base_options(url, cookie_file, extractor_args)
+    
+    try:
+        with acquire_proxy(cookie_file or file_cookie_file, shared=not cookie_file) as proxy:
+            cmd = [
+                *YTDLP_COMMAND,
+                *output_options,
+                '--no-download',
+                *base_options,
+                url
+            ]
+            
+            # Stream-parse the output; the timeout is generous for cookie authentication
+            video_info, returncode, stderr = run_extraction(cmd, timeout=45, label=get_video_id(url) or url, proxy=proxy)
+            if video_info is None:
+                proxy.finish(error=stderr or 'no video information')
+            else:
+                proxy.finish(url=next((f.get('url') for f in video_info.get('formats', []) if f.get('url')), None))
+    finally:
+        # Clean up cookie files
+        if file_cookie_file:
+            CookieManager().cleanup_cookie_file(file_cookie_file)
+    return video_info, stderr, bool(file_cookie_file)
+
+def prepare_formats(url, cookie_file=None, include_manifests=False, include_alternates=False):
+    """Extract a video with yt-dlp and build its serialised /api/formats response
+    
+    Results extracted with the server's own cookies (no cookie_file) are stored in
+    the shared CACHE twice: the full response until its URLs expire, and the metadata
+    and format listing without URLs for METADATA_CACHE_TTL. Raises ExtractionError when yt-dlp fails; subprocess.TimeoutExpired,
+    json.JSONDecodeError and ExtractorOutputTooLarge are passed through.
+    """
+    video_info, stderr, using_file_cookies = extract_video_info(url, cookie_file, include_manifests)
+    if video_info is None and not include_manifests and EXTRACTION_PROFILE != 'full' \
+            and NO_FORMATS_ERROR in (stderr or ''):
+        # Live streams only have formats in their HLS/DASH manifests, which the trimmed
+        # profile skips; ask again with them
+        print(f"🔄 No formats without manifests for {url}, extracting again with them (live stream?)")
+        video_info, stderr, using_file_cookies = extract_video_info(url, cookie_file, include_manifests=True)
+    
+    if video_info is None:
+        error_msg = stderr or 'yt-dlp returned no video information'
+        if not cookie_file and ('Sign in to confirm' in error_msg or 'bot' in error_msg.lower()):
+            EXTRACTION_BREAKER.record_failure()
+        raise ExtractionError(describe_extraction_error(error_msg, bool(cookie_file)))
+    if not cookie_file:
+        EXTRACTION_BREAKER.record_success()
+    
+    formats = video_info.get('formats', [])
+    
+    # Classify downloadable formats, collapse cross-client duplicates and sort
+    # them for the frontend in one pass
+    filtered_formats, video_formats, audio_formats = classify_formats(
+        formats, keep_alternates=include_alternates)
+    
+    # Extract video metadata
+    video_metadata = {
+        'title': video_info.get('title', 'Unknown Title'),
+        'description': video_info.get('description', ''),
+        'duration': video_info.get('duration', 0),
+        'uploader': video_info.get('uploader') or video_info.get('channel', 'Unknown'),
+        'upload_date': video_info.get('upload_date', ''),
+        'view_count': video_info.get('view_count', 0),
+        'like_count': video_info.get('like_count', 0),
+        'thumbnail': video_info.get('thumbnail', ''),
+        'channel': video_info.get('channel') or video_info.get('uploader', 'Unknown'),
+        'channel_id': video_info.get('channel_id') or video_info.get('uploader_id', ''),
+        'webpage_url': video_info.get('webpage_url', url),
+        'id': video_info.get('id', ''),
+        'fulltitle': video_info.get('fulltitle') or video_info.get('title', 'Unknown Title'),
+        'age_limit': video_info.get('age_limit', 0),
+        'is_live': video_info.get('is_live', False),
+        'availability': video_info.get('availability', 'public')
+    }
+    
+    response_fields = {
+        'videoInfo': video_metadata,
+        'using_file_cookies': using_file_cookies,  # Debug info
+        'using_custom_cookies': bool(cookie_file)  # Debug info
+    }
+    # Formats listed in several orderings are serialised only once
+    body = encode_formats_response(response_fields, filtered_formats, video_formats, audio_formats)
+    
+    # Serialise and compress once; cache hits reuse the bytes as they are. A response
+    # that isn't cached (custom cookies) is only compressed for the client it's sent to
+    video_id = get_video_id(url)
+    cached = bool(video_id) and not cookie_file
+    prepared = PreparedResponse(body, get_formats_expiry(filtered_formats), lazy=not cached)
+    if cached:
+        cache_response(get_formats_cache_key(video_id, include_manifests, include_alternates), prepared)
+        
+        # Long-lived copy without the signed URLs; downloads go through /api/direct-url
+        listing_body = encode_formats_response(
+            {**response_fields, 'urlsRefreshing': True},
+            filtered_formats, video_formats, audio_formats, include_urls=False)
+        cache_response(
+            get_listing_cache_key(video_id, include_manifests, include_alternates),
+            PreparedResponse(listing_body, time.time() + METADATA_CACHE_TTL))
+        
+        if PREFETCH_DIRECT_URLS:
+            prefetch_direct_urls(url, video_id, get_prefetch_picks(video_formats, audio_formats), using_file_cookies)
+    return prepared
+
+def get_prefetch_picks(video_formats, audio_formats):
+    """Formats the UI is most likely to download next: the best video-only, audio-only and combined
+    
+    The UI only lists formats with a known file size, so those are preferred.
+    """
+    picks = []
+    for records, format_type in ((video_formats, 'video'), (audio_formats, 'audio'), (video_formats, 'combined')):
+        candidates = [record for record in records if record.type == format_type]
+        pick = next((record for record in candidates if record.filesize), None) or next(iter(candidates), None)
+        if pick is not None:
+            picks.append(pick)
+    return picks
+
+def prefetch_direct_urls(url, video_id, picks, using_file_cookies):
+    """Cache direct URLs for picked formats, from their extracted URLs when they have one"""
+    for record in picks:
+        if record.url:
+            cache_direct_url(get_direct_url_cache_key(video_id, record.format_id), record.url, using_file_cookies)
+        elif not EXTRACTION_BREAKER.is_open() and PREFETCH_BUDGET.try_acquire():
+            threading.Thread(target=prefetch_direct_url, args=(url, record.format_id), daemon=True).start()
+
+def prefetch_direct_url(url, format_id):
     try:
-        import shutil
-        shutil.rmtree(temp_dir, ignore_errors=True)
-    except:
-        pass
+        resolve_direct_url(url, format_id)
+    except Exception as e:
+        print(f"⚠️ Prefetching direct URL for format {format_id} failed: {e}")
+
+def refresh_formats(url, cache_key, include_manifests=False, include_alternates=False):
+    try:
+        prepare_formats(url, None, include_manifests, include_alternates)
+        print(f"🔄 Refreshed {cache_key} in the background")
+    except Exception as e:
+        print(f"⚠️ Background refresh of {cache_key} failed: {e}")
+    finally:
+        with BACKGROUND_REFRESH_LOCK:
+            BACKGROUND_REFRESHES.discard(cache_key)
+
+def refresh_formats_in_background(url, include_manifests=False, include_alternates=False):
+    """Re-extract a video's formats in a background thread
+    
+    At most one refresh per video and flags runs at a time, and at most
+    MAX_BACKGROUND_REFRESHES overall; a refresh that can't start now is simply
+    retried by the next request that needs it.
+    """
+    if EXTRACTION_BREAKER.is_open():
+        return
+    cache_key = get_formats_cache_key(get_video_id(url), include_manifests, include_alternates)
+    with BACKGROUND_REFRESH_LOCK:
+        if cache_key in BACKGROUND_REFRESHES or len(BACKGROUND_REFRESHES) >= MAX_BACKGROUND_REFRESHES:
+            return
+        BACKGROUND_REFRESHES.add(cache_key)
+    threading.Thread(
+        target=refresh_formats,
+        args=(url, cache_key, include_manifests, include_alternates),
+        daemon=True
+    ).start()
+
+def get_hot_video_expiry(key):
+    """When the cached formats of a hot (video_id, include_manifests, include_alternates) stop being served"""
+    prepared = get_cached_response(get_formats_cache_key(*key))
+    return prepared.expires_at if prepared is not None else None
+
+def refresh_hot_video(key):
+    video_id, include_manifests, include_alternates = key
+    refresh_formats_in_background(f'https://www.youtube.com/watch?v={video_id}', include_manifests, include_alternates)
+
+REFRESH_SCHEDULER = RefreshScheduler(
+    HOT_VIDEOS, get_hot_video_expiry, refresh_hot_video,
+    RefreshBudget(REFRESH_BUDGET_PER_MINUTE), EXTRACTION_BREAKER,
+    hot_count=HOT_VIDEO_COUNT,
+    # Runs ahead of the request-triggered refresh in serve_formats
+    lead=FORMATS_REFRESH_AHEAD + 300
+)
+
+def warm_up_ytdlp():
+    """Start yt-dlp once, so its modules are compiled and in the page cache"""
+    result = YTDLP_CHILDREN.run('version', None, [*YTDLP_COMMAND, '--version'], timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:] or f'yt-dlp exited with code {result.returncode}')
+    return result.stdout.strip()
+
+def warm_up_cookies():
+    cookie_content = load_youtube_cookies()
+    if not cookie_content:
+        raise RuntimeError('No server cookies found')
+    cookies = [
+        line for line in cookie_content.splitlines()
+        if line.strip() and (not line.startswith('#') or line.startswith('#HttpOnly_'))
+    ]
+    return f'{len(cookies)} cookies'
+
+def warm_up_connections():
+    """Build the upstream TLS context and connect to the cache backend"""
+    media_proxy.POOL.ssl_context
+    CACHE.get('warmup')
+
+def warm_up_player():
+    """Extract one video, which caches the player JS and its signature solutions in YTDLP_CACHE_DIR"""
+    video_id = WARMUP_VIDEO_IDS[0] if WARMUP_VIDEO_IDS else WARMUP_PROBE_VIDEO
+    prepare_formats(f'https://www.youtube.com/watch?v={video_id}')
+    if WARMUP_VIDEO_IDS:
+        HOT_VIDEOS.record((video_id, False, False))
+    return video_id
+
+def warm_up_hot_videos():
+    """Pre-extract the remaining hot videos into the cache, skipping ones already there"""
+    extracted, cached, failed = 0, 0, []
+    for video_id in WARMUP_VIDEO_IDS[1:]:
+        # Tracked as hot, so the refresh scheduler keeps them warm from here on
+        HOT_VIDEOS.record((video_id, False, False))
+        if get_cached_response(get_formats_cache_key(video_id)) is not None:
+            cached += 1
+            continue
+        if EXTRACTION_BREAKER.is_open():
+            failed.append(video_id)
+            continue
+        try:
+            prepare_formats(f'https://www.youtube.com/watch?v={video_id}')
+            extracted += 1
+        except Exception as e:
+            print(f"⚠️ Pre-extracting {video_id} failed: {e}")
+            failed.append(video_id)
+    if REFRESH_BUDGET_PER_MINUTE > 0:
+        REFRESH_SCHEDULER.ensure_started()
+    if failed and not extracted and not cached:
+        raise RuntimeError(f'No hot video could be extracted ({len(failed)} tried)')
+    return {'extracted': extracted, 'cached': cached, 'failed': failed}
+
+WARM_UP = WarmUp([
+    ('ytdlp', warm_up_ytdlp),
+    ('cookies', warm_up_cookies),
+    ('connections', warm_up_connections),
+    *([('player', warm_up_player)] if WARMUP_VIDEO_IDS or WARMUP_PROBE_VIDEO else []),
+    *([('hot_videos', warm_up_hot_videos)] if len(WARMUP_VIDEO_IDS) > 1 else []),
+], required=WARMUP_AT_BOOT)
+WARM_UP.ensure_started()
+
+def serve_formats(url, cookie_file=None, include_manifests=False, include_alternates=False, cacheable=False):
+    """Respond with the formats of a video, from cache when possible"""
+    # Results extracted with the server's own cookies are shared between clients
+    video_id = get_video_id(url)
+    if video_id and not cookie_file:
+        HOT_VIDEOS.record((video_id, include_manifests, include_alternates))
+        if REFRESH_BUDGET_PER_MINUTE > 0:
+            REFRESH_SCHEDULER.ensure_started()
+        
+        prepared = get_cached_response(get_formats_cache_key(video_id, include_manifests, include_alternates))
+        if prepared is not None:
+            if prepared.ttl() < FORMATS_REFRESH_AHEAD:
+                refresh_formats_in_background(url, include_manifests, include_alternates)
+            return make_prepared_response(prepared, 'HIT', cacheable)
+        
+        # URLs expired but the video was seen recently: answer with its metadata and
+        # format listing now and extract fresh URLs in the background
+        listing = get_cached_response(get_listing_cache_key(video_id, include_manifests, include_alternates))
+        if listing is not None:
+            refresh_formats_in_background(url, include_manifests, include_alternates)
+            return make_prepared_response(listing, 'STALE')
+    
+    try:
+        prepared = prepare_formats(url, cookie_file, include_manifests, include_alternates)
+        return make_prepared_response(prepared, 'MISS', cacheable)
+    except ExtractionError as e:
+        response = jsonify(e.error_response)
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except subprocess.TimeoutExpired:
+        response = jsonify({'error': 'Request timeout - video processing took too long'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except ProxyUnavailable as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except json.JSONDecodeError:
+        response = jsonify({'error': 'Failed to parse video information'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except ExtractorOutputTooLarge:
+        response = jsonify({'error': 'Video information is too large to process'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': f'Processing error: {str(e)}'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
 
 @app.route('/api/formats', methods=['POST', 'OPTIONS'])
 def get_formats():
@@ -186,11 +886,11 @@ def get_formats():
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
         return response
     
     cookie_manager = CookieManager()
     cookie_file = None
-    file_cookie_file = None
     
     try:
         # Clean up old sessions
@@ -235,205 +935,121 @@ def get_formats():
                 response.headers.add('Access-Control-Allow-Origin', '*')
                 return response
         
-        # Run yt-dlp to get video information with Vercel-compatible options
-        try:
-            base_options, temp_cache_dir, file_cookie_file = get_ytdlp_base_options(url, cookie_file)
+        return serve_formats(
+            url, cookie_file,
+            # HLS/DASH manifest formats are skipped unless the caller needs them
+            include_manifests=bool(data.get('includeManifests')),
+            # Other player clients' copies of each format are dropped unless asked for
+            include_alternates=bool(data.get('includeAlternates')),
+        )
             
+    except Exception as e:
+        response = jsonify({'error': f'Server error: {str(e)}'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    finally:
+        # Always cleanup cookie files
+        if cookie_file:
+            cookie_manager.cleanup_cookie_file(cookie_file)
+
+@app.route('/api/formats/<video_id>', methods=['GET', 'OPTIONS'])
+def get_formats_by_id(video_id):
+    """Cacheable GET form of /api/formats, keyed by YouTube video ID
+    
+    Responses carry a strong ETag and a Cache-Control max-age that ends before the
+    format URLs expire; If-None-Match is answered with 304 Not Modified.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        response = jsonify({'error': 'Please provide a valid YouTube video ID'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    try:
+        return serve_formats(
+            f'https://www.youtube.com/watch?v={video_id}',
+            include_manifests=request.args.get('includeManifests') in ('1', 'true'),
+            include_alternates=request.args.get('includeAlternates') in ('1', 'true'),
+            cacheable=True,
+        )
+    except Exception as e:
+        response = jsonify({'error': f'Server error: {str(e)}'})
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+def get_direct_url_cache_key(video_id, format_id):
+    return f'direct:{video_id}:{format_id}'
+
+def cache_direct_url(cache_key, direct_url, using_file_cookies):
+    """Store a direct URL until shortly before it expires"""
+    entry = {'directUrl': direct_url, 'using_file_cookies': using_file_cookies}
+    CACHE.set(cache_key, json.dumps(entry).encode('utf-8'), get_urls_expiry(direct_url.splitlines()) - time.time())
+
+def resolve_direct_url(url, format_id, cookie_file=None):
+    """Get the direct download URL(s) of one format, from the shared cache when possible
+    
+    Returns (direct_url, using_file_cookies, cache_status). Raises ExtractionError when
+    yt-dlp fails; subprocess.TimeoutExpired is passed through.
+    """
+    # URLs resolved with the server's own cookies are shared between clients
+    video_id = get_video_id(url)
+    cache_key = get_direct_url_cache_key(video_id, format_id) if video_id and not cookie_file else None
+    if cache_key:
+        cached = CACHE.get(cache_key)
+        if cached:
+            entry = json.loads(cached)
+            return entry['directUrl'], entry['using_file_cookies'], 'HIT'
+    
+    # Run yt-dlp to get direct URL with Vercel-compatible options
+    base_options, file_cookie_file = get_ytdlp_base_options(url, cookie_file)
+    
+    try:
+        with acquire_proxy(cookie_file or file_cookie_file, shared=not cookie_file) as proxy:
             cmd = [
-                sys.executable, '-m', 'yt_dlp',
-                '--dump-json',
-                '--no-download',
+                *YTDLP_COMMAND,
+                '-g',  # Get URL only
+                '-f', format_id,
                 *base_options,
                 url
             ]
             
-            result = subprocess.run(
+            result = YTDLP_CHILDREN.run(
+                'direct_url',
+                get_video_id(url) or url,
                 cmd,
-                capture_output=True,
-                text=True,
                 timeout=45,  # Increased timeout for cookie authentication
-                env={**os.environ, 'HOME': '/tmp'}  # Set HOME to /tmp for any home directory writes
+                env=proxy.env({**os.environ, 'HOME': '/tmp'})  # Set HOME to /tmp for any home directory writes
             )
-            
-            # Clean up temp directory and cookie files
-            cleanup_temp_dir(temp_cache_dir)
-            if cookie_file:
-                cookie_manager.cleanup_cookie_file(cookie_file)
-            if file_cookie_file:
-                cookie_manager.cleanup_cookie_file(file_cookie_file)
-            
             if result.returncode != 0:
-                error_msg = result.stderr
-                # Provide more helpful error messages
-                if 'not available on this app' in error_msg.lower() or 'watch on the latest version' in error_msg.lower():
-                    error_response = {
-                        'error': 'This video is not available with the current YouTube client.',
-                        'help': 'YouTube may require a newer client version or the video may be restricted.',
-                        'solution': 'Try updating yt-dlp with: pip install -U yt-dlp, or the video may require authentication',
-                        'technical': 'The error suggests YouTube is blocking the request due to client version. Multiple player clients are being tried automatically.'
-                    }
-                elif 'Sign in to confirm' in error_msg or 'bot' in error_msg.lower():
-                    if not cookies:
-                        error_response = {
-                            'error': 'YouTube bot detection triggered. Using file-based cookies but they may be expired.',
-                            'help': 'The YouTube cookies in youtube_cookies.txt may need refreshing.',
-                            'guide': 'Update youtube_cookies.txt with fresh cookies or provide cookies in the request',
-                            'solution': 'File-based cookies are being used but may be expired'
-                        }
-                    else:
-                        error_response = {
-                            'error': 'YouTube bot detection triggered despite cookies. Your cookies may be invalid or expired.',
-                            'help': 'Please re-export your cookies following the exact process.',
-                            'guide': 'Run: python cookie_helper.py export-guide',
-                            'solution': 'Make sure to: 1) Use private/incognito window, 2) Login to YouTube, 3) Navigate to robots.txt, 4) Export cookies, 5) Close private window immediately'
-                        }
-                elif 'Private video' in error_msg or 'members-only' in error_msg.lower():
-                    error_response = {
-                        'error': 'This video requires authentication or special access.',
-                        'help': 'Please provide valid YouTube cookies from an account that has access to this content.',
-                        'solution': 'Make sure your account has access to this private/members-only content'
-                    }
-                elif 'age-restricted' in error_msg.lower():
-                    error_response = {
-                        'error': 'This video is age-restricted.',
-                        'help': 'Please provide valid YouTube cookies from an age-verified account.',
-                        'solution': 'Make sure your YouTube account is verified for age-restricted content'
-                    }
-                else:
-                    error_response = {
-                        'error': f'yt-dlp failed: {error_msg}',
-                        'help': 'Check the error message above for specific details.'
-                    }
-                
-                response = jsonify(error_response)
-                response.status_code = 500
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response
-            
-            # Parse the JSON output
-            video_info = json.loads(result.stdout.strip())
-            formats = video_info.get('formats', [])
-            
-            # Filter and process formats - include URL for direct downloads
-            filtered_formats = []
-            for format_data in formats:
-                # Include formats that have a URL (downloadable) or format_id
-                if format_data.get('url') or format_data.get('format_id'):
-                    format_obj = {
-                        'format_id': format_data.get('format_id'),
-                        'ext': format_data.get('ext'),
-                        'resolution': format_data.get('resolution'),
-                        'format_note': format_data.get('format_note'),
-                        'filesize': format_data.get('filesize'),
-                        'filesize_approx': format_data.get('filesize_approx'),
-                        'vcodec': format_data.get('vcodec'),
-                        'acodec': format_data.get('acodec'),
-                        'fps': format_data.get('fps'),
-                        'quality': format_data.get('quality'),
-                        'width': format_data.get('width'),
-                        'height': format_data.get('height'),
-                        'tbr': format_data.get('tbr'),
-                        'abr': format_data.get('abr'),
-                        'vbr': format_data.get('vbr'),
-                        'protocol': format_data.get('protocol'),
-                        'format': format_data.get('format'),
-                    }
-                    
-                    # Include URL if available (for direct download links)
-                    if format_data.get('url'):
-                        format_obj['url'] = format_data.get('url')
-                    
-                    # Determine if it's video-only, audio-only, or combined
-                    has_video = format_data.get('vcodec') and format_data.get('vcodec') != 'none'
-                    has_audio = format_data.get('acodec') and format_data.get('acodec') != 'none'
-                    
-                    if has_video and not has_audio:
-                        format_obj['type'] = 'video'
-                    elif has_audio and not has_video:
-                        format_obj['type'] = 'audio'
-                    else:
-                        format_obj['type'] = 'combined'
-                    
-                    filtered_formats.append(format_obj)
-            
-            # Sort by quality (higher is better)
-            filtered_formats.sort(key=lambda x: x.get('quality', 0) or 0, reverse=True)
-            
-            # Separate formats by type for easier frontend handling
-            video_formats = [f for f in filtered_formats if f.get('type') in ['video', 'combined']]
-            audio_formats = [f for f in filtered_formats if f.get('type') in ['audio', 'combined']]
-            
-            # Sort video formats by resolution/quality
-            video_formats.sort(key=lambda x: (
-                x.get('height', 0) or 0,
-                x.get('width', 0) or 0,
-                x.get('quality', 0) or 0
-            ), reverse=True)
-            
-            # Sort audio formats by bitrate/quality
-            audio_formats.sort(key=lambda x: (
-                x.get('abr', 0) or 0,
-                x.get('quality', 0) or 0
-            ), reverse=True)
-            
-            # Extract video metadata
-            video_metadata = {
-                'title': video_info.get('title', 'Unknown Title'),
-                'description': video_info.get('description', ''),
-                'duration': video_info.get('duration', 0),
-                'uploader': video_info.get('uploader') or video_info.get('channel', 'Unknown'),
-                'upload_date': video_info.get('upload_date', ''),
-                'view_count': video_info.get('view_count', 0),
-                'like_count': video_info.get('like_count', 0),
-                'thumbnail': video_info.get('thumbnail', ''),
-                'channel': video_info.get('channel') or video_info.get('uploader', 'Unknown'),
-                'channel_id': video_info.get('channel_id') or video_info.get('uploader_id', ''),
-                'webpage_url': video_info.get('webpage_url', url),
-                'id': video_info.get('id', ''),
-                'fulltitle': video_info.get('fulltitle') or video_info.get('title', 'Unknown Title'),
-                'age_limit': video_info.get('age_limit', 0),
-                'is_live': video_info.get('is_live', False),
-                'availability': video_info.get('availability', 'public')
-            }
-            
-            response = jsonify({
-                'videoInfo': video_metadata,
-                'formats': filtered_formats,  # All formats
-                'videoFormats': video_formats,  # Video-only and combined formats
-                'audioFormats': audio_formats,  # Audio-only and combined formats
-                'using_file_cookies': bool(file_cookie_file),  # Debug info
-                'using_custom_cookies': bool(cookies)  # Debug info
-            })
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response
-            
-        except subprocess.TimeoutExpired:
-            response = jsonify({'error': 'Request timeout - video processing took too long'})
-            response.status_code = 500
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response
-        except json.JSONDecodeError:
-            response = jsonify({'error': 'Failed to parse video information'})
-            response.status_code = 500
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response
-        except Exception as e:
-            response = jsonify({'error': f'Processing error: {str(e)}'})
-            response.status_code = 500
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response
-            
-    except Exception as e:
-        response = jsonify({'error': f'Server error: {str(e)}'})
-        response.status_code = 500
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
+                proxy.finish(error=result.stderr)
+            else:
+                proxy.finish(url=result.stdout.strip().split('\n', 1)[0])
     finally:
-        # Always cleanup cookie files
-        if cookie_file:
-            cookie_manager.cleanup_cookie_file(cookie_file)
+        # Clean up cookie files
         if file_cookie_file:
-            cookie_manager.cleanup_cookie_file(file_cookie_file)
+            CookieManager().cleanup_cookie_file(file_cookie_file)
+    
+    if result.returncode != 0:
+        raise ExtractionError({'error': f'Failed to get direct URL: {result.stderr}'})
+    
+    direct_url = result.stdout.strip()
+    
+    if not direct_url:
+        raise ExtractionError({'error': 'No direct URL found'})
+    
+    if cache_key:
+        cache_direct_url(cache_key, direct_url, bool(file_cookie_file))
+    return direct_url, bool(file_cookie_file), 'MISS'
 
 @app.route('/api/direct-url', methods=['POST', 'OPTIONS'])
 def get_direct_url():
@@ -443,11 +1059,11 @@ def get_direct_url():
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
         return response
     
     cookie_manager = CookieManager()
     cookie_file = None
-    file_cookie_file = None
     
     try:
         data = request.get_json()
@@ -465,60 +1081,34 @@ def get_direct_url():
         if cookies:
             cookie_file = cookie_manager.save_cookies(cookies)
         
-        # Run yt-dlp to get direct URL with Vercel-compatible options
         try:
-            base_options, temp_cache_dir, file_cookie_file = get_ytdlp_base_options(url, cookie_file)
-            
-            cmd = [
-                sys.executable, '-m', 'yt_dlp',
-                '-g',  # Get URL only
-                '-f', format_id,
-                *base_options,
-                url
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=45,  # Increased timeout for cookie authentication
-                env={**os.environ, 'HOME': '/tmp'}  # Set HOME to /tmp for any home directory writes
-            )
-            
-            # Clean up temp directory and cookie files
-            cleanup_temp_dir(temp_cache_dir)
-            if cookie_file:
-                cookie_manager.cleanup_cookie_file(cookie_file)
-            if file_cookie_file:
-                cookie_manager.cleanup_cookie_file(file_cookie_file)
-            
-            if result.returncode != 0:
-                response = jsonify({'error': f'Failed to get direct URL: {result.stderr}'})
-                response.status_code = 500
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response
-            
-            direct_url = result.stdout.strip()
-            
-            if not direct_url:
-                response = jsonify({'error': 'No direct URL found'})
-                response.status_code = 500
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response
+            direct_url, using_file_cookies, cache_status = resolve_direct_url(url, format_id, cookie_file)
             
             response = jsonify({
                 'directUrl': direct_url,
-                'using_file_cookies': bool(file_cookie_file),  # Debug info
+                'using_file_cookies': using_file_cookies,  # Debug info
                 'using_custom_cookies': bool(cookies)  # Debug info
             })
+            response.headers['X-Cache'] = cache_status
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response
             
+        except ExtractionError as e:
+            response = jsonify(e.error_response)
+            response.status_code = 500
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
         except subprocess.TimeoutExpired:
             response = jsonify({'error': 'Request timeout'})
             response.status_code = 500
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response
+        except ProxyUnavailable as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
         except Exception as e:
             response = jsonify({'error': f'Processing error: {str(e)}'})
             response.status_code = 500
@@ -534,8 +1124,533 @@ def get_direct_url():
         # Always cleanup cookie files
         if cookie_file:
             cookie_manager.cleanup_cookie_file(cookie_file)
+
+@app.route('/api/download', methods=['GET', 'OPTIONS'])
+def download():
+    """Stream a format from googlevideo to the client
+    
+    Takes either the direct URL from /api/direct-url (url=) or a videoId and formatId
+    to resolve one, plus an optional filename. Range and If-Range are passed through,
+    so interrupted downloads can be resumed.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Range, If-Range')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    url = request.args.get('url')
+    video_id = request.args.get('videoId')
+    format_id = request.args.get('formatId')
+    client_range = request.headers.get('Range')
+    
+    if (video_id is not None and not VIDEO_ID_RE.fullmatch(video_id)) or \
+            (format_id is not None and not FORMAT_ID_RE.fullmatch(format_id)):
+        response = jsonify({'error': 'Invalid video or format ID'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    # Only a URL resolved here is known to be for videoId; a client's url= is keyed by its own id=
+    resolved_video_id = None
+    
+    try:
+        if not url and video_id and format_id:
+            url = resolve_direct_url(f'https://www.youtube.com/watch?v={video_id}', format_id)[0]
+            resolved_video_id = video_id
+        
+        if not url:
+            response = jsonify({'error': 'url, or videoId and formatId, are required'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+        
+        # Formats that need merging resolve to several URLs; only single streams can be proxied
+        if '\n' in url.strip() or not media_proxy.is_allowed_media_url(url):
+            response = jsonify({'error': 'Only single googlevideo URLs can be downloaded'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+        
+        cached = None
+        media_key = media_cache.get_media_key(url, resolved_video_id)
+        if MEDIA_CACHE and media_key:
+            cached = MEDIA_CACHE.open_download(url, media_key, client_range, request.headers.get('If-Range'))
+        
+        if cached:
+            status, headers, body = cached
+        else:
+            # Segmented mode fetches byte ranges over several connections at once
+            segmented = request.args.get('segmented', '1' if SEGMENTED_DOWNLOADS else '0') not in ('0', 'false')
+            status, headers, body = media_proxy.open_download(
+                url, client_range, request.headers.get('If-Range'), segmented)
+    except ExtractionError as e:
+        response = jsonify(e.error_response)
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': f'Failed to fetch video: {str(e)}'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    if status not in (200, 206, 416):
+        body.close()
+        response = jsonify({'error': f'Failed to fetch video: upstream returned {status}'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    if BANDWIDTH:
+        body = BANDWIDTH.throttle(get_client_id(request), body, media_proxy.DOWNLOAD_CHUNK_SIZE)
+    elif isinstance(body, media_cache.SegmentFile):
+        # Lets the server use sendfile for cached bytes
+        body = wrap_file(request.environ, body, media_proxy.DOWNLOAD_CHUNK_SIZE)
+    
+    response = app.response_class(
+        body,
+        status=status,
+        headers=headers,
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = media_proxy.content_disposition(request.args.get('filename'))
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges, ETag, X-Cache')
+    return response
+
+@app.route('/api/mux', methods=['GET', 'OPTIONS'])
+def mux():
+    """Stream a video format and an audio format remuxed into one file
+
+    Takes a videoId with videoFormatId and audioFormatId (or the direct videoUrl and
+    audioUrl), plus an optional container (mp4 or webm) and filename. Both streams
+    are copied, not re-encoded, by a local ffmpeg, and the output is streamed as
+    ffmpeg writes it, so there is no Content-Length and no Range support. Formats
+    whose codecs the container can't hold are refused with 400 before anything is sent.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+
+    if not muxer.is_available():
+        response = jsonify({'error': 'Muxing is not available on this server (ffmpeg not found)'})
+        response.status_code = 501
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    container = request.args.get('container', 'mp4')
+    if container not in muxer.CONTAINERS:
+        response = jsonify({'error': f'container must be one of: {", ".join(muxer.CONTAINERS)}'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    urls = [request.args.get('videoUrl'), request.args.get('audioUrl')]
+    video_id = request.args.get('videoId')
+    format_ids = [request.args.get('videoFormatId'), request.args.get('audioFormatId')]
+    bodies = []
+
+    try:
+        if not all(urls) and video_id and all(format_ids) and VIDEO_ID_RE.fullmatch(video_id):
+            watch_url = f'https://www.youtube.com/watch?v={video_id}'
+            urls = [resolve_direct_url(watch_url, format_id)[0] for format_id in format_ids]
+
+        if not all(urls):
+            response = jsonify({'error': 'videoUrl and audioUrl, or videoId, videoFormatId and audioFormatId, are required'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+
+        if any('\n' in url.strip() or not media_proxy.is_allowed_media_url(url) for url in urls):
+            response = jsonify({'error': 'Only single googlevideo URLs can be muxed'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+
+        # ffmpeg would only fail once the 200 has been sent
+        error = muxer.codec_error(container, muxer.url_codec(urls[0]), muxer.url_codec(urls[1]))
+        if error:
+            response = jsonify({'error': error})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+
+        segmented = request.args.get('segmented', '1' if SEGMENTED_DOWNLOADS else '0') not in ('0', 'false')
+        for url in urls:
+            status, _, body = media_proxy.open_download(url, segmented=segmented)
+            bodies.append(body)
+            if status != 200:
+                raise OSError(f'upstream returned {status}')
+
+        stream = muxer.MuxStream(bodies[0], bodies[1], container)
+    except ExtractionError as e:
+        for body in bodies:
+            body.close()
+        response = jsonify(e.error_response)
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        for body in bodies:
+            body.close()
+        response = jsonify({'error': f'Failed to fetch video: {str(e)}'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    filename = request.args.get('filename') or f'{video_id or "video"}.{container}'
+    # Passed as is so the server's close() on disconnect stops ffmpeg
+    body = BANDWIDTH.throttle(get_client_id(request), stream, muxer.OUTPUT_CHUNK_SIZE) if BANDWIDTH else stream
+    response = app.response_class(
+        body,
+        status=200,
+        mimetype=stream.content_type,
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = media_proxy.content_disposition(filename)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+def open_archive_item(video_id, format_id):
+    """(entry name, size or None, body) of one /api/archive item"""
+    url = resolve_direct_url(f'https://www.youtube.com/watch?v={video_id}', format_id)[0]
+    if '\n' in url.strip() or not media_proxy.is_allowed_media_url(url):
+        raise ValueError(f'{video_id} format {format_id} needs merging and can\'t be archived')
+    
+    status, headers, body = media_proxy.open_download(url, segmented=SEGMENTED_DOWNLOADS)
+    if status != 200:
+        body.close()
+        raise ValueError(f'{video_id} format {format_id}: upstream returned {status}')
+    mime = (parse_qs(urlparse(url).query).get('mime') or [''])[0]
+    name = f'{video_id}-{format_id}.{MIME_EXTENSIONS.get(mime, "bin")}'
+    size = int(headers['Content-Length']) if headers.get('Content-Length', '').isdigit() else None
+    return name, size, body
+
+@app.route('/api/archive', methods=['GET', 'OPTIONS'])
+def archive():
+    """Stream a ZIP of several formats, e.g. the audio of every video in a list
+    
+    items is a comma-separated list of videoId:formatId pairs; entries are resolved
+    like /api/direct-url and stored uncompressed as they arrive from upstream.
+    Items that fail are listed in errors.txt inside the archive, since the response
+    has already started by then.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    items = [item.strip().split(':', 1) for item in request.args.get('items', '').split(',') if item.strip()]
+    if not items or len(items) > MAX_ARCHIVE_ITEMS or any(
+            len(item) != 2 or not VIDEO_ID_RE.fullmatch(item[0]) or not FORMAT_ID_RE.fullmatch(item[1]) for item in items):
+        response = jsonify({'error': f'items must be 1 to {MAX_ARCHIVE_ITEMS} comma-separated videoId:formatId pairs'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    openers = [lambda video_id=video_id, format_id=format_id: open_archive_item(video_id, format_id)
+               for video_id, format_id in items]
+    # A generator, so the server's close() on disconnect stops the read-ahead
+    body = iter(ZipStream(openers))
+    if BANDWIDTH:
+        body = BANDWIDTH.throttle(get_client_id(request), body, media_proxy.DOWNLOAD_CHUNK_SIZE)
+    response = app.response_class(body, status=200, mimetype='application/zip')
+    response.headers['Content-Disposition'] = media_proxy.content_disposition(request.args.get('filename') or 'debutube.zip')
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+def get_live_stream(video_id, format_id):
+    """This process's LiveStream for a live format, opened if it hasn't got one"""
+    def get_playlist_url():
+        playlist_url = resolve_direct_url(f'https://www.youtube.com/watch?v={video_id}', format_id)[0]
+        if '\n' in playlist_url.strip() or not media_proxy.is_allowed_media_url(playlist_url):
+            raise live_proxy.LiveError('This format has no single HLS playlist')
+        return playlist_url
+    
+    return LIVE_PROXY.get_stream(f'{video_id}/{format_id}', get_playlist_url, f'/api/live/{video_id}/{format_id}')
+
+@app.route('/api/live/<video_id>/<format_id>.m3u8', methods=['GET', 'OPTIONS'])
+def live_playlist(video_id, format_id):
+    """HLS playlist of a live format, with segments served from this node's ring buffer
+    
+    Point an HLS player at this instead of the format's googlevideo manifest URL.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    if not VIDEO_ID_RE.fullmatch(video_id) or not FORMAT_ID_RE.fullmatch(format_id):
+        response = jsonify({'error': 'Invalid video or format ID'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    stream = get_live_stream(video_id, format_id)
+    try:
+        playlist = stream.playlist()
+    except ExtractionError as e:
+        response = jsonify(e.error_response)
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except live_proxy.LiveError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': f'Failed to fetch live playlist: {str(e)}'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    response = app.response_class(playlist, mimetype='application/vnd.apple.mpegurl')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+@app.route('/api/live/<video_id>/<format_id>/<int:sequence>', methods=['GET'])
+def live_segment(video_id, format_id, sequence):
+    """A live segment from the ring buffer filled by live_playlist
+    
+    The playlist may have been served by another worker process, so the stream is
+    opened here when this one hasn't got it.
+    """
+    if not VIDEO_ID_RE.fullmatch(video_id) or not FORMAT_ID_RE.fullmatch(format_id):
+        response = jsonify({'error': 'Invalid video or format ID'})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    try:
+        segment = get_live_stream(video_id, format_id).get_segment(sequence)
+    except ExtractionError as e:
+        response = jsonify(e.error_response)
+        response.status_code = 500
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': f'Failed to fetch live segment: {str(e)}'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    if segment is None:
+        response = jsonify({'error': 'Segment is no longer available'})
+        response.status_code = 404
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    data, content_type = segment
+    response = app.response_class(data, content_type=content_type)
+    # A segment never changes once published
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+def expand_playlist(params):
+    """Video IDs of a playlist or channel, in order, from yt-dlp's flat listing"""
+    url = params['url']
+    if params['type'] == 'channel' and urlparse(url).path.rstrip('/').rsplit('/', 1)[-1] not in ('videos', 'shorts', 'streams'):
+        # A channel's root lists its tabs, not its videos
+        url = url.rstrip('/') + '/videos'
+    base_options, file_cookie_file = get_ytdlp_base_options(url)
+    try:
+        with acquire_proxy(file_cookie_file, shared=True) as proxy:
+            cmd = [
+                *YTDLP_COMMAND,
+                '--flat-playlist',
+                '--print', 'id',
+                '--playlist-end', str(MAX_JOB_ITEMS),
+                *base_options,
+                url
+            ]
+            # Large playlists are listed a page of 100 at a time
+            result = YTDLP_CHILDREN.run('playlist', url, cmd, timeout=120, env=proxy.env({**os.environ, 'HOME': '/tmp'}))
+            proxy.finish(error=result.stderr if result.returncode != 0 else None)
+    finally:
         if file_cookie_file:
-            cookie_manager.cleanup_cookie_file(file_cookie_file)
+            CookieManager().cleanup_cookie_file(file_cookie_file)
+    
+    video_ids = [line.strip() for line in result.stdout.splitlines() if VIDEO_ID_RE.fullmatch(line.strip())]
+    if result.returncode != 0 and not video_ids:
+        raise JobError(describe_extraction_error(result.stderr, False)['error'])
+    if not video_ids:
+        raise JobError(f'No videos found in this {params["type"]}')
+    return video_ids
+
+def expand_batch(params):
+    return params['videoIds']
+
+def process_job_video(params, video_id):
+    """The /api/formats response of one video, from the shared cache when possible"""
+    prepared = get_cached_response(get_formats_cache_key(video_id))
+    if prepared is None:
+        if EXTRACTION_BREAKER.is_open():
+            raise RuntimeError('Extraction is paused after repeated bot detection; retry this video later')
+        prepared = prepare_formats(f'https://www.youtube.com/watch?v={video_id}')
+    return json.loads(prepared.body)
+
+# Jobs extract with the server's own cookies; client cookies aren't persisted
+JOB_QUEUE = JobQueue(
+    JobStore(JOBS_DB),
+    {
+        'playlist': (expand_playlist, process_job_video),
+        'channel': (expand_playlist, process_job_video),
+        'batch': (expand_batch, process_job_video),
+    },
+    workers=JOB_WORKERS,
+    max_items=MAX_JOB_ITEMS,
+    max_age=JOB_TTL
+)
+
+def describe_job(job):
+    return {
+        'jobId': job['id'],
+        'type': job['kind'],
+        'status': job['state'],
+        'progress': {'done': job['done'], 'failed': job['failed'], 'total': job['total']},
+        'error': job['error'],
+        'createdAt': job['created_at'],
+        'updatedAt': job['updated_at'],
+        'statusUrl': f"/api/jobs/{job['id']}",
+        'resultsUrl': f"/api/jobs/{job['id']}/results",
+    }
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def submit_job():
+    """Queue a playlist, channel or batch job
+    
+    Takes {"type": "playlist" | "channel", "url": ...} or {"type": "batch",
+    "videoIds": [...]} (YouTube URLs are accepted as well as IDs) and answers 202
+    with the job's status; poll statusUrl and read resultsUrl as items complete.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    if JOB_WORKERS <= 0:
+        response = jsonify({'error': 'Background jobs are not available on this server'})
+        response.status_code = 501
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    data = request.get_json(silent=True) or {}
+    kind = data.get('type')
+    params = {'type': kind}
+    items = None
+    if kind in ('playlist', 'channel'):
+        url = data.get('url')
+        parsed = urlparse(url) if isinstance(url, str) else None
+        if not parsed or parsed.scheme not in ('http', 'https') or parsed.hostname not in YOUTUBE_HOSTS:
+            response = jsonify({'error': f'Please provide a valid YouTube {kind} URL'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+        params['url'] = url
+    elif kind == 'batch':
+        entries = data.get('videoIds')
+        items = [
+            (entry if VIDEO_ID_RE.fullmatch(entry) else get_video_id(entry)) if isinstance(entry, str) else None
+            for entry in entries
+        ] if isinstance(entries, list) else []
+        if not items or None in items or len(items) > MAX_JOB_ITEMS:
+            response = jsonify({'error': f'videoIds must be a list of 1 to {MAX_JOB_ITEMS} YouTube video IDs or URLs'})
+            response.status_code = 400
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+        params['videoIds'] = items
+    
+    try:
+        job_id = JOB_QUEUE.submit(kind, params, items)
+    except JobError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 400
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    response = jsonify(describe_job(JOB_QUEUE.store.get(job_id)))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job_id}'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE', 'OPTIONS'])
+def job_status(job_id):
+    """A job's status and progress; DELETE cancels it"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, DELETE, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
+        return response
+    
+    job = JOB_QUEUE.store.get(job_id)
+    if job is None:
+        response = jsonify({'error': 'Job not found'})
+        response.status_code = 404
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    if request.method == 'DELETE':
+        if not JOB_QUEUE.cancel(job_id):
+            response = jsonify({'error': f"Job has already finished ({job['state']})"})
+            response.status_code = 409
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+        job = JOB_QUEUE.store.get(job_id)
+    
+    response = jsonify({**describe_job(job), 'cancelRequested': bool(job['cancel'])})
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """Results of a job's items so far, in order, a page at a time
+    
+    Pass the previous page's next as after= to continue; results of a running job
+    can be read as they arrive.
+    """
+    job = JOB_QUEUE.store.get(job_id)
+    if job is None:
+        response = jsonify({'error': 'Job not found'})
+        response.status_code = 404
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    
+    after = request.args.get('after', -1, type=int)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = JOB_QUEUE.store.results(job_id, after, limit)
+    response = jsonify({
+        'jobId': job_id,
+        'status': job['state'],
+        'progress': {'done': job['done'], 'failed': job['failed'], 'total': job['total']},
+        'results': [
+            {'index': index, 'videoId': video_id, 'ok': ok, **({'formats': result} if ok else result)}
+            for index, video_id, ok, result in results
+        ],
+        # Cursor for the next page; the same cursor again once more items complete
+        'next': results[-1][0] if results else after,
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
 
 # New endpoint for cookie validation
 @app.route('/api/validate-cookies', methods=['POST', 'OPTIONS'])
@@ -546,6 +1661,7 @@ def validate_cookies():
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
         return response
     
     cookie_manager = CookieManager()
@@ -573,26 +1689,23 @@ def validate_cookies():
         test_url = "https://www.youtube.com/robots.txt"
         
         try:
-            base_options, temp_cache_dir, file_cookie_file = get_ytdlp_base_options(test_url, cookie_file)
-            
-            # Simple test command
-            cmd = [
-                sys.executable, '-m', 'yt_dlp',
-                '--simulate',
-                '--no-warnings',
-                *base_options,
-                'https://www.youtube.com/watch?v=dQw4w9WgXcQ'  # Test with a known public video
-            ]
+            base_options, file_cookie_file = get_ytdlp_base_options(test_url, cookie_file)
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            # Through the account's own proxy, as its extractions will be
+            with acquire_proxy(cookie_file or file_cookie_file, shared=not cookie_file) as proxy:
+                # Simple test command
+                cmd = [
+                    *YTDLP_COMMAND,
+                    '--simulate',
+                    '--no-warnings',
+                    *base_options,
+                    'https://www.youtube.com/watch?v=dQw4w9WgXcQ'  # Test with a known public video
+                ]
+                
+                result = YTDLP_CHILDREN.run('validate_cookies', None, cmd, timeout=30, env=proxy.env(dict(os.environ)))
+                proxy.finish(error=result.stderr if result.returncode != 0 else None)
             
             # Clean up
-            cleanup_temp_dir(temp_cache_dir)
             if file_cookie_file:
                 cookie_manager.cleanup_cookie_file(file_cookie_file)
             
@@ -606,6 +1719,12 @@ def validate_cookies():
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response
             
+        except ProxyUnavailable as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
         except Exception as e:
             response = jsonify({
                 'valid': False,
@@ -624,11 +1743,97 @@ def validate_cookies():
         if cookie_file:
             cookie_manager.cleanup_cookie_file(cookie_file)
 
+@app.before_request
+def start_warm_up():
+    """Start the boot warm-up, and the job workers on a process's first request
+    
+    Workers aren't started on import: scripts and tests that import the app would
+    claim jobs and leave them running until they went stale.
+    """
+    WARM_UP.ensure_started()
+    if JOB_WORKERS > 0:
+        JOB_QUEUE.ensure_started()
+
+@app.after_request
+def log_child_usage(response):
+    """Log what the yt-dlp runs behind a request cost, next to its path and status"""
+    runs = g.get('child_usage')
+    if runs:
+        cpu_seconds = sum(run['cpu_seconds'] or 0 for run in runs)
+        max_rss = max(run['max_rss_bytes'] or 0 for run in runs)
+        wall_seconds = sum(run['wall_seconds'] for run in runs)
+        print(f"📊 {request.method} {request.path} {response.status_code}: {len(runs)} yt-dlp run(s), "
+              f"{cpu_seconds:.2f}s CPU, {max_rss / 1024 ** 2:.0f} MiB max RSS, {wall_seconds:.2f}s wall")
+    return response
+
+@app.before_request
+def route_to_owner():
+    """Forward requests for videos owned by another node when routing is enabled"""
+    if ROUTER is None or request.method == 'OPTIONS' or request.headers.get(FORWARDED_HEADER):
+        return None
+    
+    video_id = get_request_video_id(request)
+    if not video_id:
+        return None
+    owner = ROUTER.owner(video_id)
+    if owner is None or owner == ROUTER.self_node:
+        return None
+    # Serve locally if the owner can't be reached
+    return ROUTER.forward(owner, request)
+
+# Cache, upstream pool, background work and yt-dlp usage counters for this process
+@app.route('/api/metrics')
+def metrics():
+    response = jsonify({
+        'cache': CACHE.stats(),
+        'upstream_pool': media_proxy.POOL.stats(),
+        'media_cache': MEDIA_CACHE.stats() if MEDIA_CACHE else None,
+        'live': LIVE_PROXY.stats(),
+        'bandwidth': BANDWIDTH.stats() if BANDWIDTH else None,
+        'refresh_scheduler': REFRESH_SCHEDULER.stats(),
+        'warm_up': WARM_UP.stats(),
+        'jobs': JOB_QUEUE.stats() if JOB_WORKERS > 0 else None,
+        'router': ROUTER.stats() if ROUTER else None,
+        'proxies': PROXIES.stats() if PROXIES else None,
+        'ytdlp_usage': YTDLP_CHILDREN.stats(),
+    })
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
 # Health check endpoint for Vercel
 @app.route('/health')
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'DebuTube API is running perfectly!'})
 
+# Readiness check, separate from liveness: 503 until the warm-up this process was asked for has finished
+@app.route('/ready')
+def readiness_check():
+    stats = WARM_UP.stats()
+    response = jsonify(stats)
+    response.status_code = 200 if stats['ready'] else 503
+    return response
+
+def is_internal_request(flask_request):
+    """Whether a request may call the internal endpoints"""
+    if INTERNAL_TOKEN:
+        return hmac.compare_digest(flask_request.headers.get('X-Debutube-Token', ''), INTERNAL_TOKEN)
+    return flask_request.remote_addr in ('127.0.0.1', '::1') and not flask_request.headers.get('X-Forwarded-For')
+
+# Run the warm-up now: in the background (202), or before responding with ?wait=1
+@app.route('/api/internal/warmup', methods=['POST'])
+def run_warm_up():
+    if not is_internal_request(request):
+        response = jsonify({'error': 'Forbidden'})
+        response.status_code = 403
+        return response
+    
+    if request.args.get('wait') in ('1', 'true'):
+        return jsonify(WARM_UP.run())
+    WARM_UP.start()
+    response = jsonify(WARM_UP.stats())
+    response.status_code = 202
+    return response
+
 # Catch-all route to handle other API requests
 @app.route('/api/<path:path>', methods=['GET', 'POST', 'OPTIONS'])
 def catch_all(path):
@@ -637,6 +1842,7 @@ def catch_all(path):
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
         response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        response.headers.add('Access-Control-Max-Age', str(CORS_MAX_AGE))
         return response
     
     response = jsonify({'error': f'API endpoint /{path} not found'})
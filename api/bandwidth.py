@@ -0,0 +1,181 @@
+"""Fair sharing of a node's egress bandwidth between download clients
+
+Downloads ask for permission before sending each chunk. Every chunk is first
+shaped by its client's own token bucket (the per-client cap, with a burst
+allowance), then queued for the node's egress bucket in start-time fair queueing
+order: each chunk is tagged max(virtual time, the client's previous finish tag)
+and finishes len / weight later, and the lowest tag is sent first. A client
+pulling several 4K files therefore gets the same share of a saturated uplink as
+one fetching a single audio file, instead of a share per connection.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+# Window over which throughput is reported
+THROUGHPUT_WINDOW_SECONDS = 5.0
+
+
+class TokenBucket:
+    """rate bytes/s with bursts up to burst bytes; a request larger than burst is allowed from full"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _fill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount):
+        """Seconds until amount bytes may be sent (0 when they may be sent now)"""
+        self._fill(time.monotonic())
+        needed = min(amount, self.burst)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._fill(time.monotonic())
+        self.tokens -= amount
+
+
+class _Client:
+    def __init__(self, weight, bucket):
+        self.weight = weight
+        self.bucket = bucket  # Per-client cap, or None
+        self.lock = threading.Lock()
+        self.finish_tag = 0.0
+        self.downloads = 0
+        self.bytes_sent = 0
+
+
+class BandwidthScheduler:
+    """Weighted fair queueing of download chunks across clients
+
+    rate is the node's egress in bytes/s (0 for no node-wide limit); client_rate
+    and client_burst cap every client (0 for no cap); weights maps client IDs to
+    weights (default 1).
+    """
+
+    def __init__(self, rate=0, client_rate=0, client_burst=4 * 1024 * 1024, weights=None):
+        self.rate = rate
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.weights = weights or {}
+        # Enough burst for a few chunks, so the uplink stays busy between grants
+        self.bucket = TokenBucket(rate, max(rate * 0.05, 1024 * 1024)) if rate else None
+        self.clients = {}
+        self.queue = []  # (finish tag, sequence, start tag)
+        self.sequence = itertools.count()
+        self.virtual_time = 0.0
+        self.condition = threading.Condition()
+
+        self.bytes_sent = 0
+        self.grants = 0
+        self.wait_seconds = 0.0
+        self.window_started = time.monotonic()
+        self.window_bytes = 0
+        self.throughput = 0.0
+
+    def _open(self, client_id):
+        with self.condition:
+            client = self.clients.get(client_id)
+            if client is None:
+                bucket = TokenBucket(self.client_rate, self.client_burst) if self.client_rate else None
+                client = self.clients[client_id] = _Client(self.weights.get(client_id, 1.0), bucket)
+            client.downloads += 1
+            return client
+
+    def _close(self, client_id, client):
+        with self.condition:
+            client.downloads -= 1
+            if client.downloads == 0 and self.clients.get(client_id) is client:
+                # An idle client starts over at the current virtual time
+                del self.clients[client_id]
+
+    def _shape(self, client, amount):
+        """Wait until the client's own cap allows amount more bytes"""
+        if client.bucket is None:
+            return
+        with client.lock:
+            delay = client.bucket.delay(amount)
+            while delay > 0:
+                time.sleep(delay)
+                delay = client.bucket.delay(amount)
+            client.bucket.take(amount)
+
+    def _queue(self, client, amount):
+        """Wait for amount bytes of node egress in fair-queueing order"""
+        with self.condition:
+            start_tag = max(self.virtual_time, client.finish_tag)
+            client.finish_tag = start_tag + amount / client.weight
+            entry = (client.finish_tag, next(self.sequence), start_tag)
+            heapq.heappush(self.queue, entry)
+            while True:
+                if self.queue[0] is entry:
+                    delay = self.bucket.delay(amount)
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+                else:
+                    self.condition.wait()
+            heapq.heappop(self.queue)
+            self.bucket.take(amount)
+            self.virtual_time = start_tag
+            self.condition.notify_all()
+
+    def acquire(self, client, amount):
+        started = time.monotonic()
+        self._shape(client, amount)
+        if self.bucket is not None:
+            self._queue(client, amount)
+        now = time.monotonic()
+        with self.condition:
+            client.bytes_sent += amount
+            self.bytes_sent += amount
+            self.grants += 1
+            self.wait_seconds += now - started
+            self.window_bytes += amount
+            if now - self.window_started >= THROUGHPUT_WINDOW_SECONDS:
+                self.throughput = self.window_bytes / (now - self.window_started)
+                self.window_started = now
+                self.window_bytes = 0
+
+    def throttle(self, client_id, body, chunk_size):
+        """Yield body's chunks at the pace the scheduler allows client_id
+
+        body is an iterable of bytes or a file-like object with read(); it's closed
+        when the download ends or the client goes away.
+        """
+        client = self._open(client_id)
+        try:
+            chunks = body if hasattr(body, '__iter__') else iter(lambda: body.read(chunk_size), b'')
+            for chunk in chunks:
+                self.acquire(client, len(chunk))
+                yield chunk
+        finally:
+            close = getattr(body, 'close', None)
+            if close:
+                close()
+            self._close(client_id, client)
+
+    def stats(self):
+        with self.condition:
+            elapsed = time.monotonic() - self.window_started
+            # The last full window, or the current one when it's the first or has gone quiet
+            throughput = self.throughput
+            if not throughput or elapsed >= THROUGHPUT_WINDOW_SECONDS * 2:
+                throughput = self.window_bytes / max(elapsed, 1e-6)
+            return {
+                'egress_limit': self.rate or None,
+                'client_limit': self.client_rate or None,
+                'active_clients': len(self.clients),
+                'active_downloads': sum(client.downloads for client in self.clients.values()),
+                'queued': len(self.queue),
+                'bytes_sent': self.bytes_sent,
+                'throughput': round(throughput),
+                'avg_wait_ms': round(self.wait_seconds / self.grants * 1000, 2) if self.grants else None,
+            }
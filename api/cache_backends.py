@@ -0,0 +1,692 @@
+"""Cache backends shared by the extraction paths
+
+Every backend stores compact byte strings with a TTL and a bounded size:
+
+- MemoryCache: in-process LRU (the default, and the only option without configuration)
+- SharedMemoryCache: a memory-mapped file shared by every worker process on one host
+- SQLiteCache: a local database file shared by all workers on one host
+- RedisCache: any server speaking the Redis protocol, shared by every instance
+
+Pick one with create_cache('memory://'), create_cache('shm://'),
+create_cache('sqlite:///tmp/debutube.db') or create_cache('redis://:password@host:6379/0').
+Several comma-separated URLs build a TieredCache that is checked in order, e.g.
+'shm://,redis://host:6379/0'. A backend that fails (unreachable server, corrupt
+file) behaves as a cache miss; it never fails the request.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import sqlite3
+import ssl
+import struct
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class CacheBackend:
+    """Interface for byte-string caches with per-entry TTLs"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key):
+        """Cached bytes for key, or None when missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Store value (bytes) for ttl seconds"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class MemoryCache(CacheBackend):
+    """Thread-safe in-process LRU cache, bounded by the total size of its values"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return self._count(entry and entry[0])
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, time.time() + ttl)
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.current_bytes -= len(self.entries.pop(key)[0])
+
+    def stats(self):
+        return {**super().stats(), 'entries': len(self.entries), 'bytes': self.current_bytes}
+
+
+class SharedMemoryCache(CacheBackend):
+    """Cache in a memory-mapped file shared by every worker process on the host
+
+    The file holds a header, a fixed-size open-addressing hash index (key hash ->
+    slab number) and slab_count slabs of slab_size bytes, each holding one entry.
+    Values that don't fit in a slab are not stored.
+
+    Readers take no lock: a sequence counter in the header is odd while a writer
+    is modifying the file, and a read that overlaps a write is retried (a seqlock).
+    Writers serialise on an fcntl lock, so the lock is released if a worker dies.
+    A dead writer leaves the counter odd; the next writer sees that and
+    reinitialises the file instead of trusting a half-written index.
+
+    Slabs are reclaimed with CLOCK: hits set a slab's referenced flag, and the
+    allocator's hand clears flags until it finds an expired or unreferenced slab.
+    """
+
+    MAGIC = b'DTSM'
+    VERSION = 1
+    # magic, version, slab_count, slab_size, clock_hand, entries, sequence, generation
+    HEADER = struct.Struct('<4sIIIIIQQ')
+    HEADER_SIZE = 64
+    SEQUENCE_OFFSET = 24
+    # key hash, slab number
+    BUCKET = struct.Struct('<QI')
+    EMPTY = 0xFFFFFFFF
+    # key hash, expires_at, value length, key length, referenced
+    SLAB = struct.Struct('<QdIHB')
+    REFERENCED_OFFSET = 22
+    READ_RETRIES = 8
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024, slab_size=128 * 1024):
+        super().__init__()
+        if path is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp'
+            path = os.path.join(directory, 'debutube_cache')
+        self.path = path
+        self._set_layout(max(max_bytes // slab_size, 1), slab_size)
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self._writing():
+                self._open_map()
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _set_layout(self, slab_count, slab_size):
+        self.slab_size = slab_size
+        self.slab_count = slab_count
+        self.bucket_count = self.slab_count * 2
+        self.index_offset = self.HEADER_SIZE
+        self.slabs_offset = self.index_offset + self.bucket_count * self.BUCKET.size
+        self.size = self.slabs_offset + self.slab_count * slab_size
+
+    def _open_map(self):
+        """Map the file, creating it if it's new (called with the write lock held)
+
+        Other workers may have the file mapped, so an existing cache is never resized:
+        shrinking it under them would make their next access fault with SIGBUS. One
+        made with another max_bytes or slab_size is used with the size it has.
+        """
+        file_size = os.fstat(self.fd).st_size
+        header = os.pread(self.fd, self.HEADER.size, 0)
+        magic, version, slab_count, slab_size = (
+            self.HEADER.unpack(header)[:4] if len(header) == self.HEADER.size else (None, None, 0, 0))
+        initialised = (magic, version) == (self.MAGIC, self.VERSION) and slab_count and slab_size
+        if initialised and (slab_count, slab_size) != (self.slab_count, self.slab_size):
+            print(f"⚠️ Shared cache {self.path} has {slab_count} slabs of {slab_size} bytes, "
+                  f"not the {self.slab_count} of {self.slab_size} configured; using it as it is")
+            self._set_layout(slab_count, slab_size)
+        if file_size == 0:
+            os.ftruncate(self.fd, self.size)
+        elif file_size < self.size or (not initialised and file_size != self.size):
+            raise ValueError(f'{self.path} is not a shared cache of the configured size; '
+                             'remove it or use another path')
+        self.map = mmap.mmap(self.fd, self.size)
+        if not initialised:
+            self._reinitialise()
+
+    @staticmethod
+    def _hash(key):
+        # 0 marks a free slab, so it's never used as a key hash
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+    def _writing(self):
+        return _FileLock(self.lock, self.fd)
+
+    def _sequence(self):
+        return struct.unpack_from('<Q', self.map, self.SEQUENCE_OFFSET)[0]
+
+    def _set_sequence(self, value):
+        struct.pack_into('<Q', self.map, self.SEQUENCE_OFFSET, value)
+
+    def _reinitialise(self):
+        """Reset the header, index and slab headers (called with the write lock held)"""
+        generation = 0
+        if self.HEADER.unpack_from(self.map)[0] == self.MAGIC:
+            generation = self.HEADER.unpack_from(self.map)[7] + 1
+        self.HEADER.pack_into(self.map, 0, b'\0\0\0\0', 0, 0, 0, 0, 0, 1, generation)
+        empty_bucket = self.BUCKET.pack(0, self.EMPTY)
+        self.map[self.index_offset:self.slabs_offset] = empty_bucket * self.bucket_count
+        free_slab = self.SLAB.pack(0, 0.0, 0, 0, 0)
+        for slab in range(self.slab_count):
+            offset = self._slab_offset(slab)
+            self.map[offset:offset + self.SLAB.size] = free_slab
+        # The magic goes in last, with an even sequence, once everything else is valid
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.slab_count, self.slab_size,
+                              0, 0, 2, generation)
+
+    def _slab_offset(self, slab):
+        return self.slabs_offset + slab * self.slab_size
+
+    def _bucket_offset(self, bucket):
+        return self.index_offset + bucket * self.BUCKET.size
+
+    def _find(self, key_hash, key):
+        """(bucket, slab) holding key, or (None, None); reads only, may see a torn state"""
+        bucket = key_hash % self.bucket_count
+        for _ in range(self.bucket_count):
+            bucket_hash, slab = self.BUCKET.unpack_from(self.map, self._bucket_offset(bucket))
+            if slab == self.EMPTY:
+                break
+            if bucket_hash == key_hash and slab < self.slab_count:
+                offset = self._slab_offset(slab)
+                key_length = self.SLAB.unpack_from(self.map, offset)[3]
+                start = offset + self.SLAB.size
+                if self.map[start:start + key_length] == key:
+                    return bucket, slab
+            bucket = (bucket + 1) % self.bucket_count
+        return None, None
+
+    def _read(self, key):
+        """Value for key and whether the read was consistent"""
+        sequence = self._sequence()
+        if sequence & 1:
+            return None, False
+        value = None
+        key_hash = self._hash(key)
+        _, slab = self._find(key_hash, key)
+        if slab is not None:
+            offset = self._slab_offset(slab)
+            slab_hash, expires_at, value_length, key_length, referenced = self.SLAB.unpack_from(self.map, offset)
+            start = offset + self.SLAB.size + key_length
+            if (slab_hash == key_hash and expires_at > time.time()
+                    and start + value_length <= offset + self.slab_size):
+                value = self.map[start:start + value_length]
+                if not referenced:
+                    self.map[offset + self.REFERENCED_OFFSET] = 1
+        return value, self._sequence() == sequence
+
+    def get(self, key):
+        key = key.encode('utf-8')
+        try:
+            for _ in range(self.READ_RETRIES):
+                value, consistent = self._read(key)
+                if consistent:
+                    return self._count(value)
+                time.sleep(0)
+        except (ValueError, struct.error):
+            self.errors += 1
+        return self._count(None)
+
+    def set(self, key, value, ttl):
+        key = key.encode('utf-8')
+        if ttl <= 0 or self.SLAB.size + len(key) + len(value) > self.slab_size:
+            return
+        key_hash = self._hash(key)
+        with self._writing():
+            self._begin_write()
+            try:
+                bucket, slab = self._find(key_hash, key)
+                if slab is not None:
+                    self._remove(bucket, slab)
+                slab = self._allocate()
+                offset = self._slab_offset(slab)
+                start = offset + self.SLAB.size
+                self.map[start:start + len(key)] = key
+                self.map[start + len(key):start + len(key) + len(value)] = value
+                self.SLAB.pack_into(self.map, offset, key_hash, time.time() + ttl, len(value), len(key), 0)
+                self._insert(key_hash, slab)
+            finally:
+                self._end_write()
+
+    def delete(self, key):
+        key = key.encode('utf-8')
+        with self._writing():
+            self._begin_write()
+            try:
+                bucket, slab = self._find(self._hash(key), key)
+                if slab is not None:
+                    self._remove(bucket, slab)
+            finally:
+                self._end_write()
+
+    def _begin_write(self):
+        sequence = self._sequence()
+        if sequence & 1 or self.HEADER.unpack_from(self.map)[0] != self.MAGIC:
+            # A writer died part-way through an update
+            print(f"⚠️ Shared cache {self.path} was left mid-write, reinitialising")
+            self._reinitialise()
+            sequence = self._sequence()
+        self._set_sequence(sequence + 1)
+
+    def _end_write(self):
+        self._set_sequence(self._sequence() + 1)
+
+    def _header_counter(self, index, value=None):
+        header = list(self.HEADER.unpack_from(self.map))
+        if value is None:
+            return header[index]
+        header[index] = value
+        self.HEADER.pack_into(self.map, 0, *header)
+
+    def _allocate(self):
+        """Free a slab with the CLOCK hand and return its number"""
+        hand = self._header_counter(4)
+        now = time.time()
+        for _ in range(self.slab_count * 2 + 1):
+            slab = hand
+            hand = (hand + 1) % self.slab_count
+            offset = self._slab_offset(slab)
+            key_hash, expires_at, _, _, referenced = self.SLAB.unpack_from(self.map, offset)
+            if key_hash and expires_at > now and referenced:
+                # Recently used: give it another turn of the hand
+                self.map[offset + self.REFERENCED_OFFSET] = 0
+                continue
+            if key_hash:
+                self._evict(slab, key_hash)
+            break
+        self._header_counter(4, hand)
+        return slab
+
+    def _evict(self, slab, key_hash):
+        bucket = key_hash % self.bucket_count
+        for _ in range(self.bucket_count):
+            bucket_hash, bucket_slab = self.BUCKET.unpack_from(self.map, self._bucket_offset(bucket))
+            if bucket_slab == self.EMPTY:
+                break
+            if bucket_slab == slab:
+                self._remove(bucket, slab)
+                return
+            bucket = (bucket + 1) % self.bucket_count
+        self._free_slab(slab)
+
+    def _free_slab(self, slab):
+        self.SLAB.pack_into(self.map, self._slab_offset(slab), 0, 0.0, 0, 0, 0)
+
+    def _insert(self, key_hash, slab):
+        bucket = key_hash % self.bucket_count
+        while self.BUCKET.unpack_from(self.map, self._bucket_offset(bucket))[1] != self.EMPTY:
+            bucket = (bucket + 1) % self.bucket_count
+        self.BUCKET.pack_into(self.map, self._bucket_offset(bucket), key_hash, slab)
+        self._header_counter(5, self._header_counter(5) + 1)
+
+    def _remove(self, bucket, slab):
+        """Free a slab and delete its bucket, shifting later buckets back to keep probe chains intact"""
+        self._free_slab(slab)
+        self._header_counter(5, self._header_counter(5) - 1)
+        hole = bucket
+        probe = bucket
+        while True:
+            probe = (probe + 1) % self.bucket_count
+            probe_hash, probe_slab = self.BUCKET.unpack_from(self.map, self._bucket_offset(probe))
+            if probe_slab == self.EMPTY:
+                break
+            home = probe_hash % self.bucket_count
+            # Entries whose home lies cyclically in (hole, probe] stay where they are
+            if (hole < probe and hole < home <= probe) or (hole > probe and (home > hole or home <= probe)):
+                continue
+            self.BUCKET.pack_into(self.map, self._bucket_offset(hole), probe_hash, probe_slab)
+            hole = probe
+        self.BUCKET.pack_into(self.map, self._bucket_offset(hole), 0, self.EMPTY)
+
+    def stats(self):
+        return {
+            **super().stats(),
+            'entries': self._header_counter(5),
+            'slabs': self.slab_count,
+            'generation': self._header_counter(7),
+        }
+
+
+class _FileLock:
+    """Thread lock plus an exclusive fcntl lock on a file, released if the process dies"""
+
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+
+class SQLiteCache(CacheBackend):
+    """File-backed cache in a SQLite database, shared by every process on the host
+
+    Least recently used entries are evicted once the stored values exceed max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)')
+
+    def _connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def get(self, key):
+        try:
+            db = self._connect()
+            now = time.time()
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row is not None:
+                db.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+            return self._count(row and bytes(row[0]))
+        except sqlite3.Error:
+            self.errors += 1
+            return self._count(None)
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or len(value) > self.max_bytes:
+            return
+        try:
+            db = self._connect()
+            now = time.time()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?)', (key, sqlite3.Binary(value), len(value), now + ttl, now)
+                )
+                db.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+                total = db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(db, total - self.max_bytes)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+
+    def _evict(self, db, excess):
+        """Delete least recently used entries until at least excess bytes are freed"""
+        freed = 0
+        doomed = []
+        for key, size in db.execute('SELECT key, size FROM cache ORDER BY accessed_at'):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany('DELETE FROM cache WHERE key = ?', doomed)
+
+    def delete(self, key):
+        try:
+            self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error:
+            self.errors += 1
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server"""
+
+
+class RedisCache(CacheBackend):
+    """Cache on a Redis-protocol server, speaking RESP directly over a socket
+
+    Each thread keeps its own connection and reconnects after a failure. Values
+    expire through PX TTLs; the overall size bound comes from the server's
+    maxmemory with an allkeys-lru (or volatile-lru) eviction policy, and values
+    larger than max_value_bytes are not stored.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, username=None,
+                 use_tls=False, prefix='debutube:', timeout=0.5, max_value_bytes=8 * 1024 * 1024):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.use_tls = use_tls
+        self.prefix = prefix
+        self.timeout = timeout
+        self.max_value_bytes = max_value_bytes
+        self.local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        return cls(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int((parsed.path or '/0').lstrip('/') or 0),
+            password=unquote(parsed.password) if parsed.password else None,
+            username=unquote(parsed.username) if parsed.username else None,
+            use_tls=parsed.scheme == 'rediss',
+            prefix=query.get('prefix', ['debutube:'])[0],
+            **kwargs
+        )
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            if self.use_tls:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+            connection = (sock, sock.makefile('rb'))
+            self.local.connection = connection
+            if self.password:
+                auth = ('AUTH', self.username, self.password) if self.username else ('AUTH', self.password)
+                self._call(*auth)
+            if self.db:
+                self._call('SELECT', self.db)
+        return connection
+
+    def _disconnect(self):
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection is not None:
+            try:
+                connection[1].close()
+                connection[0].close()
+            except OSError:
+                pass
+
+    def _call(self, *args):
+        """Send one command and return its decoded reply"""
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n' % len(arg))
+            parts.append(arg)
+            parts.append(b'\r\n')
+        sock.sendall(b''.join(parts))
+        return self._read_reply(reader)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by Redis server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Connection closed by Redis server')
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise ConnectionError(f'Unexpected Redis reply: {line[:32]!r}')
+
+    def _command(self, *args):
+        """Run a command, treating connection problems as a miss"""
+        try:
+            return self._call(*args)
+        except (OSError, ConnectionError, RedisError, ValueError):
+            self.errors += 1
+            self._disconnect()
+            return None
+
+    def get(self, key):
+        return self._count(self._command('GET', self.prefix + key))
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or len(value) > self.max_value_bytes:
+            return
+        self._command('SET', self.prefix + key, value, 'PX', max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self._command('DEL', self.prefix + key)
+
+    def ping(self):
+        return self._command('PING') == b'PONG'
+
+
+class TieredCache(CacheBackend):
+    """Several caches checked in order, nearest first
+
+    Writes go to every tier. A hit in a later tier is copied into the earlier
+    ones for backfill_ttl seconds, since backends don't report remaining TTLs;
+    cached URLs are already stored with a margin well above that before they expire.
+    """
+
+    def __init__(self, tiers, backfill_ttl=60):
+        super().__init__()
+        self.tiers = tiers
+        self.backfill_ttl = backfill_ttl
+
+    def get(self, key):
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for nearer in self.tiers[:index]:
+                    nearer.set(key, value, self.backfill_ttl)
+                return self._count(value)
+        return self._count(None)
+
+    def set(self, key, value, ttl):
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def stats(self):
+        return {**super().stats(), 'tiers': [tier.stats() for tier in self.tiers]}
+
+
+def create_cache(url=None, max_bytes=None):
+    """Create the cache backend configured by a URL (memory://, shm://, sqlite:///path, redis://...)
+
+    A comma-separated list of URLs creates a TieredCache checked in that order.
+    """
+    url = url or 'memory://'
+    if ',' in url:
+        return TieredCache([create_cache(part.strip(), max_bytes) for part in url.split(',') if part.strip()])
+    scheme = url.split('://', 1)[0].lower()
+    size = {} if max_bytes is None else {'max_bytes': max_bytes}
+
+    if scheme == 'memory':
+        return MemoryCache(**size)
+    if scheme == 'shm':
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        if 'slab_size' in query:
+            size['slab_size'] = int(query['slab_size'][0])
+        return SharedMemoryCache(parsed.path or None, **size)
+    if scheme == 'sqlite':
+        path = url.split('://', 1)[1] or os.path.join('/tmp', 'debutube_cache.db')
+        return SQLiteCache(path, **size)
+    if scheme in ('redis', 'rediss'):
+        return RedisCache.from_url(url)
+    raise ValueError(f'Unsupported cache URL: {url}')
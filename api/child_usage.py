@@ -0,0 +1,250 @@
+"""Resource limits and usage accounting for yt-dlp child processes
+
+Every extraction is a child process, and now and then one balloons in memory or
+spins on the CPU until its timeout kills it. Children run under resource limits
+(RLIMIT_CPU, RLIMIT_DATA, RLIMIT_AS, ...) set in the child before it execs, and
+are reaped with wait4, which returns their CPU time and peak RSS, including
+those of any processes they started and waited for. ChildUsage logs each run's
+numbers, keeps totals per kind of run, and keeps the heaviest recent runs with
+the video they were for.
+"""
+
+import heapq
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from functools import partial
+
+try:
+    import resource
+except ImportError:  # Windows: no limits, and usage isn't recorded
+    resource = None
+
+SIZE_SUFFIXES = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+# Seconds between RLIMIT_CPU's SIGXCPU and the kernel's SIGKILL
+CPU_GRACE_SECONDS = 5
+RECENT_RUNS = 200  # Runs the heaviest-runs report and percentiles are taken from
+HEAVIEST_RUNS = 5
+# ru_maxrss is in KiB on Linux, in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+MEMORY_ERRORS = ('MemoryError', 'Cannot allocate memory', 'out of memory')
+# returncode of a child that was reaped elsewhere, so its exit status is unknown
+STATUS_LOST = 255
+
+
+def parse_limits(spec):
+    """Parse "cpu=30,data=2G" into [(name, RLIMIT_* constant, (soft, hard))]
+
+    Names are RLIMIT_* names without the prefix, values are counts with an
+    optional K/M/G suffix (seconds for cpu). Raises ValueError on unknown names.
+    """
+    limits = []
+    if resource is None:
+        return limits
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        name = name.strip().lower()
+        value = value.strip().lower()
+        resource_id = getattr(resource, f'RLIMIT_{name.upper()}', None)
+        if resource_id is None or not value:
+            raise ValueError(f'Unknown resource limit {item.strip()!r}; expected e.g. cpu=30,data=2G')
+        multiplier = SIZE_SUFFIXES.get(value[-1], 1)
+        soft = int(float(value.rstrip('kmg')) * multiplier)
+        # SIGXCPU at the soft limit lets the child die on its own before the SIGKILL
+        hard = soft + CPU_GRACE_SECONDS if name == 'cpu' else soft
+        # Children may only lower limits, not raise them past this process's hard limit
+        current_hard = resource.getrlimit(resource_id)[1]
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        limits.append((name, resource_id, (soft, hard)))
+    return limits
+
+
+def _set_limits(limits):
+    for _, resource_id, limit in limits:
+        resource.setrlimit(resource_id, limit)
+
+
+class AccountedPopen(subprocess.Popen):
+    """A Popen whose child runs under limits and is reaped with wait4
+
+    Once the child has been reaped, usage is its resource.struct_rusage (None
+    where wait4 isn't available) and wall_time how long it ran, in seconds. If
+    something else reaped it first, status_lost is set and returncode is STATUS_LOST.
+    """
+
+    def __init__(self, args, limits=(), **kwargs):
+        self.usage = None
+        self.wall_time = None
+        self.started = time.monotonic()
+        self.status_lost = False
+        limits = limits if resource is not None else ()
+        if limits:
+            # Set in the child between fork and exec, so yt-dlp never runs without them
+            # (setrlimit only touches the child's own state, so this is safe with threads)
+            kwargs['preexec_fn'] = partial(_set_limits, limits)
+        super().__init__(args, **kwargs)
+
+    def _reap(self, flags):
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            pid, status, usage = os.wait4(self.pid, flags)
+        except ChildProcessError:
+            # Reaped elsewhere (SIGCHLD ignored); its status and usage are lost, and
+            # it isn't reported as a success it may not have been
+            self.status_lost = True
+            self.returncode = STATUS_LOST
+            return self.returncode
+        if pid == 0:
+            return None
+        self.usage = usage
+        self.wall_time = time.monotonic() - self.started
+        self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def poll(self):
+        if not hasattr(os, 'wait4'):
+            return super().poll()
+        return self._reap(os.WNOHANG)
+
+    def wait(self, timeout=None):
+        if not hasattr(os, 'wait4'):
+            return super().wait(timeout)
+        if timeout is None:
+            return self._reap(0)
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            returncode = self._reap(os.WNOHANG)
+            if returncode is not None:
+                return returncode
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ChildUsage:
+    """Runs children under limits, and records what each run cost
+
+    name labels the children in logs ('yt-dlp'). listener, if given, is called
+    with each run's record, e.g. to attach it to the request that started it.
+    """
+
+    def __init__(self, name, limits=(), listener=None):
+        self.name = name
+        self.limits = limits
+        self.listener = listener
+        self.lock = threading.Lock()
+        self.kinds = {}
+        self.recent = deque(maxlen=RECENT_RUNS)
+
+    def popen(self, args, **kwargs):
+        return AccountedPopen(args, limits=self.limits, **kwargs)
+
+    def run(self, kind, label, args, timeout, **kwargs):
+        """subprocess.run(args, capture_output=True, text=True, timeout=timeout), recorded as kind
+
+        label is what the run was for (a video ID or URL).
+        """
+        process = self.popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except BaseException as e:
+            process.kill()
+            process.communicate()
+            self.record(kind, label, process, timed_out=isinstance(e, subprocess.TimeoutExpired))
+            raise
+        self.record(kind, label, process, stderr)
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    def _limit_hit(self, returncode, cpu_seconds, stderr):
+        """'cpu' or 'memory' when the run was ended by one of the limits, else None"""
+        limits = {name: limit for name, _, limit in self.limits}
+        # SIGXCPU only comes from RLIMIT_CPU; a SIGKILL is its doing only past the hard value
+        if 'cpu' in limits and (returncode == -signal.SIGXCPU or (
+                returncode == -signal.SIGKILL and cpu_seconds is not None and cpu_seconds >= limits['cpu'][1])):
+            return 'cpu'
+        if set(limits) & {'as', 'data', 'rss', 'stack'} and returncode != 0 \
+                and any(error in (stderr or '') for error in MEMORY_ERRORS):
+            return 'memory'
+        return None
+
+    def record(self, kind, label, process, stderr=None, timed_out=False):
+        """Record a reaped child's usage; returns the record"""
+        usage = process.usage
+        returncode = None if process.status_lost else process.returncode
+        cpu_seconds = usage.ru_utime + usage.ru_stime if usage is not None else None
+        wall_seconds = process.wall_time if process.wall_time is not None else time.monotonic() - process.started
+        entry = {
+            'kind': kind,
+            'label': label,
+            'returncode': returncode,
+            'wall_seconds': round(wall_seconds, 3),
+            'cpu_seconds': round(cpu_seconds, 3) if cpu_seconds is not None else None,
+            'max_rss_bytes': usage.ru_maxrss * MAXRSS_UNIT if usage is not None else None,
+            'timed_out': timed_out,
+            'limit': self._limit_hit(returncode, cpu_seconds, stderr),
+            'at': time.time(),
+        }
+
+        with self.lock:
+            totals = self.kinds.setdefault(kind, {
+                'runs': 0, 'timed_out': 0, 'limit_kills': {}, 'cpu_seconds': 0.0,
+                'wall_seconds': 0.0, 'max_rss_bytes': 0,
+            })
+            totals['runs'] += 1
+            totals['timed_out'] += timed_out
+            if entry['limit']:
+                totals['limit_kills'][entry['limit']] = totals['limit_kills'].get(entry['limit'], 0) + 1
+            totals['cpu_seconds'] += cpu_seconds or 0
+            totals['wall_seconds'] += wall_seconds
+            totals['max_rss_bytes'] = max(totals['max_rss_bytes'], entry['max_rss_bytes'] or 0)
+            self.recent.append(entry)
+
+        details = ['exit status lost' if returncode is None else f"exit {returncode}", f"{wall_seconds:.2f}s wall"]
+        if usage is not None:
+            details += [f"{cpu_seconds:.2f}s CPU", f"{entry['max_rss_bytes'] / 1024 ** 2:.0f} MiB max RSS"]
+        if timed_out:
+            details.append('timed out')
+        if entry['limit']:
+            details.append(f"hit the {entry['limit']} limit")
+        print(f"📊 {self.name} {kind}{f' {label}' if label else ''}: {', '.join(details)}")
+
+        if self.listener is not None:
+            self.listener(entry)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            kinds = {kind: dict(totals, limit_kills=dict(totals['limit_kills'])) for kind, totals in self.kinds.items()}
+            recent = list(self.recent)
+        for kind, totals in kinds.items():
+            runs = [entry for entry in recent if entry['kind'] == kind]
+            totals['cpu_seconds'] = round(totals['cpu_seconds'], 3)
+            totals['wall_seconds'] = round(totals['wall_seconds'], 3)
+            totals['recent_p95'] = {
+                field: _percentile([entry[field] for entry in runs if entry[field] is not None], 0.95)
+                for field in ('cpu_seconds', 'max_rss_bytes', 'wall_seconds')
+            }
+        return {
+            'limits': {name: {'soft': limit[0], 'hard': limit[1]} for name, _, limit in self.limits},
+            'kinds': kinds,
+            'heaviest_cpu': heapq.nlargest(HEAVIEST_RUNS, recent, key=lambda entry: entry['cpu_seconds'] or 0),
+            'heaviest_memory': heapq.nlargest(HEAVIEST_RUNS, recent, key=lambda entry: entry['max_rss_bytes'] or 0),
+        }
@@ -0,0 +1,78 @@
+"""yt-dlp extraction profiles for /api/formats and decoding of their output
+
+'full' asks yt-dlp for the whole --dump-json document. 'trimmed' skips what
+/api/formats never reads (translated subtitles, and the HLS/DASH manifests
+unless they're asked for) and prints only the fields the response is built
+from: one JSON line with the video metadata, then one with the format list.
+"""
+
+import json
+
+from format_records import FORMAT_FIELDS
+
+PROFILES = ('trimmed', 'full')
+
+# Modern YouTube player clients, tried in order, to avoid "not available on this app" errors
+YOUTUBE_PLAYER_CLIENTS = 'tv,android_sdkless,web,ios,android,web_safari'
+
+# Info dict fields read when building video_metadata
+VIDEO_METADATA_FIELDS = (
+    'id', 'title', 'fulltitle', 'description', 'duration', 'uploader', 'uploader_id',
+    'channel', 'channel_id', 'upload_date', 'view_count', 'like_count', 'thumbnail',
+    'webpage_url', 'age_limit', 'is_live', 'availability',
+)
+
+# Keys kept while decoding extractor output; everything else is dropped as soon as its
+# enclosing object is decoded, so thumbnails, captions, fragments etc. never pile up
+RESPONSE_FIELDS = frozenset(VIDEO_METADATA_FIELDS + FORMAT_FIELDS + ('formats',))
+
+
+def get_extraction_profile(profile, include_manifests=False):
+    """(youtube extractor args or None, output options) for an extraction profile"""
+    if profile == 'full':
+        return None, ['--dump-json']
+
+    skip = ['translated_subs']
+    if not include_manifests:
+        skip.extend(['hls', 'dash'])
+
+    output_options = [
+        '--print', '%(.{' + ','.join(VIDEO_METADATA_FIELDS) + '})j',
+        '--print', '%(formats.:.{' + ','.join(FORMAT_FIELDS) + '})j',
+    ]
+    return {'skip': ','.join(skip)}, output_options
+
+
+def _keep_response_fields(obj):
+    return {key: value for key, value in obj.items() if key in RESPONSE_FIELDS}
+
+
+def decode_extraction_line(line):
+    """Decode one line of yt-dlp output, keeping only the fields the response builder reads"""
+    line = line.strip()
+    # yt-dlp prints NA when a --print field is missing (e.g. a video without formats)
+    if line == b'NA' or line == 'NA':
+        return None
+    return json.loads(line, object_hook=_keep_response_fields)
+
+
+def assemble_video_info(documents, profile):
+    """Combine the decoded output lines of one video into an info dict"""
+    video_info = documents[0] or {}
+    if profile != 'full':
+        video_info['formats'] = documents[1] if len(documents) > 1 and documents[1] else []
+    return video_info
+
+
+def get_record_line_count(profile):
+    """Number of output lines yt-dlp prints per video for a profile"""
+    return 1 if profile == 'full' else 2
+
+
+def parse_extraction_output(output, profile):
+    """Parse captured yt-dlp output from either extraction profile into an info dict"""
+    lines = [line for line in output.splitlines() if line.strip()]
+    if not lines:
+        raise json.JSONDecodeError('Empty extractor output', output, 0)
+    documents = [decode_extraction_line(line) for line in lines[:get_record_line_count(profile)]]
+    return assemble_video_info(documents, profile)
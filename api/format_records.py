@@ -0,0 +1,186 @@
+"""Compact format records and single-pass classification for /api/formats"""
+
+import json
+import re
+from operator import attrgetter
+
+# Per-format fields read from yt-dlp, in the order they appear in the API response;
+# language is only used to tell audio tracks apart when deduplicating
+FORMAT_FIELDS = (
+    'format_id', 'ext', 'resolution', 'format_note', 'filesize', 'filesize_approx',
+    'vcodec', 'acodec', 'fps', 'quality', 'width', 'height', 'tbr', 'abr', 'vbr',
+    'protocol', 'format', 'language', 'url',
+)
+
+# Response keys that are always present, even when yt-dlp didn't report them
+RESPONSE_KEYS = FORMAT_FIELDS[:-2]
+
+# Compact encoder matching Flask's jsonify output
+_encode_json = json.JSONEncoder(separators=(',', ':')).encode
+
+# yt-dlp appends -0, -1, ... to format_ids that several player clients returned
+_DUPLICATE_SUFFIX_RE = re.compile(r'-\d+$')
+_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+# format_note flags yt-dlp adds for streams that won't download reliably
+UNUSABLE_NOTE_FLAGS = ('MISSING POT', 'DAMAGED')
+
+
+def url_expiry(url):
+    """Unix time a signed googlevideo URL expires at, or None if it carries no expire="""
+    match = _EXPIRE_RE.search(url or '')
+    return int(match.group(1)) if match else None
+
+
+class FormatRecord:
+    """One downloadable format, stored as a tuple of FORMAT_FIELDS values
+
+    The format type and sort keys are computed once when the record is built;
+    fields are readable as attributes (record.height, record.url, ...). The JSON
+    encoding is cached so a format listed in several orderings is encoded once.
+    """
+
+    __slots__ = ('values', 'type', 'quality_key', 'video_key', 'audio_key', 'alternates', '_json')
+
+    def __init__(self, format_data):
+        self.values = values = tuple(map(format_data.get, FORMAT_FIELDS))
+        vcodec, acodec, _, quality, width, height, _, abr = values[6:14]
+        self.alternates = None
+        self._json = None
+
+        # Determine if it's video-only, audio-only, or combined
+        has_video = vcodec and vcodec != 'none'
+        has_audio = acodec and acodec != 'none'
+        if has_video and not has_audio:
+            self.type = 'video'
+        elif has_audio and not has_video:
+            self.type = 'audio'
+        else:
+            self.type = 'combined'
+
+        quality = quality or 0
+        self.quality_key = quality
+        self.video_key = (height or 0, width or 0, quality)
+        self.audio_key = (abr or 0, quality)
+
+    def to_dict(self, include_url=True):
+        """Response dict for this format; without include_url the signed URL is left out"""
+        format_obj = dict(zip(RESPONSE_KEYS, self.values))
+        # Include URL if available (for direct download links)
+        url = self.values[-1]
+        if url and include_url:
+            format_obj['url'] = url
+        format_obj['type'] = self.type
+        # Other clients' copies of the same stream, when asked for
+        if self.alternates:
+            format_obj['alternates'] = [alternate.to_dict(include_url) for alternate in self.alternates]
+        return format_obj
+
+    def stream_identity(self):
+        """Key shared by every player client's copy of the same stream"""
+        format_id, ext, _, format_note = self.values[:4]
+        note = ', '.join(
+            part for part in (format_note or '').split(', ')
+            if part not in UNUSABLE_NOTE_FLAGS
+        )
+        return (
+            _DUPLICATE_SUFFIX_RE.sub('', format_id or ''), ext, note, self.language,
+            self.vcodec, self.acodec, self.width, self.height, self.fps,
+        )
+
+    def usability(self):
+        """Sort key for picking between copies of a stream, most usable URL highest"""
+        format_note = self.format_note or ''
+        url = self.url
+        return (
+            bool(url),
+            not any(flag in format_note for flag in UNUSABLE_NOTE_FLAGS),
+            self.protocol in ('https', 'http'),
+            url_expiry(url) or 0,
+        )
+
+    def to_json(self):
+        """JSON encoding of to_dict(), computed on first use"""
+        if self._json is None:
+            self._json = _encode_json(self.to_dict())
+        return self._json
+
+
+def _field_property(index, field):
+    return property(lambda record: record.values[index], doc=f'The {field} reported by yt-dlp')
+
+
+for _index, _field in enumerate(FORMAT_FIELDS):
+    setattr(FormatRecord, _field, _field_property(_index, _field))
+del _index, _field
+
+
+def classify_formats(formats, deduplicate=True, keep_alternates=False):
+    """Build records for downloadable formats and return (all, video, audio) orderings
+
+    Every format is classified in a single pass; each list is then sorted once on its
+    precomputed key: all formats by quality, video and combined formats by resolution
+    then quality, audio and combined formats by bitrate then quality (best first).
+
+    yt-dlp queries several player clients, so the same stream often appears more than
+    once with a different signed URL. With deduplicate, copies are collapsed on
+    stream_identity() and the one with the most usable URL is kept; the others are
+    listed under its "alternates" when keep_alternates is set.
+    """
+    streams = {}
+    for format_data in formats:
+        # Include formats that have a URL (downloadable) or format_id
+        if not (format_data.get('url') or format_data.get('format_id')):
+            continue
+        record = FormatRecord(format_data)
+        if not deduplicate:
+            streams[len(streams)] = record
+            continue
+
+        identity = record.stream_identity()
+        kept = streams.setdefault(identity, record)
+        if kept is record:
+            continue
+        if record.usability() > kept.usability():
+            record.alternates, kept.alternates = (kept.alternates or []) + [kept], None
+            streams[identity] = record
+        else:
+            kept.alternates = (kept.alternates or []) + [record]
+
+    all_formats = []
+    video_formats = []
+    audio_formats = []
+
+    for record in streams.values():
+        if not keep_alternates:
+            record.alternates = None
+        all_formats.append(record)
+        if record.type != 'audio':
+            video_formats.append(record)
+        if record.type != 'video':
+            audio_formats.append(record)
+
+    all_formats.sort(key=attrgetter('quality_key'), reverse=True)
+    video_formats.sort(key=attrgetter('video_key'), reverse=True)
+    audio_formats.sort(key=attrgetter('audio_key'), reverse=True)
+    return all_formats, video_formats, audio_formats
+
+
+def encode_format_list(records, include_urls=True):
+    """JSON array of records, reusing each record's cached encoding"""
+    if not include_urls:
+        return _encode_json([record.to_dict(include_url=False) for record in records])
+    return '[' + ','.join([record.to_json() for record in records]) + ']'
+
+
+def encode_formats_response(response_fields, all_formats, video_formats, audio_formats, include_urls=True):
+    """Serialise an /api/formats response body from its fields and the three orderings"""
+    body = _encode_json(response_fields)
+    format_lists = (
+        '"formats":' + encode_format_list(all_formats, include_urls)  # All formats
+        + ',"videoFormats":' + encode_format_list(video_formats, include_urls)  # Video-only and combined formats
+        + ',"audioFormats":' + encode_format_list(audio_formats, include_urls)  # Audio-only and combined formats
+    )
+    if body == '{}':
+        return '{' + format_lists + '}'
+    return body[:-1] + ',' + format_lists + '}'
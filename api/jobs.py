@@ -0,0 +1,323 @@
+"""Background jobs for work bigger than one request: playlists, channels and batches
+
+A job expands into a list of items (video IDs) and then processes them one at a
+time on a pool of worker threads. Jobs, their progress and each item's result are
+kept in a SQLite database, so they're shared by every process on the host and
+outlive the process that ran them, and results can be read while the job is
+still running.
+
+While a job runs, its worker refreshes the job's heartbeat on a timer, also in
+the middle of a long expansion or item. A running job whose worker stopped
+sending heartbeats (the process died or was recycled) is claimed again by another worker, which skips the items that already
+have a result. Cancelling a running job takes effect before its next item.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+POLL_SECONDS = 2.0
+# Seconds between heartbeats of a running job
+HEARTBEAT_SECONDS = 30
+# A running job without a heartbeat for this long is taken over; several missed
+# heartbeats, so a busy database doesn't hand a live job to a second worker
+STALE_SECONDS = 300
+
+
+class JobError(Exception):
+    """A job can't be run as submitted (unknown type, bad parameters, nothing to expand)"""
+
+
+class JobStore:
+    """Jobs and their per-item results in a SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        db = self._connect()
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, state TEXT NOT NULL, '
+            'items TEXT, total INTEGER, done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, '
+            'error TEXT, cancel INTEGER NOT NULL DEFAULT 0, '
+            'created_at REAL NOT NULL, updated_at REAL NOT NULL, heartbeat_at REAL)'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS job_results ('
+            'job_id TEXT NOT NULL, idx INTEGER NOT NULL, item TEXT NOT NULL, ok INTEGER NOT NULL, '
+            'result TEXT NOT NULL, PRIMARY KEY (job_id, idx))'
+        )
+
+    def _connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def create(self, kind, params, items=None):
+        job_id = secrets.token_urlsafe(12)
+        now = time.time()
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, params, state, items, total, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params), 'queued', json.dumps(items) if items is not None else None,
+             len(items) if items is not None else None, now, now)
+        )
+        return job_id
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['items'] = json.loads(job['items']) if job['items'] is not None else None
+        return job
+
+    def claim(self):
+        """Mark the oldest queued (or abandoned) job running and return its ID, or None"""
+        db = self._connect()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE state = 'queued' OR (state = 'running' AND heartbeat_at < ?) "
+                'ORDER BY created_at LIMIT 1', (now - STALE_SECONDS,)
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET state = 'running', heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                    (now, now, row['id'])
+                )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return row['id'] if row is not None else None
+
+    def set_items(self, job_id, items):
+        now = time.time()
+        self._connect().execute(
+            'UPDATE jobs SET items = ?, total = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?',
+            (json.dumps(items), len(items), now, now, job_id)
+        )
+
+    def heartbeat(self, job_id):
+        self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND state = 'running'", (time.time(), job_id)
+        )
+
+    def completed_indexes(self, job_id):
+        rows = self._connect().execute('SELECT idx FROM job_results WHERE job_id = ?', (job_id,))
+        return {row['idx'] for row in rows}
+
+    def add_result(self, job_id, index, item, ok, result):
+        db = self._connect()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            inserted = db.execute(
+                'INSERT OR IGNORE INTO job_results (job_id, idx, item, ok, result) VALUES (?, ?, ?, ?, ?)',
+                (job_id, index, item, int(ok), json.dumps(result))
+            ).rowcount
+            db.execute(
+                'UPDATE jobs SET done = done + ?, failed = failed + ?, heartbeat_at = ?, updated_at = ? WHERE id = ?',
+                (inserted, inserted if not ok else 0, now, now, job_id)
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def cancel_requested(self, job_id):
+        row = self._connect().execute('SELECT cancel FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row is None or bool(row['cancel'])
+
+    def request_cancel(self, job_id):
+        """Cancel a queued job now, or a running one before its next item; False if it already finished"""
+        db = self._connect()
+        now = time.time()
+        if db.execute(
+            "UPDATE jobs SET state = 'cancelled', cancel = 1, updated_at = ? WHERE id = ? AND state = 'queued'",
+            (now, job_id)
+        ).rowcount > 0:
+            return True
+        # A job that was already cancelled counts as finished, so a second cancel is refused too
+        return db.execute(
+            "UPDATE jobs SET cancel = 1, updated_at = ? WHERE id = ? AND state = 'running'", (now, job_id)
+        ).rowcount > 0
+
+    def finish(self, job_id, state, error=None):
+        """Move a running job to its final state; False if it already left 'running' (e.g. was cancelled)"""
+        return self._connect().execute(
+            "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ? AND state = 'running'",
+            (state, error, time.time(), job_id)
+        ).rowcount > 0
+
+    def results(self, job_id, after=-1, limit=100):
+        """Results with an index above after, in item order: (index, item, ok, result)"""
+        rows = self._connect().execute(
+            'SELECT idx, item, ok, result FROM job_results WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?',
+            (job_id, after, limit)
+        )
+        return [(row['idx'], row['item'], bool(row['ok']), json.loads(row['result'])) for row in rows]
+
+    def prune(self, max_age):
+        """Delete finished jobs, and their results, not updated for max_age seconds"""
+        db = self._connect()
+        cutoff = time.time() - max_age
+        expired = [
+            (row['id'],) for row in db.execute(
+                "SELECT id FROM jobs WHERE state IN ('done', 'failed', 'cancelled') AND updated_at < ?", (cutoff,)
+            )
+        ]
+        if expired:
+            db.executemany('DELETE FROM job_results WHERE job_id = ?', expired)
+            db.executemany('DELETE FROM jobs WHERE id = ?', expired)
+
+    def counts(self):
+        rows = self._connect().execute('SELECT state, COUNT(*) AS count FROM jobs GROUP BY state')
+        return {row['state']: row['count'] for row in rows}
+
+
+class JobQueue:
+    """Runs the jobs in a JobStore on worker threads
+
+    kinds maps a job type to (expand, process): expand(params) returns the job's
+    items, and process(params, item) returns the item's JSON-serialisable result
+    or raises. Jobs get at most max_items items.
+    """
+
+    def __init__(self, store, kinds, workers=2, max_items=500, max_age=86400):
+        self.store = store
+        self.kinds = kinds
+        self.workers = workers
+        self.max_items = max_items
+        self.max_age = max_age
+        self.pid = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.items_processed = 0
+        self.items_failed = 0
+
+    def ensure_started(self):
+        """Start the worker threads in this process (threads don't survive a pre-fork)"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            for _ in range(self.workers):
+                threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, kind, params, items=None):
+        """Queue a job and return its ID; items can be given when they're known up front"""
+        if kind not in self.kinds:
+            raise JobError(f'Unknown job type {kind!r}; expected one of: {", ".join(self.kinds)}')
+        if items is not None:
+            if not items:
+                raise JobError('The job has no items')
+            items = items[:self.max_items]
+        self.store.prune(self.max_age)
+        job_id = self.store.create(kind, params, items)
+        self.ensure_started()
+        self.wake.set()
+        return job_id
+
+    def cancel(self, job_id):
+        return self.store.request_cancel(job_id)
+
+    def _run(self):
+        while True:
+            try:
+                job_id = self.store.claim()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job queue error: {e}")
+                job_id = None
+            if job_id is None:
+                self.wake.wait(POLL_SECONDS)
+                self.wake.clear()
+                continue
+            try:
+                with self._heartbeats(job_id):
+                    self._execute(job_id)
+            except Exception as e:
+                print(f"⚠️ Job {job_id} failed: {e}")
+                self.store.finish(job_id, 'failed', str(e))
+
+    @contextmanager
+    def _heartbeats(self, job_id):
+        """Refresh job_id's heartbeat every HEARTBEAT_SECONDS until the block ends"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(HEARTBEAT_SECONDS):
+                try:
+                    self.store.heartbeat(job_id)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Job {job_id} heartbeat failed: {e}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _execute(self, job_id):
+        job = self.store.get(job_id)
+        expand, process = self.kinds[job['kind']]
+        params = job['params']
+        items = job['items']
+        if items is None:
+            try:
+                items = expand(params)[:self.max_items]
+            except Exception as e:
+                self.store.finish(job_id, 'failed', str(e))
+                return
+            self.store.set_items(job_id, items)
+            print(f"🔄 Job {job_id} ({job['kind']}): {len(items)} items")
+
+        completed = self.store.completed_indexes(job_id)
+        for index, item in enumerate(items):
+            if index in completed:
+                continue
+            if self.store.cancel_requested(job_id):
+                self.store.finish(job_id, 'cancelled')
+                return
+            try:
+                result, ok = process(params, item), True
+            except Exception as e:
+                result, ok = {'error': str(e)}, False
+            self.store.add_result(job_id, index, item, ok, result)
+            with self.lock:
+                self.items_processed += 1
+                self.items_failed += not ok
+        if self.store.finish(job_id, 'done'):
+            print(f"✅ Job {job_id} finished")
+
+    def stats(self):
+        try:
+            jobs = self.store.counts()
+        except sqlite3.Error:
+            jobs = None
+        return {
+            'workers': self.workers if self.pid == os.getpid() else 0,
+            'jobs': jobs,
+            'items_processed': self.items_processed,
+            'items_failed': self.items_failed,
+        }
@@ -0,0 +1,274 @@
+"""Fan-out proxy for live HLS streams
+
+Each live format's media playlist is fetched from YouTube at most once per poll
+interval, however many viewers are watching, and every new segment is fetched
+once, as soon as it appears, into a ring buffer of recent segments. Viewers get
+the playlist trimmed to the newest segments, with segment URIs rewritten to point
+at us, so N viewers cost one upstream fetch per segment.
+
+Polling is driven by viewers: a playlist older than its poll interval is
+refreshed by the first request that sees it, so a stream nobody is watching
+costs nothing, and it's dropped after idle_timeout. At most max_streams are kept;
+opening one more drops the one requested least recently.
+
+Streams are per process, so a segment request can reach a process that never
+served the playlist, or one whose playlist is behind the viewer's. The stream
+is then opened there, or its playlist refreshed, and a segment still listed
+upstream but outside the ring is fetched for that request alone.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin
+
+import media_proxy
+
+LIVE_WINDOW_SEGMENTS = 6  # Segments listed in the playlist served to viewers
+LIVE_RING_SEGMENTS = 12  # Segments kept, so slow viewers can still fetch ones just dropped from the playlist
+LIVE_IDLE_TIMEOUT = 120
+LIVE_MAX_STREAMS = 50  # Streams kept per process, each holding up to LIVE_RING_SEGMENTS segments
+SEGMENT_WAIT_SECONDS = 20
+MIN_POLL_SECONDS = 1.0
+
+_URI_ATTRIBUTE_RE = re.compile(r'URI="([^"]*)"')
+
+# Tags that apply to the segment URI following them
+_SEGMENT_TAGS = ('#EXTINF', '#EXT-X-PROGRAM-DATE-TIME', '#EXT-X-DISCONTINUITY', '#EXT-X-BYTERANGE', '#EXT-X-GAP')
+
+
+class LiveError(Exception):
+    """The stream can't be proxied (not a media playlist, or a segment fetch failed)"""
+
+
+def parse_media_playlist(text, playlist_url):
+    """(header lines, [(sequence, tag lines, segment URL)], target duration, ended)"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise LiveError('Upstream did not return an HLS playlist')
+
+    header, segments, pending = [], [], []
+    sequence, target_duration, ended = 0, None, False
+    for line in lines:
+        if line.startswith('#EXT-X-STREAM-INF'):
+            raise LiveError('This is a master playlist; pick a single live format')
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+            continue
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line.split(':', 1)[1])
+        elif line == '#EXT-X-ENDLIST':
+            ended = True
+            continue
+
+        if line.startswith('#'):
+            # Keys and init sections stay upstream; their URIs just need to be absolute
+            line = _URI_ATTRIBUTE_RE.sub(lambda match: f'URI="{urljoin(playlist_url, match.group(1))}"', line)
+            (pending if line.startswith(_SEGMENT_TAGS) else header if not segments else pending).append(line)
+        else:
+            segments.append((sequence, pending, urljoin(playlist_url, line)))
+            sequence += 1
+            pending = []
+    return header, segments, target_duration, ended
+
+
+class _Segment:
+    def __init__(self, sequence, url):
+        self.sequence = sequence
+        self.url = url
+        self.data = None
+        self.content_type = None
+        self.error = None
+        self.ready = threading.Event()
+
+
+class LiveStream:
+    """One live format: its rewritten playlist and a ring buffer of recent segments
+
+    get_playlist_url() returns the current upstream playlist URL (re-resolved when
+    the signed URL expires); segment URIs in the served playlist are
+    '<segment_path>/<media sequence number>'.
+    """
+
+    def __init__(self, get_playlist_url, segment_path, window=LIVE_WINDOW_SEGMENTS, ring=LIVE_RING_SEGMENTS):
+        self.get_playlist_url = get_playlist_url
+        self.segment_path = segment_path
+        self.window = window
+        self.ring = max(ring, window)
+        self.segments = OrderedDict()  # sequence -> _Segment, oldest first
+        self.listed = {}  # sequence -> URL of every segment in the last upstream playlist
+        self.newest = -1
+        self.text = None
+        self.next_poll = 0
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+        self.playlist_fetches = 0
+        self.segment_fetches = 0
+        self.segment_hits = 0
+        self.direct_fetches = 0
+
+    def playlist(self):
+        """Rewritten playlist, refreshed from upstream when older than the poll interval"""
+        self.last_access = time.monotonic()
+        if self.text is not None and time.monotonic() < self.next_poll:
+            return self.text
+        # One request refreshes; the others keep serving the current playlist meanwhile
+        if not self.refresh_lock.acquire(blocking=self.text is None):
+            return self.text
+        try:
+            if self.text is None or time.monotonic() >= self.next_poll:
+                self._refresh()
+        finally:
+            self.refresh_lock.release()
+        return self.text
+
+    def _refresh(self):
+        playlist_url = self.get_playlist_url()
+        upstream = media_proxy.open_upstream(playlist_url)
+        try:
+            if upstream.status_code not in (200, 206):
+                raise LiveError(f'Upstream returned {upstream.status_code} for the playlist')
+            text = upstream.read().decode('utf-8', 'replace')
+        finally:
+            upstream.close()
+        self.playlist_fetches += 1
+
+        header, listed, target_duration, ended = parse_media_playlist(text, playlist_url)
+        segments = listed[-self.window:]
+        changed = bool(segments) and segments[-1][0] > self.newest
+        with self.lock:
+            self.listed = {sequence: segment_url for sequence, _, segment_url in listed}
+            for sequence, _, segment_url in segments:
+                if sequence > self.newest:
+                    segment = _Segment(sequence, segment_url)
+                    self.segments[sequence] = segment
+                    self.newest = sequence
+                    threading.Thread(target=self._fetch, args=(segment,), daemon=True).start()
+            while len(self.segments) > self.ring:
+                self.segments.popitem(last=False)
+
+        lines = list(header)
+        if segments:
+            lines.insert(1, f'#EXT-X-MEDIA-SEQUENCE:{segments[0][0]}')
+        for sequence, tags, _ in segments:
+            lines.extend(tags)
+            lines.append(f'{self.segment_path}/{sequence}')
+        if ended:
+            lines.append('#EXT-X-ENDLIST')
+        self.text = '\n'.join(lines) + '\n'
+
+        # Reload after a target duration, or half of one when nothing changed (RFC 8216 6.3.4)
+        interval = target_duration or 2 * MIN_POLL_SECONDS
+        if not changed:
+            interval /= 2
+        self.next_poll = float('inf') if ended else time.monotonic() + max(MIN_POLL_SECONDS, interval)
+
+    def _fetch(self, segment):
+        for attempt in range(media_proxy.SEGMENT_RETRIES):
+            try:
+                upstream = media_proxy.open_upstream(segment.url)
+                try:
+                    if upstream.status_code not in (200, 206):
+                        raise LiveError(f'Upstream returned {upstream.status_code} for segment {segment.sequence}')
+                    segment.data = upstream.read()
+                    segment.content_type = upstream.headers.get('Content-Type', 'video/mp2t')
+                finally:
+                    upstream.close()
+                with self.lock:
+                    self.segment_fetches += 1
+                break
+            except (LiveError, *media_proxy.UPSTREAM_ERRORS) as e:
+                segment.error = str(e)
+        if segment.data is None:
+            print(f"⚠️ Live segment {segment.sequence} failed: {segment.error}")
+        segment.ready.set()
+
+    def get_segment(self, sequence):
+        """(data, content type) of a segment, waiting for it to arrive; None if it's no longer listed
+
+        Segments newer than the playlist this process has seen refresh it first;
+        listed ones outside the ring are fetched without being kept.
+        """
+        self.last_access = time.monotonic()
+        with self.lock:
+            segment = self.segments.get(sequence)
+        if segment is None and sequence > self.newest:
+            self.playlist()
+            with self.lock:
+                segment = self.segments.get(sequence)
+        if segment is None:
+            with self.lock:
+                segment_url = self.listed.get(sequence)
+                self.direct_fetches += segment_url is not None
+            if segment_url is None:
+                return None
+            segment = _Segment(sequence, segment_url)
+            self._fetch(segment)
+        if not segment.ready.wait(SEGMENT_WAIT_SECONDS):
+            raise LiveError(f'Segment {sequence} is taking too long')
+        if segment.data is None:
+            raise LiveError(f'Segment {sequence} failed: {segment.error}')
+        with self.lock:
+            self.segment_hits += 1
+        return segment.data, segment.content_type
+
+
+class LiveProxy:
+    """The live streams being proxied by this process, keyed by video and format"""
+
+    def __init__(self, window=LIVE_WINDOW_SEGMENTS, ring=LIVE_RING_SEGMENTS, idle_timeout=LIVE_IDLE_TIMEOUT,
+                 max_streams=LIVE_MAX_STREAMS):
+        self.window = window
+        self.ring = ring
+        self.idle_timeout = idle_timeout
+        self.max_streams = max(1, max_streams)
+        self.streams = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _prune(self):
+        """Drop streams nobody has requested for idle_timeout (called with the lock held)"""
+        cutoff = time.monotonic() - self.idle_timeout
+        for key in [key for key, stream in self.streams.items() if stream.last_access < cutoff]:
+            del self.streams[key]
+            self.evictions += 1
+
+    def get_stream(self, key, get_playlist_url, segment_path):
+        with self.lock:
+            self._prune()
+            stream = self.streams.get(key)
+            if stream is None:
+                while len(self.streams) >= self.max_streams:
+                    oldest = min(self.streams, key=lambda other: self.streams[other].last_access)
+                    print(f"⚠️ Live stream limit of {self.max_streams} reached, dropping {oldest}")
+                    del self.streams[oldest]
+                    self.evictions += 1
+                stream = self.streams[key] = LiveStream(get_playlist_url, segment_path, self.window, self.ring)
+            return stream
+
+    def find_stream(self, key):
+        with self.lock:
+            return self.streams.get(key)
+
+    def stats(self):
+        with self.lock:
+            streams = list(self.streams.values())
+        playlist_fetches = sum(stream.playlist_fetches for stream in streams)
+        segment_fetches = sum(stream.segment_fetches for stream in streams)
+        segment_hits = sum(stream.segment_hits for stream in streams)
+        direct_fetches = sum(stream.direct_fetches for stream in streams)
+        return {
+            'streams': len(streams),
+            'max_streams': self.max_streams,
+            'evictions': self.evictions,
+            'playlist_fetches': playlist_fetches,
+            'segment_fetches': segment_fetches,
+            'segments_served': segment_hits,
+            'direct_fetches': direct_fetches,
+            'fan_out': round(segment_hits / segment_fetches, 2) if segment_fetches else None,
+            'buffered_bytes': sum(
+                len(segment.data) for stream in streams for segment in list(stream.segments.values()) if segment.data),
+        }
@@ -0,0 +1,475 @@
+"""Disk cache of proxied media bytes for /api/download
+
+Media is cached in fixed-size segments (aligned byte ranges of one format), keyed
+by video ID and itag, in a local directory:
+
+    <directory>/<video id>-<itag>/meta.json     size, content type and validators
+    <directory>/<video id>-<itag>/<index>.seg   bytes index * segment_bytes onwards
+
+A missing segment is fetched by a single background fill into a .part file, and
+every download that needs it follows the file as it grows, so concurrent
+downloads of a trending video cost one upstream fetch per segment. The .part file
+is created exclusively, so this holds across the workers on a host: a worker
+that finds another's .part file follows it instead of starting a fill. Completed
+segments are served from the page cache: a response that fits in one segment is
+handed to the WSGI server as a file (sent with sendfile by gunicorn), longer ones
+are read through mmap.
+
+Eviction is LRU by file mtime (serving a segment touches it), so every worker on
+the host shares one order and one byte budget.
+"""
+
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import media_proxy
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+READ_CHUNK_SIZE = media_proxy.DOWNLOAD_CHUNK_SIZE
+STALE_PART_SECONDS = 3600  # .part files left behind by a crashed worker are removed after this
+# A .part file of another worker that hasn't grown for this long is abandoned: its
+# readers fail, and the next download fills the segment again. Above the time a fill
+# can spend retrying a stalled upstream.
+STALLED_FILL_SECONDS = 120
+FOLLOW_POLL_SECONDS = 0.05
+
+_UNSAFE_KEY_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def get_media_key(url, video_id=None):
+    """'<video id>-<itag>' for a googlevideo URL, or None when it can't be identified
+
+    googlevideo URLs carry the itag and their own id= for the video, which is
+    covered by the URL's signature. Pass the YouTube video ID only for URLs the
+    server resolved itself: one from a client could be for a different video.
+    """
+    query = parse_qs(urlparse(url).query)
+    itag = (query.get('itag') or [None])[0]
+    video_id = video_id or (query.get('id') or [None])[0]
+    if not itag or not video_id:
+        return None
+    return _UNSAFE_KEY_RE.sub('_', f'{video_id}-{itag}')
+
+
+class SegmentFile:
+    """A byte range of a completed segment, readable as a file
+
+    Servers with a wsgi.file_wrapper that uses sendfile (gunicorn) send it from the
+    current offset for Content-Length bytes without copying it through Python.
+    """
+
+    def __init__(self, path, offset, length):
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class _Fill:
+    """A segment being fetched into its .part file, which readers follow as it grows
+
+    The fill that creates the .part file fetches the segment; when another worker
+    already has, file is None and the fill follows that worker's file instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.part_path = f'{path}.part'
+        self.file = None
+        try:
+            self.file = open(self.part_path, 'xb', buffering=0)
+        except FileExistsError:
+            try:
+                abandoned = time.time() - os.path.getmtime(self.part_path) > STALLED_FILL_SECONDS
+            except FileNotFoundError:
+                abandoned = True  # Finished or failed meanwhile
+            if abandoned:
+                try:
+                    os.unlink(self.part_path)
+                except FileNotFoundError:
+                    pass
+                try:
+                    self.file = open(self.part_path, 'xb', buffering=0)
+                except FileExistsError:
+                    pass
+        self.written = 0
+        self.headers = None  # Upstream headers once the first response arrives; meta.json when following
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def wait_for_headers(self):
+        """Wait until the segment's upstream response (or another worker's meta.json) describes it"""
+        with self.condition:
+            while self.headers is None and self.error is None and not self.done:
+                self.condition.wait(1)
+            if self.error is not None:
+                raise self.error
+
+    def open(self):
+        """The file to read from; the .part file is renamed once complete"""
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+            done = self.done
+        try:
+            return open(self.path if done else self.part_path, 'rb')
+        except FileNotFoundError:
+            # Renamed since
+            return open(self.path, 'rb')
+
+    def wait_for(self, position):
+        """Bytes written so far, once there are more than position"""
+        with self.condition:
+            while self.written <= position and not self.done and self.error is None:
+                self.condition.wait(1)
+            if self.written <= position:
+                raise self.error or media_proxy.SegmentFetchError(f'Segment ended at {self.written} bytes')
+            return self.written
+
+
+class MediaCache:
+    """Byte-size-bounded disk cache of media segments, shared by the workers on a host"""
+
+    def __init__(self, directory, max_bytes, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fills = {}  # Segment path -> _Fill in progress in this process
+        self.lock = threading.Lock()
+        self.evict_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.evictions = 0
+        self.size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._evict(remove_stale_parts=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _segment_path(self, key, index):
+        return os.path.join(self.directory, key, f'{index:06d}.seg')
+
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, headers):
+        content_range = media_proxy.parse_content_range(headers.get('Content-Range'))
+        meta = {
+            'size': content_range[2],
+            'content_type': headers.get('Content-Type', 'application/octet-stream'),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        path = os.path.join(self._entry_dir(key), 'meta.json')
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, path)
+        return meta
+
+    def _get_fill(self, url, key, index):
+        """The fill for a segment, started if needed; None once the segment is on disk"""
+        path = self._segment_path(key, index)
+        with self.lock:
+            if os.path.exists(path):
+                return None
+            fill = self.fills.get(path)
+            if fill is None:
+                os.makedirs(self._entry_dir(key), exist_ok=True)
+                fill = _Fill(path)
+                self.fills[path] = fill
+                if fill.file is None:
+                    threading.Thread(target=self._follow_fill, args=(fill, key), daemon=True).start()
+                else:
+                    self.misses += 1
+                    first = index * self.segment_bytes
+                    threading.Thread(
+                        target=self._run_fill, args=(fill, url, key, first, first + self.segment_bytes - 1), daemon=True
+                    ).start()
+            return fill
+
+    def _run_fill(self, fill, url, key, first, last):
+        try:
+            with fill.file:
+                for attempt in range(media_proxy.SEGMENT_RETRIES):
+                    try:
+                        self._fetch_segment(fill, url, key, first, last)
+                        break
+                    except (media_proxy.SegmentFetchError, *media_proxy.UPSTREAM_ERRORS):
+                        if attempt == media_proxy.SEGMENT_RETRIES - 1:
+                            raise
+            os.replace(fill.part_path, fill.path)
+            with fill.condition:
+                fill.done = True
+                fill.condition.notify_all()
+        except Exception as e:
+            print(f"⚠️ Media cache fill failed for {os.path.basename(os.path.dirname(fill.path))}: {e}")
+            with fill.condition:
+                fill.error = e if isinstance(e, media_proxy.SegmentFetchError) else media_proxy.SegmentFetchError(str(e))
+                fill.condition.notify_all()
+            try:
+                os.unlink(fill.part_path)
+            except OSError:
+                pass
+        finally:
+            with self.lock:
+                self.fills.pop(fill.path, None)
+        if fill.done:
+            self._evict()
+
+    def _follow_fill(self, fill, key):
+        """Track a segment another worker is filling until it's renamed into place or abandoned"""
+        changed = time.monotonic()
+        try:
+            while True:
+                if fill.headers is None:
+                    meta = self._read_meta(key)
+                    if meta is not None:
+                        with fill.condition:
+                            fill.headers = meta
+                            fill.condition.notify_all()
+                try:
+                    written = os.path.getsize(fill.part_path)
+                except FileNotFoundError:
+                    if not os.path.exists(fill.path):
+                        raise media_proxy.SegmentFetchError('The fill in another worker failed')
+                    with fill.condition:
+                        fill.written = os.path.getsize(fill.path)
+                        fill.done = True
+                        fill.condition.notify_all()
+                    return
+                if written != fill.written:
+                    changed = time.monotonic()
+                    with fill.condition:
+                        fill.written = written
+                        fill.condition.notify_all()
+                elif time.monotonic() - changed > STALLED_FILL_SECONDS:
+                    raise media_proxy.SegmentFetchError('The fill in another worker stalled')
+                time.sleep(FOLLOW_POLL_SECONDS)
+        except (OSError, media_proxy.SegmentFetchError) as e:
+            with fill.condition:
+                fill.error = e if isinstance(e, media_proxy.SegmentFetchError) else media_proxy.SegmentFetchError(str(e))
+                fill.condition.notify_all()
+        finally:
+            with self.lock:
+                self.fills.pop(fill.path, None)
+
+    def _fetch_segment(self, fill, url, key, first, last):
+        """Fetch the rest of a segment, resuming after the bytes already written"""
+        offset = first + fill.written
+        upstream = media_proxy.open_upstream(url, f'bytes={offset}-{last}')
+        try:
+            content_range = media_proxy.parse_content_range(upstream.headers.get('Content-Range'))
+            if upstream.status_code != 206 or not content_range or content_range[0] != offset or content_range[2] is None:
+                raise media_proxy.SegmentFetchError(f'Unexpected response {upstream.status_code} for bytes {offset}-{last}')
+            if fill.headers is None:
+                # Written here, not by the download that asked, so workers following this fill find it
+                self._write_meta(key, upstream.headers)
+                with fill.condition:
+                    fill.headers = upstream.headers
+                    fill.condition.notify_all()
+            length = min(last, content_range[2] - 1) - first + 1
+            for chunk in upstream.iter_chunks(READ_CHUNK_SIZE):
+                fill.file.write(chunk)
+                with fill.condition:
+                    fill.written += len(chunk)
+                    fill.condition.notify_all()
+        finally:
+            upstream.close()
+        if fill.written != length:
+            raise media_proxy.SegmentFetchError(f'Short read for bytes {offset}-{last}')
+
+    def _read_segment(self, path, start, end):
+        """Yield bytes start..end of a completed segment through mmap"""
+        with open(path, 'rb') as f:
+            segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        os.utime(path)
+        with self.lock:
+            self.hits += 1
+        try:
+            for position in range(start, end + 1, READ_CHUNK_SIZE):
+                data = segment[position:min(position + READ_CHUNK_SIZE, end + 1)]
+                with self.lock:
+                    self.bytes_served += len(data)
+                yield data
+        finally:
+            segment.close()
+
+    def _read_fill(self, fill, start, end):
+        """Yield bytes start..end of a segment as its fill writes them"""
+        with fill.open() as f:
+            position = start
+            while position <= end:
+                available = fill.wait_for(position)
+                data = os.pread(f.fileno(), min(READ_CHUNK_SIZE, available - position, end - position + 1), position)
+                position += len(data)
+                yield data
+
+    def _iter_range(self, url, key, first, last):
+        last_index = last // self.segment_bytes
+        for index in range(first // self.segment_bytes, last_index + 1):
+            segment_first = index * self.segment_bytes
+            start = max(first, segment_first) - segment_first
+            end = min(last, segment_first + self.segment_bytes - 1) - segment_first
+            if index < last_index:
+                # Fetch one segment ahead of the client
+                self._get_fill(url, key, index + 1)
+
+            path = self._segment_path(key, index)
+            fill = None
+            if not os.path.exists(path):
+                fill = self._get_fill(url, key, index)
+            try:
+                if fill is None:
+                    yield from self._read_segment(path, start, end)
+                    continue
+            except FileNotFoundError:
+                # Evicted since: fetch it again
+                fill = self._get_fill(url, key, index)
+                if fill is None:
+                    raise
+            yield from self._read_fill(fill, start, end)
+
+    def open_download(self, url, key, client_range=None, if_range=None):
+        """(status, headers, body) for a download served through the cache, or None
+
+        None means the request should go to upstream as usual: multi-range requests,
+        an If-Range that doesn't match the cached validator, and anything the first
+        segment fetch can't describe (such as a 416 or a format without a length).
+        """
+        requested = media_proxy.parse_range(client_range) if client_range else (0, None)
+        if requested is None:
+            return None
+        first, last = requested
+
+        meta = self._read_meta(key)
+        clen = (parse_qs(urlparse(url).query).get('clen') or [None])[0]
+        if meta and clen and clen.isdigit() and int(clen) != meta['size']:
+            # The format changed since it was cached
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            meta = None
+        if meta is None:
+            fill = self._get_fill(url, key, first // self.segment_bytes)
+            if fill is None:
+                return None
+            try:
+                fill.wait_for_headers()
+            except media_proxy.SegmentFetchError:
+                return None
+            meta = self._read_meta(key)
+            if meta is None:
+                return None
+        if if_range and if_range != meta.get('etag'):
+            return None
+
+        size = meta['size']
+        if first >= size:
+            return 416, {'Content-Range': f'bytes */{size}', 'Content-Length': '0'}, iter([])
+        last = size - 1 if last is None else min(last, size - 1)
+
+        headers = {'Content-Type': meta['content_type'], 'Accept-Ranges': 'bytes', 'Content-Length': str(last - first + 1)}
+        for name, field in (('ETag', 'etag'), ('Last-Modified', 'last_modified')):
+            if meta.get(field):
+                headers[name] = meta[field]
+        status = 200
+        if client_range:
+            status = 206
+            headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+
+        indexes = range(first // self.segment_bytes, last // self.segment_bytes + 1)
+        cached = all(os.path.exists(self._segment_path(key, index)) for index in indexes)
+        headers['X-Cache'] = 'HIT' if cached else 'MISS'
+        if cached and len(indexes) == 1:
+            path = self._segment_path(key, indexes[0])
+            try:
+                body = SegmentFile(path, first - indexes[0] * self.segment_bytes, last - first + 1)
+                os.utime(path)
+                with self.lock:
+                    self.hits += 1
+                    self.bytes_served += last - first + 1
+                return status, headers, body
+            except FileNotFoundError:
+                pass
+        return status, headers, self._iter_range(url, key, first, last)
+
+    def _evict(self, remove_stale_parts=False):
+        """Delete the least recently used segments while the cache is over max_bytes"""
+        with self.evict_lock:
+            segments = []
+            now = time.time()
+            for entry in os.scandir(self.directory):
+                if not entry.is_dir():
+                    continue
+                for item in os.scandir(entry.path):
+                    try:
+                        stat = item.stat()
+                        if item.name.endswith('.seg'):
+                            segments.append((stat.st_mtime, item.path, stat.st_size))
+                        elif remove_stale_parts and item.name.endswith('.part') and now - stat.st_mtime > STALE_PART_SECONDS:
+                            os.unlink(item.path)
+                    except FileNotFoundError:
+                        pass  # Removed by another worker meanwhile
+
+            total = sum(size for _, _, size in segments)
+            if total > self.max_bytes:
+                # Evict down to 90% so eviction doesn't run on every fill
+                segments.sort()
+                emptied = set()
+                for _, path, size in segments:
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    try:
+                        os.unlink(path)
+                        self.evictions += 1
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    emptied.add(os.path.dirname(path))
+                for entry_dir in emptied:
+                    try:
+                        if not any(name.endswith(('.seg', '.part')) for name in os.listdir(entry_dir)):
+                            shutil.rmtree(entry_dir, ignore_errors=True)
+                    except FileNotFoundError:
+                        pass
+            self.size = total
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'segment_hits': self.hits,
+                'segment_misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'bytes_served': self.bytes_served,
+                'fills_in_progress': len(self.fills),
+                'evictions': self.evictions,
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,350 @@
+"""Streaming proxy for googlevideo media used by /api/download
+
+Bodies are relayed chunk by chunk without buffering; Range and If-Range pass
+through in both directions so clients can resume interrupted downloads.
+
+googlevideo throttles each connection well below line rate, so in segmented mode
+a download is split into byte ranges fetched over several connections at once
+(SegmentedDownload) and reassembled in order.
+"""
+
+import http.client
+import re
+import threading
+import time
+from urllib.parse import quote, urljoin, urlparse
+
+from upstream_pool import ConnectionPool
+
+# Only signed media URLs are proxied, never arbitrary hosts
+MEDIA_HOST_SUFFIXES = ('.googlevideo.com',)
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+MAX_REDIRECTS = 3
+
+UPSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    # Media is relayed byte for byte, so it must not be content-encoded
+    'Accept-Encoding': 'identity',
+}
+
+# Upstream response headers passed on to the client
+PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+# Segmented mode: connections per download, segment sizes and the reorder buffer bound
+SEGMENT_MIN_CONNECTIONS = 2
+SEGMENT_MAX_CONNECTIONS = 8
+SEGMENT_MIN_BYTES = 256 * 1024
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+SEGMENT_TARGET_SECONDS = 2.0  # Segment size aims for this long on one connection
+SEGMENT_EPOCH_SECONDS = 1.0  # The connection count is reconsidered this often
+SEGMENT_BUFFER_BYTES = 32 * 1024 * 1024
+SEGMENT_RETRIES = 3
+
+_CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+_RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)')
+_UNSAFE_FILENAME_RE = re.compile(r'[\x00-\x1f"\\/]')
+
+# Upstream connections are kept alive and shared by every download and segment fetch
+POOL = ConnectionPool(max_per_host=16, idle_timeout=30, connect_timeout=10, read_timeout=30)
+
+# Outbound proxies (a proxy_pool.ProxyPool) when the app has them configured: media URLs
+# are fetched through the proxy they were extracted through
+PROXIES = None
+
+# Errors from an upstream fetch
+UPSTREAM_ERRORS = (OSError, http.client.HTTPException)
+
+
+def is_allowed_media_url(url):
+    """Whether url is an https URL on a googlevideo host"""
+    parsed = urlparse(url or '')
+    return parsed.scheme == 'https' and bool(parsed.hostname) and parsed.hostname.endswith(MEDIA_HOST_SUFFIXES)
+
+
+def parse_content_range(value):
+    """(first, last, total or None) from a Content-Range header, or None"""
+    match = _CONTENT_RANGE_RE.fullmatch((value or '').strip())
+    if not match:
+        return None
+    first, last, total = match.groups()
+    return int(first), int(last), None if total == '*' else int(total)
+
+
+def parse_range(value):
+    """(first, last or None) of a single-range Range header, or None"""
+    match = _RANGE_RE.fullmatch((value or '').strip())
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+
+def open_upstream(url, range_header=None, if_range=None):
+    """Start fetching url, streaming; the caller must close the response
+
+    Without a client Range the whole body is requested as bytes=0-, which
+    googlevideo serves more reliably than a plain GET.
+    """
+    headers = dict(UPSTREAM_HEADERS)
+    headers['Range'] = range_header or 'bytes=0-'
+    if if_range and range_header:
+        headers['If-Range'] = if_range
+    # Redirects stay on googlevideo and keep the ip= they were signed for
+    proxy = PROXIES.media_proxy(url) if PROXIES is not None else None
+
+    for _ in range(MAX_REDIRECTS):
+        upstream = POOL.request('GET', url, headers, proxy)
+        location = upstream.headers.get('Location')
+        if upstream.status_code not in (301, 302, 303, 307, 308) or not location:
+            return upstream
+        upstream.close()
+        # googlevideo redirects between its own hosts; anything else is refused
+        url = urljoin(url, location)
+        if not is_allowed_media_url(url):
+            raise http.client.HTTPException(f'Refusing redirect to {urlparse(url).hostname}')
+    return POOL.request('GET', url, headers, proxy)
+
+
+def iter_upstream(upstream, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Yield the upstream body in chunks of up to chunk_size bytes
+
+    The WSGI server closes this generator when the client disconnects, which
+    closes the upstream connection instead of downloading the rest of the file.
+    """
+    try:
+        yield from upstream.iter_chunks(chunk_size)
+    finally:
+        upstream.close()
+
+
+def get_download_headers(upstream, client_range):
+    """Status code and headers to send the client for an upstream media response"""
+    status = upstream.status_code
+    headers = {name: upstream.headers[name] for name in PASSTHROUGH_HEADERS if name in upstream.headers}
+    headers.setdefault('Accept-Ranges', 'bytes')
+
+    if status == 206 and not client_range:
+        # The client asked for the whole file; our own bytes=0- range covers all of it
+        content_range = parse_content_range(headers.pop('Content-Range', None))
+        if content_range and content_range[2] is not None:
+            headers['Content-Length'] = str(content_range[2])
+        status = 200
+    return status, headers
+
+
+def content_disposition(filename):
+    """attachment header with an ASCII fallback and the UTF-8 filename (RFC 6266)"""
+    filename = _UNSAFE_FILENAME_RE.sub('_', filename or 'video.mp4')
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('?', '_')
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+
+
+class SegmentFetchError(Exception):
+    """A segment couldn't be fetched after retries"""
+
+
+class SegmentedDownload:
+    """Fetches bytes first..last of url over several connections and yields them in order
+
+    Workers claim consecutive segments and fetch them with Range requests; finished
+    segments wait in a reorder buffer until everything before them has been sent.
+    Workers stop claiming while the buffer holds buffer_bytes ahead of the client,
+    so memory stays bounded however slow the client is.
+
+    Segment size follows the observed per-connection rate (about target_seconds of
+    transfer each). The connection count hill-climbs: while adding a connection
+    raises the aggregate rate by over 10% another is added, and when the rate drops
+    one is retired.
+    """
+
+    def __init__(self, url, first, last, head=b'', min_connections=SEGMENT_MIN_CONNECTIONS,
+                 max_connections=SEGMENT_MAX_CONNECTIONS, min_segment=SEGMENT_MIN_BYTES,
+                 max_segment=SEGMENT_MAX_BYTES, buffer_bytes=SEGMENT_BUFFER_BYTES):
+        self.url = url
+        self.head = head  # Bytes already fetched from `first`, sent before anything else
+        self.emit_offset = first + len(head)
+        self.next_offset = self.emit_offset
+        self.last = last
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.min_segment = min_segment
+        self.max_segment = max_segment
+        self.buffer_bytes = buffer_bytes
+        self.segments = {}
+        self.buffered = 0
+        self.max_buffered = 0
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.connection_rate = None  # Moving average of bytes/s on one connection
+        self.target_connections = min_connections
+        self.workers = 0
+        self.max_workers = 0
+        self.epoch_started = time.monotonic()
+        self.epoch_bytes = 0
+        self.best_rate = 0.0
+
+    def _segment_size(self):
+        if self.connection_rate is None:
+            return self.min_segment
+        # Near the end, smaller segments keep every connection busy until the last byte
+        remaining = self.last - self.next_offset + 1
+        size = min(
+            int(self.connection_rate * SEGMENT_TARGET_SECONDS),
+            remaining // (self.target_connections + 1),
+            # Every connection needs room for a segment in the reorder buffer
+            self.buffer_bytes // self.target_connections,
+        )
+        return max(self.min_segment, min(self.max_segment, size))
+
+    def _claim(self, worker):
+        """Next (first, last) for a worker to fetch, or None when it should stop"""
+        with self.condition:
+            while True:
+                if self.closed or self.error or self.next_offset > self.last or worker >= self.target_connections:
+                    return None
+                size = min(self._segment_size(), self.last - self.next_offset + 1)
+                # The segment the client is waiting for can always be claimed
+                if self.next_offset == self.emit_offset or self.next_offset + size - self.emit_offset <= self.buffer_bytes:
+                    break
+                self.condition.wait(1)
+            first = self.next_offset
+            self.next_offset += size
+            return first, first + size - 1
+
+    def _fetch(self, first, last):
+        for attempt in range(SEGMENT_RETRIES):
+            try:
+                upstream = open_upstream(self.url, f'bytes={first}-{last}')
+                try:
+                    content_range = parse_content_range(upstream.headers.get('Content-Range'))
+                    if upstream.status_code != 206 or not content_range or content_range[0] != first:
+                        raise SegmentFetchError(f'Unexpected response {upstream.status_code} for bytes {first}-{last}')
+                    data = upstream.read(last - first + 1)
+                finally:
+                    upstream.close()
+                if len(data) == last - first + 1:
+                    return data
+            except (SegmentFetchError, *UPSTREAM_ERRORS) as e:
+                if attempt == SEGMENT_RETRIES - 1:
+                    raise SegmentFetchError(str(e))
+        raise SegmentFetchError(f'Short read for bytes {first}-{last}')
+
+    def _work(self, worker):
+        try:
+            while True:
+                claimed = self._claim(worker)
+                if claimed is None:
+                    return
+                started = time.monotonic()
+                data = self._fetch(*claimed)
+                self._completed(claimed[0], data, time.monotonic() - started)
+        except SegmentFetchError as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.workers -= 1
+
+    def _completed(self, first, data, elapsed):
+        with self.condition:
+            self.segments[first] = data
+            self.buffered += len(data)
+            self.max_buffered = max(self.max_buffered, self.buffered)
+            rate = len(data) / max(elapsed, 1e-6)
+            self.connection_rate = rate if self.connection_rate is None else 0.7 * self.connection_rate + 0.3 * rate
+            self.epoch_bytes += len(data)
+            self._adapt_connections()
+            self.condition.notify_all()
+
+    def _adapt_connections(self):
+        """Hill-climb the connection count on the aggregate rate of each epoch"""
+        elapsed = time.monotonic() - self.epoch_started
+        if elapsed < SEGMENT_EPOCH_SECONDS:
+            return
+        rate = self.epoch_bytes / elapsed
+        self.epoch_started = time.monotonic()
+        self.epoch_bytes = 0
+        if rate > self.best_rate * 1.1:
+            self.best_rate = rate
+            if self.target_connections < self.max_connections:
+                self.target_connections += 1
+                self._start_workers()
+        elif rate < self.best_rate * 0.8 and self.target_connections > self.min_connections:
+            self.target_connections -= 1
+
+    def _start_workers(self):
+        """Start workers up to the target (called with the condition held)"""
+        while self.workers < self.target_connections:
+            threading.Thread(target=self._work, args=(self.workers,), daemon=True).start()
+            self.workers += 1
+            self.max_workers = max(self.max_workers, self.workers)
+
+    def __iter__(self):
+        try:
+            if self.head:
+                yield self.head
+            with self.condition:
+                self._start_workers()
+            while self.emit_offset <= self.last:
+                with self.condition:
+                    while self.emit_offset not in self.segments and not self.error:
+                        self.condition.wait(1)
+                    if self.emit_offset not in self.segments:
+                        raise self.error
+                    data = self.segments.pop(self.emit_offset)
+                    self.buffered -= len(data)
+                    self.emit_offset += len(data)
+                    self.condition.notify_all()
+                yield data
+        finally:
+            # Client went away or the download finished: stop every worker
+            with self.condition:
+                self.closed = True
+                self.segments.clear()
+                self.condition.notify_all()
+
+
+def open_download(url, client_range=None, if_range=None, segmented=False):
+    """Start a download of url for a client; returns (status, headers, body iterator)
+
+    In segmented mode the first segment is fetched on its own to learn the total
+    size, then the rest is fetched by a SegmentedDownload. Responses that can't be
+    split (a changed If-Range, 416, unknown length, multi-range requests) are
+    relayed as a single stream.
+    """
+    requested = parse_range(client_range)
+    if segmented and (client_range is None or requested):
+        first, last = requested or (0, None)
+        probe_last = first + SEGMENT_MIN_BYTES - 1
+        if last is not None:
+            probe_last = min(last, probe_last)
+        upstream = open_upstream(url, f'bytes={first}-{probe_last}', if_range if client_range else None)
+        content_range = parse_content_range(upstream.headers.get('Content-Range'))
+        if upstream.status_code == 206 and content_range and content_range[2] is not None:
+            total = content_range[2]
+            end = total - 1 if last is None else min(last, total - 1)
+            try:
+                head = upstream.read(content_range[1] - content_range[0] + 1)
+            finally:
+                upstream.close()
+            headers = {name: upstream.headers[name] for name in ('Content-Type', 'ETag', 'Last-Modified') if name in upstream.headers}
+            headers['Accept-Ranges'] = 'bytes'
+            headers['Content-Length'] = str(end - first + 1)
+            status = 200
+            if client_range:
+                status = 206
+                headers['Content-Range'] = f'bytes {first}-{end}/{total}'
+            return status, headers, iter(SegmentedDownload(url, first, end, head=head))
+        if upstream.status_code != 206:
+            # Full body (If-Range didn't match) or an error: relay it as it is
+            status, headers = get_download_headers(upstream, client_range)
+            return status, headers, iter_upstream(upstream)
+        upstream.close()
+
+    upstream = open_upstream(url, client_range, if_range)
+    status, headers = get_download_headers(upstream, client_range)
+    return status, headers, iter_upstream(upstream)
@@ -0,0 +1,158 @@
+"""Server-side remux of separate video and audio formats with ffmpeg
+
+The two upstream streams are written into pipes that ffmpeg reads as pipe:N
+inputs, and ffmpeg copies both tracks (no re-encoding) into a fragmented MP4
+or WebM written to its stdout, which is streamed to the client as it's produced.
+Nothing touches the disk, and every pipe has a fixed size, so a slow client
+stalls ffmpeg and the upstream fetches instead of buffering.
+"""
+
+import fcntl
+import os
+import shutil
+import subprocess
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+FFMPEG = os.environ.get('DEBUTUBE_FFMPEG') or shutil.which('ffmpeg')
+
+PIPE_BUFFER_BYTES = 1024 * 1024  # Per input pipe
+OUTPUT_CHUNK_SIZE = 64 * 1024
+STDERR_TAIL_BYTES = 4096
+
+# Output containers: content type and ffmpeg muxer options. Fragmented MP4 needs no
+# seekable output, since the moov box is written up front and empty
+CONTAINERS = {
+    'mp4': ('video/mp4', ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof']),
+    'webm': ('video/webm', ['-f', 'webm']),
+}
+
+# Codecs each container can hold, as prefixes of yt-dlp's vcodec and acodec names
+CONTAINER_CODECS = {
+    'mp4': (('avc1', 'h264', 'av01', 'vp09', 'vp9', 'hev1', 'hvc1'), ('mp4a', 'aac', 'opus', 'mp3', 'ac-3', 'ec-3')),
+    'webm': (('vp8', 'vp09', 'vp9', 'av01'), ('opus', 'vorbis')),
+}
+# Codecs YouTube serves under each googlevideo mime= type; MP4 video is H.264 except
+# for the AV1 itags
+MIME_CODECS = {'video/mp4': 'avc1', 'video/webm': 'vp9', 'audio/mp4': 'mp4a', 'audio/webm': 'opus'}
+AV1_ITAGS = frozenset([*range(394, 403), 571, *range(694, 703)])
+
+# fcntl.F_SETPIPE_SZ is Linux-only and missing from older Pythons
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
+
+def is_available():
+    return bool(FFMPEG)
+
+
+def url_codec(url):
+    """Codec of the stream at a googlevideo URL, from its mime= and itag=, or None if unknown"""
+    query = parse_qs(urlsplit(url).query)
+    mime = (query.get('mime') or [''])[0]
+    itag = (query.get('itag') or [''])[0]
+    if mime == 'video/mp4' and itag.isdigit() and int(itag) in AV1_ITAGS:
+        return 'av01'
+    return MIME_CODECS.get(mime)
+
+
+def codec_error(container, vcodec, acodec):
+    """Why container can't hold vcodec and acodec, or None if it can (unknown codecs pass)"""
+    video_codecs, audio_codecs = CONTAINER_CODECS[container]
+    for kind, codec, allowed in (('video', vcodec, video_codecs), ('audio', acodec, audio_codecs)):
+        if codec and not codec.lower().startswith(allowed):
+            return f'{container} can\'t hold {kind} codec {codec}; use {" or ".join(other for other in CONTAINER_CODECS if other != container)}'
+    return None
+
+
+def _bounded_pipe():
+    read_fd, write_fd = os.pipe()
+    try:
+        fcntl.fcntl(write_fd, F_SETPIPE_SZ, PIPE_BUFFER_BYTES)
+    except OSError:
+        pass  # Keep the default size (64 KiB on Linux)
+    return read_fd, write_fd
+
+
+class MuxStream:
+    """ffmpeg muxing the first video track of one input with the first audio track of another
+
+    inputs are (video chunks, audio chunks) iterables of bytes; iterate the MuxStream
+    for the output. Closing it (the client went away) kills ffmpeg, which makes the
+    input feeders stop at their next write.
+    """
+
+    def __init__(self, video_chunks, audio_chunks, container='mp4'):
+        self.content_type, muxer_options = CONTAINERS[container]
+        pipes = [_bounded_pipe(), _bounded_pipe()]
+        read_fds = [read_fd for read_fd, _ in pipes]
+
+        cmd = [FFMPEG, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        for read_fd in read_fds:
+            cmd += ['-i', f'pipe:{read_fd}']
+        cmd += ['-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', *muxer_options, 'pipe:1']
+
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=read_fds,
+                bufsize=0
+            )
+        except BaseException:
+            for _, write_fd in pipes:
+                os.close(write_fd)
+            raise
+        finally:
+            # ffmpeg holds the read ends now; each is closed exactly once, since another
+            # thread may reuse the fd number as soon as it's closed
+            for read_fd in read_fds:
+                os.close(read_fd)
+
+        self.stderr_tail = b''
+        self.feeders = [
+            threading.Thread(target=self._feed, args=(chunks, write_fd), daemon=True)
+            for chunks, (_, write_fd) in zip((video_chunks, audio_chunks), pipes)
+        ]
+        self.feeders.append(threading.Thread(target=self._drain_stderr, daemon=True))
+        for thread in self.feeders:
+            thread.start()
+
+    def _feed(self, chunks, write_fd):
+        """Copy one input into its pipe until it ends or ffmpeg stops reading"""
+        try:
+            with open(write_fd, 'wb') as pipe:
+                for chunk in chunks:
+                    pipe.write(chunk)
+        except (BrokenPipeError, OSError, ValueError):
+            pass  # ffmpeg exited, or the upstream failed: ffmpeg sees EOF
+        except Exception as e:
+            print(f"⚠️ Mux input failed: {e}")
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_tail = (self.stderr_tail + line)[-STDERR_TAIL_BYTES:]
+
+    def __iter__(self):
+        try:
+            while True:
+                data = self.process.stdout.read(OUTPUT_CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+            returncode = self.process.wait()
+            if returncode != 0:
+                print(f"⚠️ ffmpeg exited with {returncode}: {self.stderr_tail.decode('utf-8', 'replace').strip()}")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
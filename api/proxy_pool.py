@@ -0,0 +1,322 @@
+"""Outbound proxies for extractions and media fetches
+
+Bot detection is largely per egress IP, so extractions are spread over a pool of
+HTTP and SOCKS5 proxies ("direct" stands for the server's own address). Each
+proxy has its own budgets, at most `concurrency` extractions at once and `rate`
+a minute, and a health score between 0 and 1. The score drops with the errors
+its extractions hit and recovers with each success. Bot checks and rate
+limiting also bench the proxy for a while. Errors about the video itself (private,
+removed, age-restricted) don't count against it.
+
+Extractions logged in to an account stick to one proxy, since an account hopping
+between IPs is itself a bot signal: the account's proxy is the first one in its
+hash ring order (see routing.HashRing) that isn't benched. The server's own
+cookies are one account shared by every extraction that doesn't bring its own,
+so pinning it to one proxy would queue them all behind that proxy's budget: a
+shared account takes the first of its shared_owners proxies with budget to
+spare. Anonymous extractions take any proxy with budget to spare, healthier and
+less loaded ones more often.
+
+googlevideo URLs only work from the IP they were signed for (their ip=
+parameter), so media fetches go through the proxy whose extractions returned
+URLs for that IP. Those egress IPs are learnt as extractions finish and shared
+through the cache, so every process on the host knows them.
+"""
+
+import hashlib
+import random
+import re
+import subprocess
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bandwidth import TokenBucket
+from routing import HashRing
+
+PROXY_SCHEMES = ('http', 'socks5', 'socks5h')
+
+# Extraction error classes, matched against yt-dlp's error output in this order
+ERROR_CLASSES = (
+    ('bot_check', ("confirm you're not a bot", 'confirm you’re not a bot', 'sign in to confirm')),
+    ('rate_limited', ('http error 429', 'too many requests')),
+    ('proxy', ('unable to connect to proxy', 'tunnel connection failed', 'proxyerror', 'socks')),
+    ('network', ('timed out', 'connection refused', 'connection reset', 'network is unreachable',
+                 'temporary failure in name resolution', 'name or service not known')),
+)
+# Score multiplier and seconds benched per error class; 'timeout' is yt-dlp being killed
+PENALTIES = {
+    'bot_check': (0.3, 900),
+    'rate_limited': (0.5, 300),
+    'proxy': (0.5, 60),
+    'network': (0.8, 0),
+    'timeout': (0.7, 0),
+}
+RECOVERY = 0.2  # A success closes this much of the gap to a perfect score
+EGRESS_TTL = 6 * 3600  # As long as the URLs signed for an egress IP stay valid
+
+# Cookies that identify the logged-in account, most specific first
+ACCOUNT_COOKIES = ('SAPISID', '__Secure-3PAPISID', 'SID', '__Secure-3PSID')
+
+_IP_PATH_RE = re.compile(r'/ip/([^/]+)')
+
+
+class ProxyUnavailable(Exception):
+    """No proxy could take the extraction in time (all busy, over their rate or benched)"""
+
+
+def classify_error(stderr):
+    """The error class of a failed extraction's output, or None when it isn't the proxy's doing"""
+    text = (stderr or '').lower()
+    for error_class, patterns in ERROR_CLASSES:
+        if any(pattern in text for pattern in patterns):
+            return error_class
+    return None
+
+
+def cookie_account(cookie_text):
+    """Stable ID of the account a Netscape cookie file is logged in to, or None if it isn't"""
+    values = {}
+    for line in (cookie_text or '').splitlines():
+        if line.startswith('#HttpOnly_'):
+            line = line[len('#HttpOnly_'):]
+        elif line.startswith('#'):
+            continue
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) >= 7 and 'youtube.com' in fields[0]:
+            values[fields[5]] = fields[6]
+    for name in ACCOUNT_COOKIES:
+        if values.get(name):
+            return hashlib.sha256(f'{name}={values[name]}'.encode('utf-8')).hexdigest()[:16]
+    return None
+
+
+def egress_ip(url):
+    """The IP a googlevideo URL was signed for, from its ip= parameter or /ip/ path segment"""
+    parts = urlsplit(url or '')
+    values = parse_qs(parts.query).get('ip')
+    if values:
+        return values[0]
+    match = _IP_PATH_RE.search(parts.path)
+    return unquote(match.group(1)) if match else None
+
+
+class Proxy:
+    """One outbound proxy, its budgets and its health
+
+    url is scheme://[user:password@]host:port, or 'direct'; ?concurrency= and
+    ?rate= on the URL override the pool's defaults for this proxy.
+    """
+
+    def __init__(self, url, concurrency=2, rate=20):
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        self.concurrency = int(query['concurrency'][0]) if 'concurrency' in query else concurrency
+        self.rate = float(query['rate'][0]) if 'rate' in query else rate
+        if not parts.scheme and parts.path == 'direct':
+            self.scheme = self.host = self.port = self.username = self.password = self.url = None
+            self.label = 'direct'
+        else:
+            self.scheme = parts.scheme.lower()
+            if self.scheme not in PROXY_SCHEMES or not parts.hostname or not parts.port:
+                raise ValueError(f'Proxies must be {", ".join(PROXY_SCHEMES)} URLs with a port, or "direct"')
+            self.host = parts.hostname
+            self.port = parts.port
+            self.username = unquote(parts.username) if parts.username else None
+            self.password = unquote(parts.password) if parts.password else None
+            # For yt-dlp, with credentials; the label is what gets logged
+            self.url = f'{self.scheme}://{parts.netloc}'
+            self.label = f'{self.scheme}://{self.host}:{self.port}'
+
+        # Allows bursts of a tenth of a minute's budget
+        self.bucket = TokenBucket(self.rate / 60, max(1.0, self.rate / 10)) if self.rate else None
+        self.active = 0
+        self.score = 1.0
+        self.benched_until = 0.0
+        self.extractions = 0
+        self.successes = 0
+        self.errors = {}
+        self.media_requests = 0
+        self.egress_ips = set()
+
+    def env(self, env):
+        """env for a yt-dlp child whose requests go through this proxy
+
+        yt-dlp reads the proxy from the environment when there's no --proxy. Unlike
+        a child's command line, which any user on the host can read with ps, its
+        environment is only readable by its own user, so credentials stay private.
+        """
+        if not self.url:
+            return env
+        env = {name: value for name, value in env.items() if not name.lower().endswith('_proxy')}
+        env.update(http_proxy=self.url, https_proxy=self.url, all_proxy=self.url)
+        return env
+
+    def is_benched(self, now):
+        return self.benched_until > now
+
+    def has_budget(self):
+        return self.active < self.concurrency and (self.bucket is None or self.bucket.delay(1) <= 0)
+
+
+class ProxyLease:
+    """An extraction's hold on a proxy
+
+    finish() reports the outcome: yt-dlp's error output when the extraction failed,
+    or a URL it returned when it succeeded. Leaving the with block releases the
+    proxy; a yt-dlp timeout there counts against the proxy, other exceptions don't.
+    """
+
+    def __init__(self, pool, proxy):
+        self.pool = pool
+        self.proxy = proxy
+        self.done = False
+
+    def env(self, env):
+        return self.proxy.env(env) if self.proxy is not None else env
+
+    def finish(self, error=None, url=None):
+        if self.done or self.pool is None:
+            return
+        self.done = True
+        self.pool._release(self.proxy, classify_error(error) if error else 'ok', url)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.done or self.pool is None:
+            return
+        self.done = True
+        self.pool._release(self.proxy, 'timeout' if exc_type is subprocess.TimeoutExpired else None)
+
+
+# Lease used when no proxies are configured
+NO_PROXY = ProxyLease(None, None)
+
+
+class ProxyPool:
+    """Assigns extractions to proxies within their budgets, and media fetches to the right proxy
+
+    wait is how long acquire() waits for a proxy before giving up; cache, if given,
+    shares the learnt egress IPs between processes. A shared account is spread over
+    its first shared_owners proxies in ring order.
+    """
+
+    def __init__(self, urls, concurrency=2, rate=20, wait=10, cache=None, shared_owners=3):
+        self.proxies = [Proxy(url, concurrency, rate) for url in urls]
+        self.by_label = {proxy.label: proxy for proxy in self.proxies}
+        self.ring = HashRing(self.by_label)
+        self.wait = wait
+        self.cache = cache
+        self.shared_owners = max(1, shared_owners)
+        self.egress = {}  # Egress IP -> Proxy
+        self.condition = threading.Condition()
+        self.waits = 0
+        self.unavailable = 0
+
+    def _pick(self, account, shared, now):
+        """The proxy to use now, or None to wait (called with the condition held)"""
+        if account:
+            # The account's proxy (or, shared, its first few), unless benched; busy ones are waited for
+            owners = [proxy for proxy in map(self.by_label.get, self.ring.owners(account)) if not proxy.is_benched(now)]
+            owners = owners[:self.shared_owners if shared else 1]
+            return next((proxy for proxy in owners if proxy.has_budget()), None)
+        candidates = [proxy for proxy in self.proxies if not proxy.is_benched(now) and proxy.has_budget()]
+        if not candidates:
+            return None
+        # Proxies recovering from a penalty still get some traffic, so their score can recover
+        weights = [0.05 + proxy.score * (1 - proxy.active / proxy.concurrency) for proxy in candidates]
+        return random.choices(candidates, weights)[0]
+
+    def acquire(self, account=None, shared=False):
+        """Lease a proxy for an extraction, logged in to account if given; raises ProxyUnavailable
+
+        shared is whether the account is the server's own, used by many extractions at once.
+        """
+        deadline = time.monotonic() + self.wait
+        waited = False
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                proxy = self._pick(account, shared, now)
+                if proxy is not None:
+                    break
+                if now >= deadline:
+                    self.unavailable += 1
+                    raise ProxyUnavailable('All outbound proxies are busy or cooling down; try again shortly')
+                waited = True
+                # Rate budgets refill without a notify, so check again shortly
+                self.condition.wait(min(deadline - now, 0.5))
+            if waited:
+                self.waits += 1
+            proxy.active += 1
+            proxy.extractions += 1
+            if proxy.bucket is not None:
+                proxy.bucket.take(1)
+        return ProxyLease(self, proxy)
+
+    def _release(self, proxy, outcome, url=None):
+        """outcome is 'ok', an error class, or None when the extraction says nothing about the proxy"""
+        ip = egress_ip(url) if outcome == 'ok' and url else None
+        with self.condition:
+            proxy.active -= 1
+            if outcome == 'ok':
+                proxy.successes += 1
+                proxy.score += (1 - proxy.score) * RECOVERY
+            elif outcome in PENALTIES:
+                factor, bench_seconds = PENALTIES[outcome]
+                proxy.errors[outcome] = proxy.errors.get(outcome, 0) + 1
+                proxy.score *= factor
+                if bench_seconds:
+                    proxy.benched_until = time.monotonic() + bench_seconds
+                    print(f"⚠️ Proxy {proxy.label} benched for {bench_seconds}s after {outcome}")
+            if ip and self.egress.get(ip) is not proxy:
+                self.egress[ip] = proxy
+                proxy.egress_ips.add(ip)
+            else:
+                ip = None
+            self.condition.notify_all()
+        if ip and self.cache is not None:
+            self.cache.set(f'proxy-egress:{ip}', proxy.label.encode('utf-8'), EGRESS_TTL)
+
+    def media_proxy(self, url):
+        """The proxy to fetch a googlevideo URL through, or None to fetch it directly"""
+        ip = egress_ip(url)
+        if not ip:
+            return None
+        with self.condition:
+            proxy = self.egress.get(ip)
+        if proxy is None and self.cache is not None:
+            label = self.cache.get(f'proxy-egress:{ip}')
+            proxy = self.by_label.get(label.decode('utf-8')) if label else None
+            if proxy is not None:
+                with self.condition:
+                    self.egress[ip] = proxy
+                    proxy.egress_ips.add(ip)
+        if proxy is None or proxy.url is None:
+            return None
+        with self.condition:
+            proxy.media_requests += 1
+        return proxy
+
+    def stats(self):
+        now = time.monotonic()
+        with self.condition:
+            return {
+                'proxies': [{
+                    'proxy': proxy.label,
+                    'score': round(proxy.score, 3),
+                    'active': proxy.active,
+                    'concurrency': proxy.concurrency,
+                    'rate_per_minute': proxy.rate or None,
+                    'benched_for': round(proxy.benched_until - now) if proxy.is_benched(now) else 0,
+                    'extractions': proxy.extractions,
+                    'successes': proxy.successes,
+                    'errors': dict(proxy.errors),
+                    'media_requests': proxy.media_requests,
+                    'egress_ips': sorted(proxy.egress_ips),
+                } for proxy in self.proxies],
+                'waits': self.waits,
+                'unavailable': self.unavailable,
+            }
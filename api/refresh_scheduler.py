@@ -0,0 +1,166 @@
+"""Proactive re-extraction of hot videos before their signed URLs expire
+
+AccessTracker keeps an exponentially decaying request count per video, and
+RefreshScheduler periodically re-extracts the hottest ones whose cached formats
+are about to expire (or already have), within a per-minute RefreshBudget and
+only while the CircuitBreaker guarding the server's cookies is closed.
+"""
+
+import heapq
+import os
+import threading
+import time
+
+
+class AccessTracker:
+    """Decaying access counts per key; a count halves every half_life seconds"""
+
+    def __init__(self, half_life=1800, max_keys=10000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.scores = {}  # key -> (score, last update)
+        self.lock = threading.Lock()
+
+    def _decayed(self, score, updated, now):
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, key):
+        now = time.time()
+        with self.lock:
+            score, updated = self.scores.get(key, (0.0, now))
+            self.scores[key] = (self._decayed(score, updated, now) + 1, now)
+            if len(self.scores) > self.max_keys * 2:
+                self._prune(now)
+
+    def _prune(self, now):
+        """Keep only the max_keys hottest keys"""
+        hottest = heapq.nlargest(
+            self.max_keys, self.scores.items(),
+            key=lambda item: self._decayed(item[1][0], item[1][1], now))
+        self.scores = dict(hottest)
+
+    def hottest(self, count, min_score=1.0):
+        """Up to count (key, score) pairs with the highest current scores"""
+        now = time.time()
+        with self.lock:
+            scored = [(key, self._decayed(score, updated, now)) for key, (score, updated) in self.scores.items()]
+        return [item for item in heapq.nlargest(count, scored, key=lambda item: item[1]) if item[1] >= min_score]
+
+
+class RefreshBudget:
+    """Token bucket allowing per_minute refreshes a minute, with bursts up to per_minute"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Stops background extraction after repeated failures with the server's cookies
+
+    After `threshold` consecutive failures the breaker opens for `cooldown` seconds;
+    the first success closes it again. Bot-detection responses mean the cookies are
+    being challenged, and hammering YouTube further only makes that worse.
+    """
+
+    def __init__(self, threshold=3, cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        return time.time() < self.open_until
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if not self.is_open():
+                    print(f"⚠️ {self.failures} extraction failures in a row, pausing background extraction for {self.cooldown}s")
+                self.open_until = time.time() + self.cooldown
+
+
+class RefreshScheduler:
+    """Background thread that keeps the hottest videos' cached formats fresh
+
+    Every `interval` seconds the `hot_count` hottest keys are checked with
+    get_expiry(key) (the time the cached entry stops being served, or None when
+    it isn't cached); those expiring within `lead` seconds are passed to
+    refresh(key), hottest first, while the budget and circuit breaker allow.
+    """
+
+    def __init__(self, tracker, get_expiry, refresh, budget, breaker,
+                 hot_count=50, min_score=3.0, lead=900, interval=30):
+        self.tracker = tracker
+        self.get_expiry = get_expiry
+        self.refresh = refresh
+        self.budget = budget
+        self.breaker = breaker
+        self.hot_count = hot_count
+        self.min_score = min_score
+        self.lead = lead
+        self.interval = interval
+        self.scheduled = 0
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the thread in this process (threads don't survive a pre-fork)"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️ Refresh scheduler error: {e}")
+
+    def run_once(self):
+        """Schedule refreshes for hot keys that are about to expire; returns how many"""
+        scheduled = 0
+        deadline = time.time() + self.lead
+        for key, _ in self.tracker.hottest(self.hot_count, self.min_score):
+            if self.breaker.is_open():
+                break
+            expires_at = self.get_expiry(key)
+            if expires_at is not None and expires_at > deadline:
+                continue
+            if not self.budget.try_acquire():
+                break
+            self.refresh(key)
+            scheduled += 1
+        self.scheduled += scheduled
+        return scheduled
+
+    def stats(self):
+        return {
+            'tracked': len(self.tracker.scores),
+            'scheduled': self.scheduled,
+            'breaker_open': self.breaker.is_open(),
+        }
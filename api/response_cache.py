@@ -0,0 +1,168 @@
+"""Pre-serialised, pre-compressed API responses and their compact cache encoding"""
+
+import gzip
+import hashlib
+import struct
+import time
+from collections import OrderedDict
+
+# brotli and zstandard are optional; gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+# Cache encoding: magic, expires_at, ETag, number of encodings, then per encoding
+# (name length, data length, name, data); the raw body follows only when there
+# are no encodings, otherwise it is recovered from the gzip encoding on demand
+_CACHE_MAGIC = b'DTR1'
+_CACHE_HEADER = struct.Struct('>4sd32sB')
+_CACHE_ENCODING = struct.Struct('>BI')
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 6
+ZSTD_LEVEL = 10
+
+
+def _compress_zstd(body):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+def _compress_brotli(body):
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def _compress_gzip(body):
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+# Supported content codings, most preferred first when the client accepts several equally
+COMPRESSORS = OrderedDict(
+    (encoding, compressor) for encoding, compressor, module in (
+        ('zstd', _compress_zstd, zstandard),
+        ('br', _compress_brotli, brotli),
+        ('gzip', _compress_gzip, gzip),
+    ) if module is not None
+)
+
+
+def choose_encoding(accept_encodings, available):
+    """Pick the content coding to send from a werkzeug Accept-Encoding header
+
+    Returns None (identity) when the client accepts none of the available codings.
+    """
+    best = None
+    best_quality = 0
+    for encoding in available:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class PreparedResponse:
+    """A serialised JSON body together with its compressed encodings
+
+    Everything is computed once when the response is built, so serving a cached
+    response is a lookup of the bytes for the negotiated encoding. A lazy response
+    (one that's sent once and never cached) is only compressed in the encoding a
+    client asks for, when it asks.
+    """
+
+    __slots__ = ('_body', 'encoded', 'expires_at', 'etag', 'lazy')
+
+    def __init__(self, body, expires_at, encoded=None, etag=None, lazy=False):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self._body = body
+        self.expires_at = expires_at
+        # Strong validator derived from the content itself
+        self.etag = etag or hashlib.sha256(body).hexdigest()[:32]
+        self.lazy = encoded is None and lazy and len(body) >= MIN_COMPRESS_BYTES
+        if encoded is None:
+            encoded = {}
+            if len(body) >= MIN_COMPRESS_BYTES and not lazy:
+                for encoding, compressor in COMPRESSORS.items():
+                    encoded[encoding] = compressor(body)
+        self.encoded = encoded
+
+    @property
+    def body(self):
+        """The uncompressed body, decompressed from the gzip encoding if it wasn't kept"""
+        if self._body is None:
+            self._body = gzip.decompress(self.encoded['gzip'])
+        return self._body
+
+    def _available(self):
+        """Content codings this body can be sent in"""
+        return COMPRESSORS if self.lazy else self.encoded
+
+    def _encode(self, encoding):
+        if encoding not in self.encoded:
+            self.encoded[encoding] = COMPRESSORS[encoding](self.body)
+        return self.encoded[encoding]
+
+    def ttl(self):
+        return self.expires_at - time.time()
+
+    def etag_for(self, encoding):
+        """Entity tag of the representation sent with the given content coding"""
+        return f'{self.etag}-{encoding}' if encoding else self.etag
+
+    def etags(self):
+        """Entity tags of every representation of this body"""
+        return [self.etag_for(None)] + [self.etag_for(encoding) for encoding in self._available()]
+
+    def for_encoding(self, accept_encodings):
+        """(bytes, content coding or None) to send to a client with this Accept-Encoding"""
+        encoding = choose_encoding(accept_encodings, self._available())
+        if encoding is None:
+            return self.body, None
+        return self._encode(encoding), encoding
+
+    def to_bytes(self):
+        """Compact encoding for cache backends; only the compressed bodies are stored"""
+        if self.lazy:
+            for encoding in COMPRESSORS:
+                self._encode(encoding)
+            self.lazy = False
+        parts = [_CACHE_HEADER.pack(_CACHE_MAGIC, self.expires_at, self.etag.encode('ascii'), len(self.encoded))]
+        for encoding, data in self.encoded.items():
+            name = encoding.encode('ascii')
+            parts.append(_CACHE_ENCODING.pack(len(name), len(data)))
+            parts.append(name)
+            parts.append(data)
+        if not self.encoded:
+            parts.append(self.body)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a PreparedResponse from to_bytes() output; None if it isn't one"""
+        if len(data) < _CACHE_HEADER.size:
+            return None
+        magic, expires_at, etag, count = _CACHE_HEADER.unpack_from(data)
+        if magic != _CACHE_MAGIC:
+            return None
+
+        offset = _CACHE_HEADER.size
+        encoded = {}
+        for _ in range(count):
+            name_length, data_length = _CACHE_ENCODING.unpack_from(data, offset)
+            offset += _CACHE_ENCODING.size
+            name = data[offset:offset + name_length].decode('ascii')
+            offset += name_length
+            encoded[name] = data[offset:offset + data_length]
+            offset += data_length
+
+        body = None if encoded else data[offset:]
+        return cls(body, expires_at, encoded=encoded, etag=etag.decode('ascii'))
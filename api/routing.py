@@ -0,0 +1,237 @@
+"""Consistent-hash routing of YouTube video IDs across API nodes
+
+Every node (or a standalone router in front of them) maps a canonical video ID to
+an owner node on a hash ring, so each video is extracted and cached by one node
+instead of by whichever node the load balancer happened to pick.
+
+Embedded: set DEBUTUBE_NODES to the base URLs of all nodes and DEBUTUBE_NODE_URL
+to this node's own URL; requests for videos owned by another node are forwarded.
+
+Standalone:
+    python api/routing.py --nodes http://10.0.0.1:5000,http://10.0.0.2:5000 --port 8080
+"""
+
+import argparse
+import bisect
+import hashlib
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+
+# Set on forwarded requests so the receiving node serves them itself
+FORWARDED_HEADER = 'X-Debutube-Forwarded'
+
+# Headers that describe one connection and must not be copied across a hop
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'host', 'content-length',
+}
+
+# Bytes read from the owner node at a time while streaming its response back
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes
+
+    Each node is placed at `vnodes` points on the ring; a key belongs to the first
+    point clockwise from its hash. Adding or removing a node only moves the keys
+    between that node's points and their predecessors (about 1/N of all keys).
+    """
+
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self.points = []
+        self.point_nodes = []
+        self.nodes = set()
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.vnodes):
+            point = _hash(f'{node}#{replica}')
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.point_nodes.insert(index, node)
+
+    def remove_node(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self.points, self.point_nodes) if owner != node]
+        self.points = [point for point, _ in kept]
+        self.point_nodes = [owner for _, owner in kept]
+
+    def owners(self, key, count=None):
+        """Distinct nodes for key in ring order: the owner first, then its successors"""
+        if not self.points:
+            return []
+        count = len(self.nodes) if count is None else min(count, len(self.nodes))
+        found = []
+        index = bisect.bisect(self.points, _hash(key))
+        for offset in range(len(self.points)):
+            node = self.point_nodes[(index + offset) % len(self.points)]
+            if node not in found:
+                found.append(node)
+                if len(found) == count:
+                    break
+        return found
+
+    def owner(self, key):
+        owners = self.owners(key, 1)
+        return owners[0] if owners else None
+
+
+class NodeRouter:
+    """Forwards requests to the node that owns their video ID
+
+    A node that can't be reached is taken off the ring for down_for seconds, so its
+    videos move to their next owner rather than failing.
+    """
+
+    def __init__(self, nodes, self_node=None, vnodes=160, timeout=60, down_for=30):
+        self.self_node = self_node.rstrip('/') if self_node else None
+        self.ring = HashRing([node.rstrip('/') for node in nodes], vnodes)
+        self.timeout = timeout
+        self.down_for = down_for
+        self.down_until = {}
+        self.lock = threading.Lock()
+        # Imported here, so nodes that don't route skip importing requests at cold start
+        import requests
+        self.requests = requests
+        self.session = requests.Session()
+        self.forwarded = 0
+        self.failures = 0
+
+    def _restore_nodes(self):
+        now = time.time()
+        for node, until in list(self.down_until.items()):
+            if until <= now:
+                del self.down_until[node]
+                self.ring.add_node(node)
+
+    def mark_down(self, node):
+        with self.lock:
+            # Never take the last node (or this node) off the ring
+            if node == self.self_node or len(self.ring.nodes) <= 1:
+                return
+            print(f"⚠️ Node {node} unreachable, routing its videos elsewhere for {self.down_for}s")
+            self.down_until[node] = time.time() + self.down_for
+            self.ring.remove_node(node)
+
+    def owners(self, video_id):
+        with self.lock:
+            self._restore_nodes()
+            return self.ring.owners(video_id)
+
+    def owner(self, video_id):
+        owners = self.owners(video_id)
+        return owners[0] if owners else None
+
+    def forward(self, node, flask_request):
+        """Send a Flask request to node and return its response, or None if it failed
+
+        Bodies are passed through undecoded, so pre-compressed responses stay compressed,
+        and streamed as they arrive rather than read whole first. Only a failure before
+        the node's response headers arrive counts as the node failing.
+        """
+        headers = {
+            name: value for name, value in flask_request.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        headers[FORWARDED_HEADER] = self.self_node or 'router'
+        url = node + flask_request.full_path.rstrip('?')
+        try:
+            upstream = self.session.request(
+                flask_request.method, url,
+                headers=headers,
+                data=flask_request.get_data(),
+                timeout=self.timeout,
+                stream=True,
+                allow_redirects=False,
+            )
+        except self.requests.RequestException:
+            self.failures += 1
+            self.mark_down(node)
+            return None
+
+        def body():
+            try:
+                yield from upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+            except Exception as e:
+                # Re-raised so the client's connection is dropped instead of ending as if complete
+                print(f"⚠️ Response from {node} cut off: {e}")
+                raise
+            finally:
+                upstream.close()
+
+        self.forwarded += 1
+        response = Response(body(), status=upstream.status_code)
+        for name, value in upstream.raw.headers.items():
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                response.headers.add(name, value)
+        response.headers['X-Served-By'] = node
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                'nodes': sorted(self.ring.nodes),
+                'down': sorted(self.down_until),
+                'forwarded': self.forwarded,
+                'failures': self.failures,
+            }
+
+
+def create_router_app(router, get_request_video_id):
+    """Standalone router: forwards every request to the owner of its video ID
+
+    Requests without a video ID go to the owner of their path. When the owner
+    fails, the next node on the ring is tried.
+    """
+    router_app = Flask(__name__)
+
+    @router_app.route('/router/status')
+    def router_status():
+        return jsonify(router.stats())
+
+    @router_app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'OPTIONS'])
+    @router_app.route('/<path:path>', methods=['GET', 'POST', 'OPTIONS'])
+    def route(path):
+        key = get_request_video_id(request) or request.path
+        for node in router.owners(key):
+            response = router.forward(node, request)
+            if response is not None:
+                return response
+        response = jsonify({'error': 'No API node is reachable'})
+        response.status_code = 502
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    return router_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Route DebuTube API requests to nodes by video ID')
+    parser.add_argument('--nodes', required=True, help='Comma-separated base URLs of the API nodes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--vnodes', type=int, default=160, help='Virtual nodes per API node')
+    args = parser.parse_args()
+
+    from video_ids import get_request_video_id
+    router = NodeRouter([node for node in args.nodes.split(',') if node], vnodes=args.vnodes)
+    print(f"🔀 Routing to {len(router.ring.nodes)} nodes on port {args.port}")
+    create_router_app(router, get_request_video_id).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
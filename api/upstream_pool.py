@@ -0,0 +1,305 @@
+"""Keep-alive connection pool for upstream media fetches
+
+Connections are pooled per (scheme, host, port, proxy) and reused across
+downloads and segment fetches. New TLS connections resume the host's last TLS
+session, which skips most of the handshake. Each host has a connection cap, and connections
+idle for longer than idle_timeout are closed.
+
+Requests can go out through an outbound proxy (see proxy_pool.py): HTTP proxies
+are tunnelled through with CONNECT, SOCKS5 proxies are spoken to directly.
+Connections through different proxies are pooled separately.
+"""
+
+import base64
+import http.client
+import socket
+import ssl
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+
+class PoolTimeout(OSError):
+    """No connection to the host became free in time"""
+
+
+def _recv_exact(sock, length):
+    data = b''
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise OSError('SOCKS5 proxy closed the connection')
+        data += chunk
+    return data
+
+
+def open_socks5(proxy, host, port, timeout):
+    """A socket connected to host:port through a SOCKS5 proxy (RFC 1928, RFC 1929 auth)
+
+    socks5h proxies resolve host themselves; for socks5 it is resolved here.
+    """
+    sock = socket.create_connection((proxy.host, proxy.port), timeout)
+    try:
+        methods = b'\x00\x02' if proxy.username else b'\x00'
+        sock.sendall(b'\x05' + bytes([len(methods)]) + methods)
+        version, method = _recv_exact(sock, 2)
+        if version != 5 or method not in (0, 2):
+            raise OSError('SOCKS5 proxy accepts none of our authentication methods')
+        if method == 2:
+            username = proxy.username.encode('utf-8')
+            password = (proxy.password or '').encode('utf-8')
+            sock.sendall(b'\x01' + bytes([len(username)]) + username + bytes([len(password)]) + password)
+            if _recv_exact(sock, 2)[1] != 0:
+                raise OSError('SOCKS5 proxy rejected the credentials')
+
+        if proxy.scheme == 'socks5h':
+            name = host.encode('idna')
+            address = b'\x03' + bytes([len(name)]) + name
+        else:
+            family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+            address = b'\x01' + socket.inet_pton(family, sockaddr[0]) if family == socket.AF_INET \
+                else b'\x04' + socket.inet_pton(family, sockaddr[0])
+        sock.sendall(b'\x05\x01\x00' + address + struct.pack('>H', port))
+
+        reply = _recv_exact(sock, 4)
+        if reply[1] != 0:
+            raise OSError(f'SOCKS5 proxy could not connect to {host}:{port} (reply {reply[1]})')
+        # Skip the address the proxy bound for us
+        length = {1: 4, 4: 16}.get(reply[3]) or _recv_exact(sock, 1)[0]
+        _recv_exact(sock, length + 2)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+
+class _HTTPConnection(http.client.HTTPConnection):
+    """HTTP connection whose socket can come from a SOCKS5 proxy"""
+
+    def __init__(self, *args, socket_factory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_factory = socket_factory
+
+    def connect(self):
+        if self.socket_factory is None:
+            return super().connect()
+        self.sock = self.socket_factory()
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection that resumes a previous TLS session when given one"""
+
+    def __init__(self, *args, tls_session=None, socket_factory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tls_session = tls_session
+        self.socket_factory = socket_factory
+
+    def connect(self):
+        if self.socket_factory is not None:
+            self.sock = self.socket_factory()
+        else:
+            # Also sends CONNECT when tunnelling through an HTTP proxy
+            http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self._tunnel_host or self.host, session=self.tls_session)
+
+
+class PooledResponse:
+    """An upstream response that gives its connection back to the pool once read
+
+    A response read to the end returns its connection for reuse; one closed early
+    closes the connection, since the rest of the body is still on the wire.
+    """
+
+    def __init__(self, pool, key, connection, response):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status_code = response.status
+        self.headers = response.msg
+        self.released = False
+
+    def read(self, amount=None):
+        data = self.response.read(amount)
+        if self.response.isclosed() or self.response.length == 0:
+            self._release()
+        return data
+
+    def iter_chunks(self, chunk_size):
+        """Yield the body in chunks of up to chunk_size bytes, as they arrive"""
+        while True:
+            data = self.response.read1(chunk_size)
+            if not data:
+                self._release()
+                return
+            yield data
+
+    def _release(self):
+        if not self.released:
+            self.released = True
+            # Only a connection whose body was read to the end can carry another request
+            complete = self.response.isclosed() or self.response.length == 0
+            self.response.close()
+            self.pool._release(self.key, self.connection, reusable=complete and not self.response.will_close)
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.response.close()
+            self.pool._release(self.key, self.connection, reusable=False)
+
+
+class ConnectionPool:
+    """Per-host pool of keep-alive HTTP(S) connections"""
+
+    def __init__(self, max_per_host=8, idle_timeout=30, connect_timeout=10, read_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._ssl_context = None
+        self.idle = defaultdict(deque)  # key -> (connection, idle since)
+        self.open = defaultdict(int)  # key -> connections open, idle or in use
+        self.tls_sessions = {}
+        self.condition = threading.Condition()
+
+        self.requests = 0
+        self.reused = 0
+        self.connections = 0
+        self.tls_resumed = 0
+        self.connect_seconds = 0.0
+
+    @property
+    def ssl_context(self):
+        """Created on first use, since loading the CA bundle slows down cold starts"""
+        if self._ssl_context is None:
+            with self.condition:
+                if self._ssl_context is None:
+                    self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _evict_idle(self):
+        """Close connections idle for too long (called with the condition held)"""
+        cutoff = time.monotonic() - self.idle_timeout
+        for key, idle in list(self.idle.items()):
+            while idle and idle[0][1] < cutoff:
+                idle.popleft()[0].close()
+                self.open[key] -= 1
+            if not idle:
+                del self.idle[key]
+
+    def _acquire(self, key, proxy=None):
+        """(connection, reused) for key, waiting while the host is at its cap"""
+        deadline = time.monotonic() + self.connect_timeout
+        with self.condition:
+            while True:
+                self._evict_idle()
+                idle = self.idle.get(key)
+                if idle:
+                    connection = idle.pop()[0]
+                    self.reused += 1
+                    return connection, True
+                if self.open[key] < self.max_per_host:
+                    self.open[key] += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f'No free connection to {key[1]} within {self.connect_timeout}s')
+                self.condition.wait(remaining)
+
+        try:
+            return self._connect(key, proxy), False
+        except BaseException:
+            with self.condition:
+                self.open[key] -= 1
+                self.condition.notify()
+            raise
+
+    def _connect(self, key, proxy=None):
+        scheme, host, port, _ = key
+        started = time.monotonic()
+        connection_class = _HTTPSConnection if scheme == 'https' else _HTTPConnection
+        options = {'timeout': self.connect_timeout}
+        if scheme == 'https':
+            options.update(context=self.ssl_context, tls_session=self.tls_sessions.get(key))
+        if proxy is not None and proxy.scheme.startswith('socks5'):
+            options['socket_factory'] = lambda: open_socks5(proxy, host, port, self.connect_timeout)
+            connection = connection_class(host, port, **options)
+        elif proxy is not None:
+            connection = connection_class(proxy.host, proxy.port, **options)
+            tunnel_headers = {}
+            if proxy.username:
+                credentials = f'{proxy.username}:{proxy.password or ""}'.encode('utf-8')
+                tunnel_headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+            connection.set_tunnel(host, port, tunnel_headers)
+        else:
+            connection = connection_class(host, port, **options)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        elapsed = time.monotonic() - started
+
+        with self.condition:
+            self.connections += 1
+            self.connect_seconds += elapsed
+            if scheme == 'https' and connection.sock.session_reused:
+                self.tls_resumed += 1
+        return connection
+
+    def _release(self, key, connection, reusable):
+        with self.condition:
+            # TLS 1.3 session tickets arrive after the handshake, so the session is
+            # saved once a response has been read
+            if isinstance(connection.sock, ssl.SSLSocket) and connection.sock.session is not None:
+                self.tls_sessions[key] = connection.sock.session
+            if reusable:
+                self.idle[key].append((connection, time.monotonic()))
+            else:
+                connection.close()
+                self.open[key] -= 1
+            self.condition.notify()
+
+    def request(self, method, url, headers=None, proxy=None):
+        """Send a request and return a PooledResponse with the headers read
+
+        proxy is an outbound proxy (a proxy_pool.Proxy) to send it through, if any.
+        A reused connection the server has since closed is retried once on a new one.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port, proxy.label if proxy is not None else None)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        with self.condition:
+            self.requests += 1
+        for attempt in range(2):
+            connection, reused = self._acquire(key, proxy)
+            try:
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._release(key, connection, reusable=False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                self._release(key, connection, reusable=False)
+                raise
+            return PooledResponse(self, key, connection, response)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'requests': self.requests,
+                'hit_rate': round(self.reused / self.requests, 4) if self.requests else None,
+                'connections_opened': self.connections,
+                'tls_sessions_resumed': self.tls_resumed,
+                'avg_connect_ms': round(self.connect_seconds / self.connections * 1000, 2) if self.connections else None,
+                'open': sum(self.open.values()),
+                'idle': sum(len(idle) for idle in self.idle.values()),
+            }
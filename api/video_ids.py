@@ -0,0 +1,39 @@
+"""YouTube video IDs in URLs and API requests
+
+Kept apart from app.py, which starts yt-dlp, caches and proxies on import, so the
+standalone router can find the video a request is for without loading the app.
+"""
+
+import re
+
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+YOUTUBE_VIDEO_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+
+def get_video_id(url):
+    """Canonical 11-character YouTube video ID of a watch/short/embed URL, or None"""
+    match = YOUTUBE_VIDEO_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+
+def get_request_video_id(flask_request):
+    """Video ID a /api/formats, /api/direct-url or /api/live request is for, or None
+
+    Requests carrying the caller's own cookies return None: their results aren't
+    shared, so there's nothing to gain from sending them to the video's owner.
+    """
+    if flask_request.path.startswith('/api/formats/'):
+        video_id = flask_request.path.rsplit('/', 1)[-1]
+        return video_id if VIDEO_ID_RE.fullmatch(video_id) else None
+    if flask_request.path.startswith('/api/live/'):
+        # Every viewer of a live stream is served by the node polling it
+        video_id = flask_request.path.split('/')[3]
+        return video_id if VIDEO_ID_RE.fullmatch(video_id) else None
+    if flask_request.method == 'POST' and flask_request.path in ('/api/formats', '/api/direct-url'):
+        data = flask_request.get_json(silent=True)
+        if isinstance(data, dict) and not data.get('cookies'):
+            return get_video_id(data.get('url'))
+    return None
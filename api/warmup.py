@@ -0,0 +1,96 @@
+"""Warm-up of the state the first requests would otherwise pay for
+
+A fresh process pays for the yt-dlp import, loading the cookies, downloading the
+YouTube player JS and deriving its signature functions on its first extraction.
+WarmUp runs named steps that do this ahead of traffic, once per process, and
+reports readiness: a process is ready once the warm-up it was asked for has
+finished. A failed step is reported but doesn't hold readiness back, since the
+requests it would have sped up still work without it.
+"""
+
+import os
+import threading
+import time
+
+
+class WarmUp:
+    """Runs steps, a list of (name, callable), and keeps their outcome
+
+    A step's return value, if any, is reported as its detail. required is whether
+    this process should count as not ready until a warm-up has run.
+    """
+
+    def __init__(self, steps, required=False):
+        self.steps = steps
+        self.required = required
+        self.pid = None
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.state = 'pending' if required else 'idle'
+        self.started = None
+        self.finished = None
+        self.results = {}
+
+    def ensure_started(self):
+        """Start the warm-up in this process if it's required (threads don't survive a pre-fork)"""
+        if not self.required or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.state = 'pending'
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def start(self):
+        """Run the warm-up in a background thread; False if one is already running"""
+        if self.state == 'running':
+            return False
+        threading.Thread(target=self.run, daemon=True).start()
+        return True
+
+    def run(self):
+        """Run every step in order; a run already in progress is waited for instead"""
+        if not self.run_lock.acquire(blocking=False):
+            with self.run_lock:
+                return self.stats()
+        try:
+            self.state = 'running'
+            self.started = time.time()
+            self.finished = None
+            self.results = {}
+            for name, step in self.steps:
+                self.results[name] = self._run_step(name, step)
+            self.finished = time.time()
+            self.state = 'done'
+            failed = [name for name, result in self.results.items() if not result['ok']]
+            print(f"✅ Warm-up finished in {self.finished - self.started:.1f}s"
+                  + (f" ({', '.join(failed)} failed)" if failed else ''))
+        finally:
+            self.run_lock.release()
+        return self.stats()
+
+    def _run_step(self, name, step):
+        started = time.perf_counter()
+        try:
+            detail = step()
+            result = {'ok': True}
+            if detail is not None:
+                result['detail'] = detail
+        except Exception as e:
+            print(f"⚠️ Warm-up step {name} failed: {e}")
+            result = {'ok': False, 'error': str(e)}
+        result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def is_ready(self):
+        return self.state == 'done' or (self.state == 'idle' and not self.required)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'ready': self.is_ready(),
+            'started': self.started,
+            'finished': self.finished,
+            'steps': dict(self.results),
+        }
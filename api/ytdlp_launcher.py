@@ -0,0 +1,65 @@
+"""Run yt-dlp with only its YouTube extractors loaded
+
+    python api/ytdlp_launcher.py [yt-dlp options] URL
+
+`python -m yt_dlp` registers all of yt-dlp's ~1,800 extractors before it looks
+at the URL, and matches the URL against them. This app only hands it YouTube
+URLs, so the launcher registers the YouTube extractors alone (the same
+yt_dlp.extractor.extractors hook yt-dlp's own lazy_extractors use), skips the
+plugin directory scan, and then runs yt-dlp's normal command line.
+
+If the yt-dlp in use doesn't have the internals this relies on, yt-dlp runs
+unmodified.
+"""
+
+import os
+import runpy
+import sys
+import types
+
+
+def restrict_to_youtube():
+    """Register only the YouTube extractors; returns False if yt-dlp's layout is unexpected"""
+    try:
+        from yt_dlp.extractor import youtube
+        from yt_dlp.globals import LAZY_EXTRACTORS
+        from yt_dlp.globals import extractors as extractors_context
+    except ImportError:
+        return False
+
+    lookup = {
+        name: value for name, value in vars(youtube).items()
+        if name.endswith('IE') and isinstance(value, type)
+    }
+    # YoutubeIE first: it handles watch URLs, which are nearly every request
+    lookup = {'YoutubeIE': lookup.pop('YoutubeIE'), **lookup}
+
+    module = types.ModuleType('yt_dlp.extractor.extractors')
+    module._CLASS_LOOKUP = lookup
+
+    def __getattr__(name):
+        value = lookup.get(name)
+        if not value:
+            raise AttributeError(f'module {module.__name__} has no attribute {name}')
+        return value
+
+    module.__getattr__ = __getattr__
+    sys.modules[module.__name__] = module
+    LAZY_EXTRACTORS.value = False
+    for name, value in lookup.items():
+        extractors_context.value.setdefault(name, value)
+    return True
+
+
+def main():
+    # Keep the API's own modules (this script's directory) off yt-dlp's import path
+    if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+        del sys.path[0]
+    if restrict_to_youtube():
+        # yt-dlp versions with this layout also have --no-plugin-dirs
+        sys.argv.insert(1, '--no-plugin-dirs')
+    runpy.run_module('yt_dlp', run_name='__main__', alter_sys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""ZIP archives streamed as they're assembled, for multi-file downloads
+
+Entries are stored (no compression) and written with data descriptors: each
+local header goes out before the entry's size and CRC are known, the body is
+relayed chunk by chunk while the CRC is computed, and the sizes and CRC follow
+the body. Nothing is buffered on disk, and at most prefetch_chunks chunks per
+entry in memory. While one entry is being sent the next one is already being
+opened and read ahead, so the gap between entries is hidden.
+
+Entries larger than 4 GiB, or with no known size, get ZIP64 headers.
+"""
+
+import queue
+import struct
+import threading
+import time
+import zlib
+
+PREFETCH_CHUNKS = 32  # Chunks of the next entry read ahead, at most (8 MiB with 256 KiB chunks)
+ZIP64_LIMIT = 0xFFFFFFFF
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_DATA_DESCRIPTOR = struct.Struct('<4s3L')
+_DATA_DESCRIPTOR64 = struct.Struct('<4sL2Q')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_END_RECORD64 = struct.Struct('<4sQ2H2L4Q')
+_END_LOCATOR64 = struct.Struct('<4sLQL')
+
+_FLAGS = 0x0008 | 0x0800  # Data descriptor follows, UTF-8 names
+_UNIX_FILE_ATTRIBUTES = 0o100644 << 16
+_DONE = object()
+
+
+def _dos_datetime(timestamp):
+    local = time.localtime(timestamp)
+    dos_date = (max(local.tm_year, 1980) - 1980) << 9 | local.tm_mon << 5 | local.tm_mday
+    dos_time = local.tm_hour << 11 | local.tm_min << 5 | local.tm_sec // 2
+    return dos_time, dos_date
+
+
+class _Prefetch:
+    """Opens an entry in the background and reads ahead up to PREFETCH_CHUNKS chunks
+
+    opener() returns (name, size or None, iterable of bytes).
+    """
+
+    def __init__(self, opener):
+        self.opener = opener
+        self.opened = threading.Event()
+        self.entry = None
+        self.error = None
+        self.body = None
+        self.chunks = queue.Queue(PREFETCH_CHUNKS)
+        self.closed = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _put(self, item):
+        while not self.closed:
+            try:
+                self.chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            name, size, self.body = self.opener()
+            self.entry = (name, size)
+        except Exception as e:
+            self.error = e
+            self.opened.set()
+            return
+        self.opened.set()
+        try:
+            for chunk in self.body:
+                if not self._put(chunk):
+                    return
+            self._put(_DONE)
+        except Exception as e:
+            self._put(e)
+        finally:
+            close = getattr(self.body, 'close', None)
+            if close:
+                close()
+
+    def result(self):
+        """(name, size) once opened; raises what the opener raised"""
+        self.opened.wait()
+        if self.error is not None:
+            raise self.error
+        return self.entry
+
+    def __iter__(self):
+        while True:
+            item = self.chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self.closed = True
+
+
+class ZipStream:
+    """Iterable of the bytes of a ZIP archive of the entries the openers return
+
+    Entries whose opener fails are left out and listed in an errors.txt entry at
+    the end; an entry failing halfway through can't be taken back, so it ends the
+    archive early with the exception.
+    """
+
+    def __init__(self, openers):
+        self.openers = list(openers)
+        self.timestamp = time.time()
+        self.offset = 0
+        self.records = []  # (name bytes, crc, size, offset, zip64)
+        self.names = set()
+        self.errors = []
+
+    def _unique_name(self, name):
+        stem, dot, extension = name.rpartition('.')
+        if not dot:
+            stem, extension = name, ''
+        candidate, counter = name, 1
+        while candidate in self.names:
+            counter += 1
+            candidate = f'{stem} ({counter}){dot}{extension}'
+        self.names.add(candidate)
+        return candidate
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def _local_header(self, name, zip64):
+        dos_time, dos_date = _dos_datetime(self.timestamp)
+        extra = struct.pack('<2H2Q', 0x0001, 16, 0, 0) if zip64 else b''
+        size = ZIP64_LIMIT if zip64 else 0
+        return _LOCAL_HEADER.pack(
+            b'PK\x03\x04', 45 if zip64 else 20, _FLAGS, 0, dos_time, dos_date,
+            0, size, size, len(name), len(extra)) + name + extra
+
+    def _entry(self, name, size, chunks):
+        """Yield one entry: local header, body and data descriptor"""
+        name = self._unique_name(name).encode('utf-8')
+        zip64 = size is None or size >= ZIP64_LIMIT
+        offset = self.offset
+        yield self._emit(self._local_header(name, zip64))
+
+        crc, length = 0, 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            length += len(chunk)
+            yield self._emit(chunk)
+        if not zip64 and length >= ZIP64_LIMIT:
+            raise ValueError(f'{name!r} is larger than its declared size')
+
+        if zip64:
+            yield self._emit(_DATA_DESCRIPTOR64.pack(b'PK\x07\x08', crc, length, length))
+        else:
+            yield self._emit(_DATA_DESCRIPTOR.pack(b'PK\x07\x08', crc, length, length))
+        self.records.append((name, crc, length, offset, zip64))
+
+    def _central_directory(self):
+        start = self.offset
+        dos_time, dos_date = _dos_datetime(self.timestamp)
+        for name, crc, size, offset, zip64 in self.records:
+            zip64 = zip64 or offset >= ZIP64_LIMIT
+            extra = struct.pack('<2H3Q', 0x0001, 24, size, size, offset) if zip64 else b''
+            yield self._emit(_CENTRAL_HEADER.pack(
+                b'PK\x01\x02', 3 << 8 | 45, 45 if zip64 else 20, _FLAGS, 0, dos_time, dos_date,
+                crc, ZIP64_LIMIT if zip64 else size, ZIP64_LIMIT if zip64 else size,
+                len(name), len(extra), 0, 0, 0, _UNIX_FILE_ATTRIBUTES,
+                ZIP64_LIMIT if zip64 else offset) + name + extra)
+
+        count = len(self.records)
+        size = self.offset - start
+        if count >= 0xFFFF or size >= ZIP64_LIMIT or start >= ZIP64_LIMIT:
+            end64 = self.offset
+            yield self._emit(_END_RECORD64.pack(b'PK\x06\x06', 44, 3 << 8 | 45, 45, 0, 0, count, count, size, start))
+            yield self._emit(_END_LOCATOR64.pack(b'PK\x06\x07', 0, end64, 1))
+        yield self._emit(_END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(size, ZIP64_LIMIT), min(start, ZIP64_LIMIT), 0))
+
+    def __iter__(self):
+        prefetches = []
+        try:
+            if self.openers:
+                prefetches.append(_Prefetch(self.openers[0]))
+            for index in range(len(self.openers)):
+                current = prefetches[index]
+                # Open and read ahead the next entry while this one is sent
+                if index + 1 < len(self.openers):
+                    prefetches.append(_Prefetch(self.openers[index + 1]))
+                try:
+                    name, size = current.result()
+                except Exception as e:
+                    self.errors.append(f'Entry {index + 1}: {e}')
+                    continue
+                yield from self._entry(name, size, current)
+                current.close()
+
+            if self.errors:
+                report = ('\n'.join(self.errors) + '\n').encode('utf-8')
+                yield from self._entry('errors.txt', len(report), [report])
+            yield from self._central_directory()
+        finally:
+            for prefetch in prefetches:
+                prefetch.close()
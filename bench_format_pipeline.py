@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the /api/formats format pipeline
+
+Runs the previous dict-based pipeline (per-format dicts, full sort, two filtered
+lists, two more sorts, jsonify-style serialisation) and the single-pass FormatRecord
+classifier with cached per-record encodings over recorded format lists, checks that
+both produce the same response, and reports timings.
+
+Usage:
+    python bench_format_pipeline.py [recorded.json ...]
+
+Record a format list with:
+    yt-dlp -J "<YouTube_URL>" > recorded.json
+
+Without arguments a synthetic list shaped like a six-client YouTube extraction is used.
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from format_records import classify_formats, encode_formats_response  # noqa: E402
+
+# (itag, ext, width, height, fps, vcodec, acodec, abr, tbr)
+YOUTUBE_LADDER = [
+    ('139', 'm4a', None, None, None, 'none', 'mp4a.40.5', 48.8, 48.8),
+    ('140', 'm4a', None, None, None, 'none', 'mp4a.40.2', 129.5, 129.5),
+    ('249', 'webm', None, None, None, 'none', 'opus', 53.2, 53.2),
+    ('250', 'webm', None, None, None, 'none', 'opus', 70.1, 70.1),
+    ('251', 'webm', None, None, None, 'none', 'opus', 135.4, 135.4),
+    ('18', 'mp4', 640, 360, 25, 'avc1.42001E', 'mp4a.40.2', 96.0, 544.2),
+    ('160', 'mp4', 256, 144, 25, 'avc1.4d400c', 'none', None, 82.1),
+    ('278', 'webm', 256, 144, 25, 'vp9', 'none', None, 74.3),
+    ('394', 'mp4', 256, 144, 25, 'av01.0.00M.08', 'none', None, 68.0),
+    ('133', 'mp4', 426, 240, 25, 'avc1.4d4015', 'none', None, 153.4),
+    ('242', 'webm', 426, 240, 25, 'vp9', 'none', None, 139.9),
+    ('395', 'mp4', 426, 240, 25, 'av01.0.00M.08', 'none', None, 131.2),
+    ('134', 'mp4', 640, 360, 25, 'avc1.4d401e', 'none', None, 364.6),
+    ('243', 'webm', 640, 360, 25, 'vp9', 'none', None, 271.8),
+    ('396', 'mp4', 640, 360, 25, 'av01.0.01M.08', 'none', None, 247.5),
+    ('135', 'mp4', 854, 480, 25, 'avc1.4d401e', 'none', None, 663.9),
+    ('244', 'webm', 854, 480, 25, 'vp9', 'none', None, 470.1),
+    ('397', 'mp4', 854, 480, 25, 'av01.0.04M.08', 'none', None, 452.2),
+    ('136', 'mp4', 1280, 720, 25, 'avc1.4d401f', 'none', None, 1228.6),
+    ('247', 'webm', 1280, 720, 25, 'vp9', 'none', None, 921.5),
+    ('398', 'mp4', 1280, 720, 25, 'av01.0.05M.08', 'none', None, 874.3),
+    ('137', 'mp4', 1920, 1080, 25, 'avc1.640028', 'none', None, 4401.8),
+    ('248', 'webm', 1920, 1080, 25, 'vp9', 'none', None, 1700.6),
+    ('399', 'mp4', 1920, 1080, 25, 'av01.0.08M.08', 'none', None, 1570.4),
+]
+
+PLAYER_CLIENTS = ('tv', 'android_sdkless', 'web', 'ios', 'android', 'web_safari')
+
+
+def synthetic_format_list():
+    """A format list shaped like a six-client extraction, with long signed URLs"""
+    formats = []
+    for client_index, client in enumerate(PLAYER_CLIENTS):
+        for quality, (itag, ext, width, height, fps, vcodec, acodec, abr, tbr) in enumerate(YOUTUBE_LADDER):
+            formats.append({
+                'format_id': itag if client_index == 0 else f'{itag}-{client_index}',
+                'format_note': f'{height}p' if height else 'medium',
+                'ext': ext,
+                'protocol': 'https',
+                'url': f'https://rr{client_index}---sn-abc.googlevideo.com/videoplayback?expire=1760000000&itag={itag}&c={client}&' + 'x' * 700,
+                'width': width,
+                'height': height,
+                'resolution': f'{width}x{height}' if height else 'audio only',
+                'fps': fps,
+                'vcodec': vcodec,
+                'acodec': acodec,
+                'abr': abr,
+                'vbr': None if height is None else tbr,
+                'tbr': tbr,
+                'quality': quality % 12,
+                'filesize': int(tbr * 1000 / 8 * 212),
+                'filesize_approx': None,
+                'format': f'{itag} - {width}x{height}' if height else f'{itag} - audio only',
+                'http_headers': {'User-Agent': 'Mozilla/5.0'},
+                'downloader_options': {'http_chunk_size': 10485760},
+            })
+    return formats
+
+
+def legacy_pipeline(formats):
+    """The dict-based pipeline /api/formats used before FormatRecord"""
+    filtered_formats = []
+    for format_data in formats:
+        if format_data.get('url') or format_data.get('format_id'):
+            format_obj = {
+                'format_id': format_data.get('format_id'),
+                'ext': format_data.get('ext'),
+                'resolution': format_data.get('resolution'),
+                'format_note': format_data.get('format_note'),
+                'filesize': format_data.get('filesize'),
+                'filesize_approx': format_data.get('filesize_approx'),
+                'vcodec': format_data.get('vcodec'),
+                'acodec': format_data.get('acodec'),
+                'fps': format_data.get('fps'),
+                'quality': format_data.get('quality'),
+                'width': format_data.get('width'),
+                'height': format_data.get('height'),
+                'tbr': format_data.get('tbr'),
+                'abr': format_data.get('abr'),
+                'vbr': format_data.get('vbr'),
+                'protocol': format_data.get('protocol'),
+                'format': format_data.get('format'),
+            }
+            if format_data.get('url'):
+                format_obj['url'] = format_data.get('url')
+            has_video = format_data.get('vcodec') and format_data.get('vcodec') != 'none'
+            has_audio = format_data.get('acodec') and format_data.get('acodec') != 'none'
+            if has_video and not has_audio:
+                format_obj['type'] = 'video'
+            elif has_audio and not has_video:
+                format_obj['type'] = 'audio'
+            else:
+                format_obj['type'] = 'combined'
+            filtered_formats.append(format_obj)
+
+    filtered_formats.sort(key=lambda x: x.get('quality', 0) or 0, reverse=True)
+    video_formats = [f for f in filtered_formats if f.get('type') in ['video', 'combined']]
+    audio_formats = [f for f in filtered_formats if f.get('type') in ['audio', 'combined']]
+    video_formats.sort(key=lambda x: (
+        x.get('height', 0) or 0,
+        x.get('width', 0) or 0,
+        x.get('quality', 0) or 0
+    ), reverse=True)
+    audio_formats.sort(key=lambda x: (
+        x.get('abr', 0) or 0,
+        x.get('quality', 0) or 0
+    ), reverse=True)
+    return json.dumps({
+        'formats': filtered_formats,
+        'videoFormats': video_formats,
+        'audioFormats': audio_formats,
+    }, separators=(',', ':'), sort_keys=True)
+
+
+def record_pipeline(formats):
+    """The single-pass FormatRecord pipeline, including serialisation of the response
+
+    Cross-client deduplication is left off so the output can be compared with the
+    legacy pipeline, which returned every client's copy of a stream.
+    """
+    return encode_formats_response({}, *classify_formats(formats, deduplicate=False))
+
+
+def deduplicated_pipeline(formats):
+    """The FormatRecord pipeline as /api/formats runs it, with cross-client deduplication"""
+    return encode_formats_response({}, *classify_formats(formats))
+
+
+def load_format_lists(paths):
+    """Load recorded format lists from yt-dlp info JSON files (or bare format lists)"""
+    format_lists = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        format_lists.append((os.path.basename(path), data.get('formats', []) if isinstance(data, dict) else data))
+    return format_lists
+
+
+def main():
+    format_lists = load_format_lists(sys.argv[1:]) or [('synthetic six-client', synthetic_format_list())]
+    number = int(os.environ.get('NUMBER', '200'))
+
+    print(f"⏱️  Format pipeline microbenchmark ({number} iterations)\n")
+    for name, formats in format_lists:
+        if json.loads(legacy_pipeline(formats)) != json.loads(record_pipeline(formats)):
+            print(f"❌ {name}: pipelines disagree")
+            continue
+
+        legacy = min(timeit.repeat(lambda: legacy_pipeline(formats), number=number, repeat=5)) / number
+        records = min(timeit.repeat(lambda: record_pipeline(formats), number=number, repeat=5)) / number
+        print(f"{name} ({len(formats)} formats)")
+        print(f"   legacy dicts: {legacy * 1e6:8.1f} µs")
+        print(f"   records:      {records * 1e6:8.1f} µs  ({legacy / records:.2f}x)")
+
+        deduplicated = min(timeit.repeat(lambda: deduplicated_pipeline(formats), number=number, repeat=5)) / number
+        body = deduplicated_pipeline(formats)
+        print(f"   deduplicated: {deduplicated * 1e6:8.1f} µs  ({legacy / deduplicated:.2f}x), "
+              f"{len(json.loads(body)['formats'])} formats, {len(body) / 1024:.1f} KiB "
+              f"vs {len(legacy_pipeline(formats)) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
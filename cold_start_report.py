@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Cold-start report for the API and for every yt-dlp spawn
+
+Measures, each in a fresh interpreter, the wall time and peak RSS of:
+  - importing api/app.py, as a cold serverless function does
+  - starting yt-dlp for a watch URL up to its first network request, with
+    `python -m yt_dlp` and with the slim launcher (ytdlp_launcher.py)
+
+yt-dlp is pointed at a closed local proxy port, so it fails at its first request
+and the numbers cover startup only; no network access is needed.
+
+Usage:
+    RUNS=5 python cold_start_report.py
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api')
+WATCH_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+OFFLINE_OPTIONS = [
+    '--ignore-config', '--no-cache-dir', '--simulate', '--proxy', 'http://127.0.0.1:9',
+    '--socket-timeout', '2', '--retries', '0', '--extractor-retries', '0',
+]
+
+
+def measure(cmd):
+    """(wall seconds, peak RSS in MiB) of running cmd to completion"""
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, 'HOME': '/tmp'})
+    _, _, usage = os.wait4(process.pid, 0)
+    process.returncode = 0  # Reaped by wait4
+    return time.perf_counter() - started, usage.ru_maxrss / 1024
+
+
+def report(label, cmd, runs):
+    samples = [measure(cmd) for _ in range(runs)]
+    wall = statistics.median(sample[0] for sample in samples)
+    rss = statistics.median(sample[1] for sample in samples)
+    print(f"{label:>28}: {wall * 1000:8.1f} ms  {rss:7.1f} MiB peak RSS")
+    return wall, rss
+
+
+def top_imports(count=8):
+    """The slowest top-level imports of api/app.py, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {API_DIR!r}); import app'],
+        capture_output=True, text=True, env={**os.environ, 'HOME': '/tmp'})
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Direct imports of the app are indented by exactly three spaces
+        if name.startswith('   ') and not name.startswith('    '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    runs = int(os.environ.get('RUNS', '5'))
+    print(f"🧊 Cold-start report (median of {runs} runs)\n")
+
+    report('python (baseline)', [sys.executable, '-c', 'pass'], runs)
+    report('import app', [sys.executable, '-c', f'import sys; sys.path.insert(0, {API_DIR!r}); import app'], runs)
+    print("\n   slowest imports of app.py:")
+    for cumulative, name in top_imports():
+        print(f"   {cumulative / 1000:8.1f} ms  {name}")
+
+    print()
+    standard = report('python -m yt_dlp', [sys.executable, '-m', 'yt_dlp', *OFFLINE_OPTIONS, WATCH_URL], runs)
+    slim = report('ytdlp_launcher.py', [sys.executable, os.path.join(API_DIR, 'ytdlp_launcher.py'), *OFFLINE_OPTIONS, WATCH_URL], runs)
+    print(f"\n   slim launcher saves {(standard[0] - slim[0]) * 1000:.1f} ms "
+          f"({(1 - slim[0] / standard[0]) * 100:.0f}%) and {standard[1] - slim[1]:.1f} MiB per extraction")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Compare the full --dump-json extraction against the trimmed extraction profile
+
+Runs yt-dlp with each profile's options and reports how many bytes the
+extractor printed and how long extraction and parsing took.
+
+Usage:
+    python compare_extraction_profiles.py [YouTube_URL ...]
+    python compare_extraction_profiles.py --info-json recorded.info.json[.gz] [...]
+
+Without arguments the recorded fixture fixtures/sample_video.info.json.gz is
+replayed with --load-info-json, so the run needs no network and is
+reproducible. A replay measures what yt-dlp prints and how long the output takes
+to print and parse. It doesn't measure the network time that skipping the
+manifests and translated subtitles saves; run against real URLs for that
+(COOKIES=path/to/cookies.txt to send cookies).
+
+Record a fixture with:
+    yt-dlp -J "<YouTube_URL>" > recorded.info.json
+"""
+
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+from extraction_profile import PROFILES, YOUTUBE_PLAYER_CLIENTS, get_extraction_profile, parse_extraction_output  # noqa: E402
+
+YTDLP_COMMAND = [sys.executable, os.path.join(ROOT, 'api', 'ytdlp_launcher.py')]
+FIXTURE = os.path.join(ROOT, 'fixtures', 'sample_video.info.json.gz')
+
+
+def build_command(profile, source, info_json):
+    """yt-dlp command line for one profile, reading source as a URL or a recorded info JSON"""
+    extractor_args, output_options = get_extraction_profile(profile)
+    youtube_args = {'player_client': YOUTUBE_PLAYER_CLIENTS, **(extractor_args or {})}
+    cmd = [
+        *YTDLP_COMMAND,
+        *output_options,
+        '--no-download',
+        '--no-warnings',
+        '--extractor-args', 'youtube:' + ';'.join(f'{key}={value}' for key, value in youtube_args.items()),
+    ]
+    if os.environ.get('COOKIES'):
+        cmd.extend(['--cookies', os.environ['COOKIES']])
+    if info_json:
+        return [*cmd, '--load-info-json', source]
+    return [*cmd, source]
+
+
+def run_profile(profile, source, runs, info_json=False):
+    """Run one extraction profile and return (stdout bytes, extraction seconds, parse seconds, format count)"""
+    cmd = build_command(profile, source, info_json)
+    total_bytes = 0
+    extract_time = 0.0
+    parse_time = 0.0
+    format_count = 0
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=90, env={**os.environ, 'HOME': '/tmp'})
+        extract_time += time.perf_counter() - start
+
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'yt-dlp failed')
+
+        total_bytes += len(result.stdout.encode('utf-8'))
+        start = time.perf_counter()
+        video_info = parse_extraction_output(result.stdout, profile)
+        parse_time += time.perf_counter() - start
+        format_count = len(video_info.get('formats', []))
+
+    return total_bytes / runs, extract_time / runs, parse_time / runs, format_count
+
+
+def unpack(path, directory):
+    """A recorded info JSON as a plain file yt-dlp can load"""
+    if not path.endswith('.gz'):
+        return path
+    unpacked = os.path.join(directory, os.path.basename(path)[:-3])
+    with gzip.open(path, 'rb') as src, open(unpacked, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return unpacked
+
+
+def main():
+    args = sys.argv[1:]
+    info_json = not args or args[0] == '--info-json'
+    sources = (args[1:] if args else [FIXTURE]) if info_json else args
+    runs = int(os.environ.get('RUNS', '3'))
+
+    print(f"📏 Comparing extraction profiles ({runs} runs each)\n")
+    with tempfile.TemporaryDirectory() as directory:
+        for source in sources:
+            print(f"--- {os.path.relpath(source, ROOT) if info_json else source} ---")
+            target = unpack(source, directory) if info_json else source
+            results = {}
+            for profile in reversed(PROFILES):
+                try:
+                    results[profile] = run_profile(profile, target, runs, info_json)
+                except Exception as e:
+                    print(f"❌ {profile}: {e}")
+                    continue
+                size, extract_time, parse_time, format_count = results[profile]
+                print(f"{profile:>8}: {size / 1024:9.1f} KiB  extract {extract_time:6.2f}s  parse {parse_time * 1000:7.2f}ms  {format_count} formats")
+
+            if len(results) == 2:
+                full, trimmed = results['full'], results['trimmed']
+                print(f"   saved: {(1 - trimmed[0] / full[0]) * 100:5.1f}% bytes, "
+                      f"{full[1] - trimmed[1]:.2f}s extraction, {(full[2] - trimmed[2]) * 1000:.2f}ms parsing")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script for egress bandwidth sharing between download clients
+Runs BandwidthScheduler.throttle over in-memory bodies and measures what each
+client gets, so no network is needed
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from bandwidth import BandwidthScheduler, TokenBucket  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+def endless_body(stop):
+    while not stop.is_set():
+        yield b'x' * CHUNK
+
+
+def measure(scheduler, downloads, seconds):
+    """Run (client_id, count) concurrent downloads for seconds; bytes each client got"""
+    stop = threading.Event()
+    received = {client_id: 0 for client_id, _ in downloads}
+    lock = threading.Lock()
+
+    def download(client_id):
+        for chunk in scheduler.throttle(client_id, endless_body(stop), CHUNK):
+            with lock:
+                received[client_id] += len(chunk)
+
+    threads = [
+        threading.Thread(target=download, args=(client_id,), daemon=True)
+        for client_id, count in downloads for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+    return received
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=1024 * 1024, burst=256 * 1024)
+    assert bucket.delay(256 * 1024) == 0, 'a full bucket should allow its burst at once'
+    bucket.take(256 * 1024)
+    delay = bucket.delay(128 * 1024)
+    assert 0.1 < delay < 0.15, f'refill of 128 KiB at 1 MiB/s took {delay:.3f}s'
+    # Larger than the burst: allowed once the bucket is full again, not never
+    assert bucket.delay(1024 * 1024) <= 0.26
+
+
+def test_fair_share_per_client_not_per_connection():
+    scheduler = BandwidthScheduler(rate=8 * 1024 * 1024)
+    received = measure(scheduler, [('many', 4), ('one', 1)], 1.5)
+    ratio = received['many'] / received['one']
+    assert 0.75 < ratio < 1.33, f'4 downloads got {ratio:.2f}x what 1 download got'
+    total = sum(received.values())
+    assert total < 8 * 1024 * 1024 * 1.5 * 1.2, f'{total} bytes sent, over the egress limit'
+
+
+def test_weights():
+    scheduler = BandwidthScheduler(rate=8 * 1024 * 1024, weights={'heavy': 2})
+    received = measure(scheduler, [('heavy', 1), ('light', 1)], 1.5)
+    ratio = received['heavy'] / received['light']
+    assert 1.6 < ratio < 2.5, f'weight 2 got {ratio:.2f}x'
+
+
+def test_client_cap_covers_all_its_downloads():
+    scheduler = BandwidthScheduler(rate=8 * 1024 * 1024, client_rate=1024 * 1024, client_burst=CHUNK)
+    received = measure(scheduler, [('one', 1), ('many', 3)], 1.5)
+    for client_id, sent in received.items():
+        assert 1.5 * 1024 * 1024 * 0.8 < sent < 1.5 * 1024 * 1024 * 1.2, f'{client_id} got {sent} bytes'
+
+
+def test_client_cap_and_burst():
+    burst = 512 * 1024
+    scheduler = BandwidthScheduler(client_rate=1024 * 1024, client_burst=burst)
+    body = [b'x' * CHUNK] * ((burst + 1024 * 1024) // CHUNK)
+    started = time.monotonic()
+    times = []
+    for _ in scheduler.throttle('client', iter(body), CHUNK):
+        times.append(time.monotonic() - started)
+    burst_time = times[burst // CHUNK - 1]
+    assert burst_time < 0.1, f'the burst took {burst_time:.3f}s'
+    assert 0.9 < times[-1] < 1.2, f'burst + 1 MiB at 1 MiB/s took {times[-1]:.2f}s'
+
+
+def test_idle_client_does_not_bank_credit():
+    scheduler = BandwidthScheduler(rate=8 * 1024 * 1024)
+    measure(scheduler, [('early', 1)], 0.5)
+    assert 'early' not in scheduler.clients, 'an idle client kept its queue state'
+    received = measure(scheduler, [('early', 1), ('busy', 1)], 1.0)
+    ratio = received['early'] / received['busy']
+    assert 0.75 < ratio < 1.33, f'the returning client got {ratio:.2f}x'
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing egress bandwidth sharing\n")
+
+    tests = [
+        test_token_bucket_burst,
+        test_fair_share_per_client_not_per_connection,
+        test_weights,
+        test_client_cap_covers_all_its_downloads,
+        test_client_cap_and_burst,
+        test_idle_client_does_not_bank_credit,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared cache backends
+Runs the memory, shared-memory, SQLite and Redis-protocol caches locally; the Redis
+cache talks to a small in-process stand-in server, so no Redis installation is needed
+"""
+
+import hashlib
+import multiprocessing
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from cache_backends import MemoryCache, RedisCache, SharedMemoryCache, SQLiteCache, TieredCache, create_cache  # noqa: E402
+from response_cache import PreparedResponse  # noqa: E402
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """Minimal Redis-protocol server: PING, AUTH, SELECT, GET, SET (with PX) and DEL"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), RedisStandInHandler)
+        self.password = password
+        self.data = {}
+        self.lock = threading.Lock()
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line.startswith(b'*'):
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        authenticated = self.server.password is None
+        while True:
+            args = self.read_command()
+            if not args:
+                return
+            command = args[0].upper()
+            if command == b'AUTH':
+                authenticated = args[-1].decode() == self.server.password
+                self.wfile.write(b'+OK\r\n' if authenticated else b'-WRONGPASS invalid password\r\n')
+            elif not authenticated:
+                self.wfile.write(b'-NOAUTH Authentication required\r\n')
+            elif command == b'PING':
+                self.wfile.write(b'+PONG\r\n')
+            elif command == b'SELECT':
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'SET':
+                expires = None
+                if len(args) >= 5 and args[3].upper() == b'PX':
+                    expires = time.time() + int(args[4]) / 1000
+                with self.server.lock:
+                    self.server.data[args[1]] = (args[2], expires)
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'GET':
+                with self.server.lock:
+                    value, expires = self.server.data.get(args[1], (None, None))
+                if value is None or (expires and expires <= time.time()):
+                    self.wfile.write(b'$-1\r\n')
+                else:
+                    self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+            elif command == b'DEL':
+                with self.server.lock:
+                    removed = self.server.data.pop(args[1], None) is not None
+                self.wfile.write(b':%d\r\n' % removed)
+            else:
+                self.wfile.write(b'-ERR unknown command\r\n')
+
+
+def check_round_trip(cache):
+    """Set, get, overwrite, delete and expire through one backend"""
+    assert cache.get('missing') is None
+    cache.set('key', b'value', 60)
+    assert cache.get('key') == b'value'
+    cache.set('key', b'\x00binary\r\nvalue', 60)
+    assert cache.get('key') == b'\x00binary\r\nvalue'
+    cache.delete('key')
+    assert cache.get('key') is None
+    cache.set('short', b'value', 0.05)
+    time.sleep(0.1)
+    assert cache.get('short') is None
+    cache.set('expired', b'value', -1)
+    assert cache.get('expired') is None
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_bytes=1024)
+    check_round_trip(cache)
+
+    # Least recently used entries go first once the size bound is reached
+    for i in range(4):
+        cache.set(f'entry{i}', b'x' * 300, 60)
+    assert cache.get('entry0') is None
+    assert cache.get('entry3') == b'x' * 300
+    assert cache.stats()['bytes'] <= 1024
+
+
+def shared_memory_worker(path, worker, results):
+    """Write and read self-checking values from another process"""
+    cache = SharedMemoryCache(path, max_bytes=64 * 1024, slab_size=1024)
+    corrupt = 0
+    for i in range(500):
+        key = f'key{(i * 7 + worker) % 100}'
+        if i % 3 == 0:
+            payload = os.urandom(200 + i % 500)
+            cache.set(key, hashlib.sha256(key.encode() + payload).digest() + payload, 60)
+        else:
+            value = cache.get(key)
+            if value is not None and hashlib.sha256(key.encode() + value[32:]).digest() != value[:32]:
+                corrupt += 1
+    results.put(corrupt)
+
+
+def test_shared_memory_cache():
+    directory = tempfile.mkdtemp(prefix='debutube_cache_test_')
+    try:
+        path = os.path.join(directory, 'cache')
+        cache = SharedMemoryCache(path, max_bytes=4 * 1024, slab_size=1024)
+        check_round_trip(cache)
+        cache.set('too big', b'x' * 1024, 60)
+        assert cache.get('too big') is None
+
+        # CLOCK eviction keeps recently read entries
+        for i in range(4):
+            cache.set(f'entry{i}', b'x' * 300, 60)
+        cache.get('entry0')
+        cache.set('entry4', b'x' * 300, 60)
+        assert cache.get('entry0') == b'x' * 300
+        assert cache.get('entry1') is None
+        assert cache.stats()['entries'] == 4
+
+        # Another worker maps the same file
+        other = create_cache(f'shm://{path}?slab_size=1024', max_bytes=4 * 1024)
+        assert other.get('entry4') == b'x' * 300
+
+        # A writer that died mid-update leaves the sequence odd: readers miss, the
+        # next writer reinitialises the file
+        cache._set_sequence(cache._sequence() + 1)
+        assert other.get('entry4') is None
+        other.set('fresh', b'value', 60)
+        assert cache.get('fresh') == b'value'
+        assert cache.get('entry4') is None
+        assert cache.stats()['generation'] == 1
+
+        # Concurrent writers and readers in separate processes never see torn values
+        path = os.path.join(directory, 'concurrent')
+        SharedMemoryCache(path, max_bytes=64 * 1024, slab_size=1024)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [context.Process(target=shared_memory_worker, args=(path, i, results)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        corrupt = sum(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+        assert corrupt == 0, f'{corrupt} torn reads'
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_shared_memory_cache_keeps_its_size():
+    directory = tempfile.mkdtemp(prefix='debutube_cache_test_')
+    try:
+        path = os.path.join(directory, 'cache')
+        cache = SharedMemoryCache(path, max_bytes=16 * 1024, slab_size=1024)
+        cache.set('kept', b'value', 60)
+        size = os.path.getsize(path)
+
+        # A worker configured differently uses the existing file as it is, instead of
+        # truncating it under the workers that have it mapped (SIGBUS)
+        other = SharedMemoryCache(path, max_bytes=4 * 1024, slab_size=512)
+        assert os.path.getsize(path) == size
+        assert (other.slab_count, other.slab_size) == (cache.slab_count, cache.slab_size)
+        assert other.get('kept') == b'value'
+        other.set('from other', b'x' * 700, 60)
+        assert cache.get('from other') == b'x' * 700
+        assert cache.get('kept') == b'value'
+
+        # A file that isn't a cache of a usable size is refused, not reshaped
+        foreign = os.path.join(directory, 'foreign')
+        with open(foreign, 'wb') as f:
+            f.write(b'not a cache' * 100)
+        try:
+            SharedMemoryCache(foreign, max_bytes=4 * 1024, slab_size=1024)
+            assert False, 'a foreign file was opened as a cache'
+        except ValueError:
+            pass
+        assert os.path.getsize(foreign) == 1100
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_tiered_cache():
+    near, far = MemoryCache(), MemoryCache()
+    cache = create_cache('memory://,memory://')
+    assert isinstance(cache, TieredCache)
+    cache = TieredCache([near, far])
+    cache.set('key', b'value', 60)
+    assert near.get('key') == far.get('key') == b'value'
+
+    # A hit in the far tier is copied into the near one
+    near.delete('key')
+    assert cache.get('key') == b'value'
+    assert near.get('key') == b'value'
+    cache.delete('key')
+    assert cache.get('key') is None and far.get('key') is None
+
+
+def test_sqlite_cache():
+    directory = tempfile.mkdtemp(prefix='debutube_cache_test_')
+    try:
+        path = os.path.join(directory, 'cache.db')
+        cache = SQLiteCache(path, max_bytes=1024)
+        check_round_trip(cache)
+
+        for i in range(3):
+            cache.set(f'entry{i}', b'x' * 300, 60)
+            time.sleep(0.01)
+        cache.get('entry0')  # entry1 is now the least recently used
+        cache.set('entry3', b'x' * 300, 60)
+        assert cache.get('entry1') is None
+        assert cache.get('entry0') == b'x' * 300
+
+        # A second instance (another worker) sees the same entries
+        other = create_cache(f'sqlite:///{path}')
+        assert other.get('entry3') == b'x' * 300
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_redis_cache():
+    server = RedisStandIn(password='secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.server_address[1]
+        cache = create_cache(f'redis://:secret@127.0.0.1:{port}/2')
+        assert isinstance(cache, RedisCache)
+        assert cache.ping()
+        check_round_trip(cache)
+        assert b'debutube:key' not in server.data
+
+        # Connections from other threads (workers) share the data
+        results = []
+        cache.set('shared', b'value', 60)
+        thread = threading.Thread(target=lambda: results.append(cache.get('shared')))
+        thread.start()
+        thread.join()
+        assert results == [b'value']
+
+        # A wrong password or a dead server is a miss, not an exception
+        assert create_cache(f'redis://:wrong@127.0.0.1:{port}').get('shared') is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    unreachable = RedisCache(port=port)
+    assert unreachable.get('shared') is None
+    assert unreachable.stats()['errors'] == 1
+
+
+def test_prepared_response_round_trip():
+    body = '{"formats":[' + ','.join(['{"format_id":"18"}'] * 200) + ']}'
+    prepared = PreparedResponse(body, time.time() + 60)
+    restored = PreparedResponse.from_bytes(prepared.to_bytes())
+    assert restored.body == prepared.body
+    assert restored.etag == prepared.etag
+    assert restored.encoded == prepared.encoded
+    assert len(prepared.to_bytes()) < len(prepared.body)
+
+    small = PreparedResponse('{"ok":true}', time.time() + 60)
+    assert PreparedResponse.from_bytes(small.to_bytes()).body == b'{"ok":true}'
+    assert PreparedResponse.from_bytes(b'not a cached response') is None
+
+
+def test_lazy_prepared_response():
+    from werkzeug.datastructures import Accept
+
+    body = '{"formats":[' + ','.join(['{"format_id":"18"}'] * 200) + ']}'
+    eager = PreparedResponse(body, time.time() + 60)
+    lazy = PreparedResponse(body, time.time() + 60, lazy=True)
+    assert lazy.encoded == {}, 'a lazy response was compressed up front'
+    assert lazy.etags() == eager.etags()
+
+    data, encoding = lazy.for_encoding(Accept([('gzip', 1)]))
+    assert encoding == 'gzip' and data == eager.encoded['gzip']
+    assert list(lazy.encoded) == ['gzip'], 'encodings the client did not ask for were computed'
+    assert lazy.for_encoding(Accept([])) == (lazy.body, None)
+    assert list(lazy.encoded) == ['gzip']
+
+    # Cached after all: stored with every encoding, like an eager response
+    assert PreparedResponse.from_bytes(lazy.to_bytes()).encoded == eager.encoded
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing shared cache backends\n")
+
+    tests = [test_memory_cache, test_shared_memory_cache, test_shared_memory_cache_keeps_its_size, test_tiered_cache,
+             test_sqlite_cache, test_redis_cache, test_prepared_response_round_trip, test_lazy_prepared_response]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
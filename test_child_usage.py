@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for yt-dlp child resource limits and usage accounting
+Runs python -c children through ChildUsage and checks that their limits are in
+place before they run, that wait4's usage is recorded, and that a child ended
+by its CPU or memory limit is reported as such
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from child_usage import STATUS_LOST, ChildUsage, parse_limits  # noqa: E402
+
+# Prints the child's own limits first thing, before anything else can change them
+PRINT_LIMITS = ('import json, resource; print(json.dumps({name: resource.getrlimit(getattr(resource, "RLIMIT_" + name))'
+                ' for name in ("CPU", "DATA")}))')
+
+
+def test_limits_set_before_exec():
+    limits = parse_limits('cpu=7,data=1G')
+    assert [(name, limit) for name, _, limit in limits] == [('cpu', (7, 12)), ('data', (1024 ** 3, 1024 ** 3))]
+    result = ChildUsage('test', limits).run('limits', None, [sys.executable, '-c', PRINT_LIMITS], timeout=20)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == {'CPU': [7, 12], 'DATA': [1024 ** 3, 1024 ** 3]}, result.stdout
+
+    try:
+        parse_limits('cpu=7,bogus=1')
+        assert False, 'an unknown limit was accepted'
+    except ValueError:
+        pass
+
+
+def test_usage_recorded():
+    records = []
+    children = ChildUsage('test', listener=records.append)
+    code = ('import time; block = bytearray(128 * 1024 * 1024); started = time.process_time()\n'
+            'while time.process_time() - started < 0.3: pass')
+    children.run('burn', 'video0001', [sys.executable, '-c', code], timeout=20)
+    (entry,) = records
+    assert entry['kind'] == 'burn' and entry['label'] == 'video0001' and entry['returncode'] == 0
+    assert entry['cpu_seconds'] >= 0.3, entry
+    assert entry['max_rss_bytes'] >= 128 * 1024 * 1024, entry
+    assert entry['wall_seconds'] >= entry['cpu_seconds'] - 0.1 and entry['limit'] is None
+
+    stats = children.stats()
+    assert stats['kinds']['burn']['runs'] == 1
+    assert stats['heaviest_memory'][0]['label'] == 'video0001'
+
+
+def test_limit_hits_detected():
+    children = ChildUsage('test', parse_limits('cpu=1,data=256M'))
+    result = children.run('spin', None, [sys.executable, '-c', 'while True: pass'], timeout=20)
+    assert result.returncode == -24, result.returncode  # SIGXCPU at the soft limit
+    result = children.run('allocate', None, [sys.executable, '-c', 'bytearray(1024 ** 3)'], timeout=20)
+    assert result.returncode == 1 and 'MemoryError' in result.stderr, result.stderr
+    # An ordinary failure isn't blamed on the limits
+    children.run('fail', None, [sys.executable, '-c', 'raise SystemExit(2)'], timeout=20)
+
+    stats = children.stats()
+    assert stats['kinds']['spin']['limit_kills'] == {'cpu': 1}, stats['kinds']['spin']
+    assert stats['kinds']['allocate']['limit_kills'] == {'memory': 1}, stats['kinds']['allocate']
+    assert stats['kinds']['fail']['limit_kills'] == {}
+
+
+def test_reaped_elsewhere_is_not_success():
+    records = []
+    children = ChildUsage('test', listener=records.append)
+    process = children.popen([sys.executable, '-c', 'raise SystemExit(3)'])
+    os.waitpid(process.pid, 0)  # What SIGCHLD set to SIG_IGN would do
+    assert process.wait(timeout=5) == STATUS_LOST and process.status_lost
+    assert process.usage is None
+    entry = children.record('lost', None, process)
+    assert entry['returncode'] is None and entry['limit'] is None, entry
+    assert records == [entry]
+
+    # Reaped normally, the exit status is kept
+    process = children.popen([sys.executable, '-c', 'raise SystemExit(3)'])
+    assert process.wait(timeout=5) == 3 and not process.status_lost
+    try:
+        process.wait(timeout=0)
+    except subprocess.TimeoutExpired:
+        assert False, 'waiting again for a reaped child'
+    assert process.returncode == 3
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing child process limits and usage accounting\n")
+
+    tests = [
+        test_limits_set_before_exec,
+        test_usage_recorded,
+        test_limit_hits_detected,
+        test_reaped_elsewhere_is_not_success,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Test script for the trimmed /api/formats extraction profile
+Runs prepare_formats against a yt-dlp stand-in that behaves like YouTube does
+for a live stream: no formats at all while the HLS/DASH manifests are skipped,
+the stale-while-revalidate listing path through the same stand-in, and
+run_extraction's streaming parse against children that print records
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STAND_IN_DIR = tempfile.mkdtemp(prefix='debutube_profile_test_')
+STAND_IN_LOG = os.path.join(STAND_IN_DIR, 'runs.log')
+os.environ['STAND_IN_LOG'] = STAND_IN_LOG
+os.environ.setdefault('DEBUTUBE_PREFETCH_DIRECT_URLS', '0')
+os.environ.setdefault('DEBUTUBE_JOB_WORKERS', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import app  # noqa: E402
+
+# Prints the trimmed profile's two lines for video IDs starting with "vod" or "live";
+# live streams only have formats when hls isn't skipped, "gone" videos never do
+STAND_IN = r'''
+import json, os, sys, time
+time.sleep(float(os.environ.get('STAND_IN_DELAY', '0')))
+args = sys.argv[1:]
+with open(os.environ['STAND_IN_LOG'], 'a') as f:
+    f.write(json.dumps(args) + '\n')
+youtube_args = args[args.index('--extractor-args') + 1].split(':', 1)[1]
+skip = dict(arg.split('=', 1) for arg in youtube_args.split(';')).get('skip', '').split(',')
+video_id = args[-1].rsplit('=', 1)[-1]
+live = video_id.startswith('live')
+if video_id.startswith('gone') or (live and 'hls' in skip):
+    sys.stderr.write(f'ERROR: [youtube] {video_id}: No video formats found!\n')
+    sys.exit(1)
+print(json.dumps({'id': video_id, 'title': 'Stand-in', 'is_live': live, 'duration': None if live else 212}))
+if live:
+    formats = [{'format_id': str(itag), 'ext': 'mp4', 'protocol': 'm3u8_native', 'vcodec': 'avc1.4d401f',
+                'acodec': 'mp4a.40.2', 'height': height, 'width': height * 16 // 9,
+                'url': f'https://manifest.googlevideo.com/api/manifest/hls_playlist/id/{video_id}/itag/{itag}/index.m3u8'}
+               for itag, height in ((93, 360), (95, 720))]
+else:
+    formats = [{'format_id': '18', 'ext': 'mp4', 'protocol': 'https', 'vcodec': 'avc1.42001E',
+                'acodec': 'mp4a.40.2', 'height': 360, 'width': 640,
+                'url': f'https://rr1---sn-x.googlevideo.com/videoplayback?id={video_id}&itag=18'}]
+print(json.dumps(formats))
+'''
+
+
+def make_stand_in():
+    path = os.path.join(STAND_IN_DIR, 'yt_dlp_stand_in.py')
+    with open(path, 'w') as f:
+        f.write(STAND_IN)
+    app.YTDLP_COMMAND = [sys.executable, path]
+    app.EXTRACTION_PROFILE = 'trimmed'
+
+
+make_stand_in()
+
+
+def stand_in_runs():
+    """Arguments of every stand-in run since the last call"""
+    if not os.path.exists(STAND_IN_LOG):
+        return []
+    with open(STAND_IN_LOG) as f:
+        runs = [json.loads(line) for line in f]
+    os.remove(STAND_IN_LOG)
+    return runs
+
+
+def runs_for(runs, video_id):
+    return [args for args in runs if args[-1].endswith(video_id)]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def skipped(args):
+    youtube_args = args[args.index('--extractor-args') + 1]
+    return youtube_args.split('skip=', 1)[1].split(';', 1)[0].split(',')
+
+
+def test_vod_skips_manifests():
+    stand_in_runs()
+    prepared = app.prepare_formats('https://www.youtube.com/watch?v=vodVideo001')
+    body = json.loads(prepared.body)
+    assert [f['format_id'] for f in body['formats']] == ['18'], body['formats']
+    runs = stand_in_runs()
+    assert len(runs) == 1, f'{len(runs)} extractions'
+    assert 'hls' in skipped(runs[0]) and 'dash' in skipped(runs[0])
+
+
+def test_live_stream_gets_manifest_formats():
+    stand_in_runs()
+    prepared = app.prepare_formats('https://www.youtube.com/watch?v=liveStream1')
+    body = json.loads(prepared.body)
+    assert body['videoInfo']['is_live'] is True
+    assert sorted(f['format_id'] for f in body['formats']) == ['93', '95'], body['formats']
+    assert all(f['protocol'] == 'm3u8_native' for f in body['formats'])
+    runs = stand_in_runs()
+    assert len(runs) == 2, f'{len(runs)} extractions'
+    assert 'hls' in skipped(runs[0]) and 'hls' not in skipped(runs[1])
+
+
+def test_video_without_formats_still_fails():
+    stand_in_runs()
+    try:
+        app.prepare_formats('https://www.youtube.com/watch?v=goneVideo01')
+    except app.ExtractionError as e:
+        assert 'No video formats found' in e.error_response['error'], e.error_response
+    else:
+        assert False, 'no ExtractionError'
+    assert len(stand_in_runs()) == 2
+
+
+def test_full_profile_does_not_retry():
+    stand_in_runs()
+    app.EXTRACTION_PROFILE = 'full'
+    try:
+        app.prepare_formats('https://www.youtube.com/watch?v=goneVideo02')
+    except app.ExtractionError:
+        pass
+    finally:
+        app.EXTRACTION_PROFILE = 'trimmed'
+    assert len(stand_in_runs()) == 1
+
+
+def test_conditional_requests_only_for_get():
+    app.CACHE.delete(app.get_formats_cache_key('vodVideo002'))
+    client = app.app.test_client()
+    response = client.get('/api/formats/vodVideo002')
+    assert response.status_code == 200, response.status_code
+    etag = response.headers['ETag']
+    assert client.get('/api/formats/vodVideo002', headers={'If-None-Match': etag}).status_code == 304
+    response = client.post('/api/formats', json={'url': 'https://www.youtube.com/watch?v=vodVideo002'},
+                           headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json()['formats'], response.status_code
+
+
+def test_stale_listing_served_while_refreshing():
+    formats_key = app.get_formats_cache_key('vodVideo003')
+    app.CACHE.delete(formats_key)
+    app.CACHE.delete(app.get_listing_cache_key('vodVideo003'))
+    client = app.app.test_client()
+    stand_in_runs()
+    assert client.get('/api/formats/vodVideo003').headers['X-Cache'] == 'MISS'
+    assert len(runs_for(stand_in_runs(), 'vodVideo003')) == 1
+
+    # The signed URLs expired; the metadata and format listing are still cached
+    app.CACHE.delete(formats_key)
+    os.environ['STAND_IN_DELAY'] = '1'
+    try:
+        for _ in range(5):
+            started = time.monotonic()
+            response = client.get('/api/formats/vodVideo003')
+            assert time.monotonic() - started < 0.5, 'a stale request waited for the extraction'
+            assert response.headers['X-Cache'] == 'STALE', response.headers['X-Cache']
+            body = response.get_json()
+            assert body['urlsRefreshing'] and body['formats'] and 'url' not in body['formats'][0]
+        assert wait_for(lambda: app.get_cached_response(formats_key) is not None), 'the refresh never finished'
+    finally:
+        del os.environ['STAND_IN_DELAY']
+    assert wait_for(lambda: not app.BACKGROUND_REFRESHES)
+    assert len(runs_for(stand_in_runs(), 'vodVideo003')) == 1, 'the stale entry was refreshed more than once'
+    body = client.get('/api/formats/vodVideo003').get_json()
+    assert body['formats'][0]['url'] and not body.get('urlsRefreshing')
+
+
+class Child:
+    """A python -c child for run_extraction that writes its PID to a file first"""
+
+    def __init__(self, code):
+        self.pid_file = os.path.join(STAND_IN_DIR, f'child_{time.monotonic_ns()}.pid')
+        prelude = f'import json, os, sys, time; open({self.pid_file!r}, "w").write(str(os.getpid())); '
+        self.cmd = [sys.executable, '-c', prelude + code]
+
+    def run(self, **options):
+        return app.run_extraction(self.cmd, **options)
+
+    def gone(self):
+        """Whether the child has exited and been reaped"""
+        with open(self.pid_file) as f:
+            pid = int(f.read())
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        return False
+
+
+def test_child_killed_once_records_read():
+    child = Child('print(json.dumps({"id": "early", "title": "x"})); print(json.dumps([{"format_id": "18"}])); '
+                  'sys.stdout.flush(); time.sleep(30)')
+    started = time.monotonic()
+    video_info, returncode, _ = child.run(timeout=20)
+    assert time.monotonic() - started < 5, 'waited for the child to exit'
+    assert returncode == 0 and video_info['id'] == 'early' and video_info['formats'][0]['format_id'] == '18'
+    assert child.gone(), 'the child was left running'
+
+
+def test_output_cap_kills_child():
+    child = Child('sys.stdout.write("x" * 1048576); sys.stdout.flush(); time.sleep(30)')
+    try:
+        child.run(timeout=20, max_output_bytes=64 * 1024)
+        assert False, 'output past the cap was accepted'
+    except app.ExtractorOutputTooLarge:
+        pass
+    assert child.gone(), 'the child was left running'
+
+
+def test_last_line_without_newline():
+    video_info, returncode, stderr = Child(
+        'sys.stderr.write("WARNING: slow\\n"); print(json.dumps({"id": "tail", "title": "x"})); '
+        'sys.stdout.write(json.dumps([{"format_id": "22"}, {"format_id": "18"}]))').run()
+    assert returncode == 0 and video_info['id'] == 'tail', video_info
+    assert [f['format_id'] for f in video_info['formats']] == ['22', '18']
+    assert 'WARNING: slow' in stderr
+
+    # A child that fails after its metadata line returns no info, with its exit status
+    video_info, returncode, _ = Child('print(json.dumps({"id": "half"})); sys.exit(3)').run()
+    assert video_info is None and returncode == 3
+
+
+def test_extraction_deadline():
+    child = Child('time.sleep(30)')
+    started = time.monotonic()
+    try:
+        child.run(timeout=0.5)
+        assert False, 'no TimeoutExpired'
+    except subprocess.TimeoutExpired:
+        pass
+    assert time.monotonic() - started < 5 and child.gone()
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing the trimmed extraction profile against a yt-dlp stand-in\n")
+
+    tests = [
+        test_vod_skips_manifests,
+        test_live_stream_gets_manifest_formats,
+        test_video_without_formats_still_fails,
+        test_full_profile_does_not_retry,
+        test_conditional_requests_only_for_get,
+        test_stale_listing_served_while_refreshing,
+        test_child_killed_once_records_read,
+        test_output_cap_kills_child,
+        test_last_line_without_newline,
+        test_extraction_deadline,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
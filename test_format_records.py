@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script for format records and their classification
+Feeds classify_formats the duplicate formats yt-dlp returns when several player
+clients list the same stream, and checks which copy is kept and what the
+response lists with and without alternates
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from format_records import FormatRecord, classify_formats, encode_formats_response, url_expiry  # noqa: E402
+
+EXPIRE = 1900000000
+
+
+def stream(format_id, url=None, format_note='720p', protocol='https', **fields):
+    """A yt-dlp format dict for the same 720p video-only stream, with a given copy's URL and note"""
+    return {
+        'format_id': format_id, 'ext': 'mp4', 'format_note': format_note, 'vcodec': 'avc1.4d401f',
+        'acodec': 'none', 'width': 1280, 'height': 720, 'fps': 30, 'quality': 8, 'protocol': protocol,
+        'url': url, **fields,
+    }
+
+
+def signed_url(client, expire=EXPIRE):
+    return f'https://rr1---sn-x.googlevideo.com/videoplayback?expire={expire}&itag=136&c={client}'
+
+
+def test_suffixed_duplicates_collapse():
+    formats = [
+        stream('136-0', signed_url('web')),
+        stream('136-1', signed_url('ios')),
+        stream('136', signed_url('tv')),
+        # Same itag, but a different stream: another audio language or resolution isn't collapsed
+        stream('136-2', signed_url('web'), height=1080, width=1920),
+        {'format_id': '140-0', 'ext': 'm4a', 'format_note': 'medium', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+         'abr': 129, 'language': 'en', 'url': signed_url('web')},
+        {'format_id': '140-1', 'ext': 'm4a', 'format_note': 'medium', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+         'abr': 129, 'language': 'de', 'url': signed_url('web')},
+    ]
+    all_formats, video_formats, audio_formats = classify_formats(formats)
+    assert len(all_formats) == 4, [record.format_id for record in all_formats]
+    assert [record.height for record in video_formats] == [1080, 720]
+    assert sorted(record.language for record in audio_formats) == ['de', 'en']
+    assert all(record.alternates is None for record in all_formats)
+
+    # Without deduplication every copy is listed
+    assert len(classify_formats(formats, deduplicate=False)[0]) == 6
+
+    identities = {FormatRecord(format_data).stream_identity() for format_data in formats[:3]}
+    assert len(identities) == 1, identities
+
+
+def test_most_usable_copy_kept():
+    expiring = signed_url('web', EXPIRE - 3600)
+    formats = [
+        stream('136-0', signed_url('ios'), format_note='720p, MISSING POT'),
+        stream('136-1', expiring),
+        stream('136-2', signed_url('tv', EXPIRE), protocol='m3u8_native'),
+        stream('136-3', signed_url('android', EXPIRE)),
+        stream('136-4', None),
+    ]
+    (kept,), _, _ = classify_formats(formats)
+    # Has a URL, no MISSING POT flag, plain https and the latest expiry
+    assert kept.format_id == '136-3', kept.format_id
+    assert url_expiry(kept.url) == EXPIRE
+
+    # A copy flagged MISSING POT loses even with a later expiry
+    (kept,), _, _ = classify_formats([
+        stream('136-0', signed_url('ios', EXPIRE + 7200), format_note='720p, MISSING POT'),
+        stream('136-1', expiring),
+    ])
+    assert kept.url == expiring, kept.url
+
+    # Order of arrival doesn't matter
+    (kept,), _, _ = classify_formats(list(reversed(formats)))
+    assert kept.format_id == '136-3', kept.format_id
+
+
+def test_alternates_listed_when_asked():
+    formats = [
+        stream('136-0', signed_url('ios'), format_note='720p, MISSING POT'),
+        stream('136-1', signed_url('web', EXPIRE - 3600)),
+        stream('136-2', signed_url('android')),
+    ]
+    without = json.loads(encode_formats_response({}, *classify_formats(formats)))
+    assert [f['format_id'] for f in without['formats']] == ['136-2']
+    assert 'alternates' not in without['formats'][0]
+
+    with_alternates = json.loads(encode_formats_response({}, *classify_formats(formats, keep_alternates=True)))
+    kept = with_alternates['formats'][0]
+    assert kept['format_id'] == '136-2'
+    assert sorted(alternate['format_id'] for alternate in kept['alternates']) == ['136-0', '136-1']
+    assert all(alternate['url'] for alternate in kept['alternates'])
+    assert with_alternates['videoFormats'][0]['alternates'] == kept['alternates']
+
+    # The URL-less listing leaves the alternates' URLs out too
+    listing = json.loads(encode_formats_response(
+        {}, *classify_formats(formats, keep_alternates=True), include_urls=False))
+    assert not any('url' in alternate for alternate in listing['formats'][0]['alternates'])
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing format records and deduplication\n")
+
+    tests = [
+        test_suffixed_duplicates_collapse,
+        test_most_usable_copy_kept,
+        test_alternates_listed_when_asked,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test script for background jobs
+Runs JobStore and JobQueue on a temporary SQLite database with stand-in job
+types, so no yt-dlp or network is needed
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import jobs  # noqa: E402
+from jobs import JobQueue, JobStore  # noqa: E402
+
+DB_DIR = tempfile.mkdtemp(prefix='debutube_jobs_test_')
+
+
+def new_store():
+    return JobStore(os.path.join(DB_DIR, f'jobs_{time.monotonic_ns()}.db'))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def backdate_heartbeat(store, job_id, seconds):
+    store._connect().execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (time.time() - seconds, job_id))
+
+
+def test_claim_order():
+    store = new_store()
+    first = store.create('batch', {}, ['a'])
+    second = store.create('batch', {}, ['b'])
+    assert store.claim() == first
+    assert store.claim() == second
+    assert store.claim() is None, 'a running job with a fresh heartbeat was claimed again'
+    assert store.get(first)['state'] == 'running'
+
+
+def test_cancel():
+    store = new_store()
+    queued = store.create('batch', {}, ['a'])
+    assert store.request_cancel(queued)
+    assert store.get(queued)['state'] == 'cancelled'
+    assert store.claim() is None, 'a cancelled job was claimed'
+    assert not store.request_cancel(queued), 'a cancelled job was cancelled again'
+
+    running = store.create('batch', {}, ['a'])
+    assert store.claim() == running
+    assert store.request_cancel(running)
+    assert store.get(running)['state'] == 'running' and store.cancel_requested(running)
+
+    assert store.finish(running, 'cancelled')
+    assert not store.request_cancel(running), 'a cancelled job was cancelled again'
+    assert not store.finish(running, 'done'), 'finishing overwrote the cancel'
+    assert store.get(running)['state'] == 'cancelled'
+
+    done = store.create('batch', {}, ['a'])
+    assert store.claim() == done and store.finish(done, 'done')
+    assert not store.request_cancel(done), 'a finished job was cancelled'
+
+
+def test_cancel_stops_before_next_item():
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(params, item):
+        started.set()
+        release.wait(5)
+        return {'item': item}
+
+    queue = JobQueue(new_store(), {'batch': (None, process)}, workers=1)
+    job_id = queue.submit('batch', {}, ['a', 'b', 'c'])
+    assert started.wait(5)
+    assert queue.cancel(job_id)
+    release.set()
+    assert wait_for(lambda: queue.store.get(job_id)['state'] == 'cancelled')
+    assert queue.store.get(job_id)['done'] == 1, 'items after the cancel were processed'
+
+
+def test_stale_job_taken_over():
+    store = new_store()
+    job_id = store.create('batch', {}, ['a', 'b', 'c'])
+    assert store.claim() == job_id
+    store.add_result(job_id, 0, 'a', True, {'item': 'a'})
+    # The worker running it died: no heartbeat since
+    backdate_heartbeat(store, job_id, jobs.STALE_SECONDS + 1)
+
+    processed = []
+    queue = JobQueue(store, {'batch': (None, lambda params, item: processed.append(item) or {'item': item})}, workers=1)
+    queue.ensure_started()
+    assert wait_for(lambda: store.get(job_id)['state'] == 'done')
+    assert processed == ['b', 'c'], f'processed {processed}'
+    assert store.get(job_id)['done'] == 3
+
+
+def test_heartbeat_during_long_item():
+    release = threading.Event()
+    saved = jobs.HEARTBEAT_SECONDS
+    jobs.HEARTBEAT_SECONDS = 0.05
+    try:
+        queue = JobQueue(new_store(), {'batch': (None, lambda params, item: release.wait(5) and {})}, workers=1)
+        job_id = queue.submit('batch', {}, ['slow'])
+        assert wait_for(lambda: queue.store.get(job_id)['heartbeat_at'] is not None)
+        backdate_heartbeat(queue.store, job_id, jobs.STALE_SECONDS + 1)
+        assert wait_for(lambda: queue.store.get(job_id)['heartbeat_at'] > time.time() - 1), \
+            'no heartbeat while the item ran'
+        assert queue.store.claim() is None, 'a job still being worked on was taken over'
+        release.set()
+        assert wait_for(lambda: queue.store.get(job_id)['state'] == 'done')
+    finally:
+        release.set()
+        jobs.HEARTBEAT_SECONDS = saved
+
+
+def test_results_after_cursor():
+    store = new_store()
+    job_id = store.create('batch', {}, ['a', 'b', 'c', 'd'])
+    # Items can finish out of order after a takeover
+    for index, item in ((0, 'a'), (2, 'c'), (1, 'b')):
+        store.add_result(job_id, index, item, item != 'b', {'item': item})
+    store.add_result(job_id, 0, 'a', True, {'item': 'again'})
+
+    results = store.results(job_id)
+    assert [index for index, *_ in results] == [0, 1, 2]
+    assert results[0][3] == {'item': 'a'}, 'a repeated result replaced the first one'
+    assert results[1][2] is False
+    assert [index for index, *_ in store.results(job_id, after=0, limit=1)] == [1]
+    assert [index for index, *_ in store.results(job_id, after=2)] == []
+    store.add_result(job_id, 3, 'd', True, {'item': 'd'})
+    assert [item for _, item, *_ in store.results(job_id, after=2)] == ['d']
+
+    job = store.get(job_id)
+    assert (job['done'], job['failed']) == (4, 1), f"done {job['done']}, failed {job['failed']}"
+
+
+def test_expansion_sets_items():
+    queue = JobQueue(new_store(), {'playlist': (lambda params: ['x', 'y', 'z'], lambda params, item: {})},
+                     workers=1, max_items=2)
+    job_id = queue.submit('playlist', {'url': 'stand-in'})
+    assert wait_for(lambda: queue.store.get(job_id)['state'] == 'done')
+    job = queue.store.get(job_id)
+    assert job['items'] == ['x', 'y'] and job['total'] == 2
+
+
+def test_importing_app_starts_no_workers():
+    api_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api')
+    script = (f'import sys; sys.path.insert(0, {api_dir!r}); import app; '
+              'print(app.JOB_WORKERS, app.JOB_QUEUE.pid)')
+    env = {**os.environ, 'DEBUTUBE_JOBS_DB': os.path.join(DB_DIR, 'import.db'), 'DEBUTUBE_JOB_WORKERS': '2'}
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-2:] == ['2', 'None'], f'job workers started on import: {result.stdout}'
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing background jobs\n")
+
+    tests = [
+        test_claim_order,
+        test_cancel,
+        test_cancel_stops_before_next_item,
+        test_stale_job_taken_over,
+        test_heartbeat_during_long_item,
+        test_results_after_cursor,
+        test_expansion_sets_items,
+        test_importing_app_starts_no_workers,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Test script for the live HLS fan-out proxy
+Runs LiveStream and LiveProxy against a local HTTP stand-in for a live media
+playlist whose window moves on when told to, so no network is needed
+"""
+
+import http.server
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from live_proxy import LiveError, LiveProxy, LiveStream, parse_media_playlist  # noqa: E402
+
+UPSTREAM_SEGMENTS = 3  # Segments listed in the stand-in's playlist
+
+
+class LivePlaylistHandler(http.server.BaseHTTPRequestHandler):
+    """A live media playlist listing segments server.first onwards, and the segments"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == '/live/index.m3u8':
+            first = self.server.first
+            lines = [
+                '#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', f'#EXT-X-MEDIA-SEQUENCE:{first}',
+                '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+            ]
+            for sequence in range(first, first + UPSTREAM_SEGMENTS):
+                lines += ['#EXTINF:2.000,', f'seg/{sequence}.ts']
+            if self.server.ended:
+                lines.append('#EXT-X-ENDLIST')
+            body, content_type = ('\n'.join(lines) + '\n').encode('utf-8'), 'application/vnd.apple.mpegurl'
+        elif self.path.startswith('/live/seg/'):
+            body, content_type = f'segment {self.path.rsplit("/", 1)[1]}'.encode('utf-8'), 'video/mp2t'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), LivePlaylistHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.first = 100
+    server.ended = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/live/index.m3u8'
+
+
+def segment_uris(playlist):
+    return [line for line in playlist.splitlines() if line and not line.startswith('#')]
+
+
+def test_parse_media_playlist():
+    text = ('#EXTM3U\n#EXT-X-TARGETDURATION:5\n#EXT-X-MEDIA-SEQUENCE:7\n#EXT-X-MAP:URI="init.mp4"\n'
+            '#EXTINF:5.0,\na.ts\n#EXT-X-DISCONTINUITY\n#EXTINF:4.0,\nhttps://cdn.example/b.ts\n#EXT-X-ENDLIST\n')
+    header, segments, target_duration, ended = parse_media_playlist(text, 'https://host.example/live/index.m3u8')
+    assert header[-1] == '#EXT-X-MAP:URI="https://host.example/live/init.mp4"', header
+    assert not any(line.startswith('#EXT-X-MEDIA-SEQUENCE') for line in header)
+    assert segments == [
+        (7, ['#EXTINF:5.0,'], 'https://host.example/live/a.ts'),
+        (8, ['#EXT-X-DISCONTINUITY', '#EXTINF:4.0,'], 'https://cdn.example/b.ts'),
+    ], segments
+    assert target_duration == 5.0 and ended
+
+    for bad in ('<html></html>', '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nlow.m3u8\n'):
+        try:
+            parse_media_playlist(bad, 'https://host.example/index.m3u8')
+            assert False, f'{bad!r} was accepted'
+        except LiveError:
+            pass
+
+
+def test_playlist_rewritten_to_proxy():
+    server, url = start_server()
+    try:
+        stream = LiveStream(lambda: url, '/api/live/video01/95', window=2, ring=4)
+        playlist = stream.playlist()
+        lines = playlist.splitlines()
+        assert lines[0] == '#EXTM3U' and lines[1] == '#EXT-X-MEDIA-SEQUENCE:101', lines
+        assert segment_uris(playlist) == ['/api/live/video01/95/101', '/api/live/video01/95/102']
+        key_line = next(line for line in lines if line.startswith('#EXT-X-KEY'))
+        assert f'URI="{url.rsplit("/", 1)[0]}/key.bin"' in key_line, key_line
+        assert '#EXT-X-ENDLIST' not in playlist
+
+        # Within the poll interval the playlist isn't fetched again
+        assert stream.playlist() == playlist and stream.playlist_fetches == 1
+
+        server.ended = True
+        stream.next_poll = 0
+        assert stream.playlist().endswith('#EXT-X-ENDLIST\n')
+        assert stream.next_poll == float('inf')
+    finally:
+        server.shutdown()
+
+
+def test_segments_fetched_once_for_all_viewers():
+    server, url = start_server()
+    try:
+        stream = LiveStream(lambda: url, '/api/live/video01/95', window=2, ring=4)
+        stream.playlist()
+        results = []
+        viewers = [threading.Thread(target=lambda: results.append(stream.get_segment(102))) for _ in range(8)]
+        for viewer in viewers:
+            viewer.start()
+        for viewer in viewers:
+            viewer.join(10)
+        assert results == [(b'segment 102.ts', 'video/mp2t')] * 8, results
+        assert server.requests.count('/live/seg/102.ts') == 1, server.requests
+        assert '/live/seg/100.ts' not in server.requests, 'a segment outside the window was fetched'
+    finally:
+        server.shutdown()
+
+
+def test_ring_keeps_newest_segments():
+    server, url = start_server()
+    try:
+        stream = LiveStream(lambda: url, '/api/live/video01/95', window=2, ring=4)
+        for _ in range(5):
+            stream.next_poll = 0
+            playlist = stream.playlist()
+            server.first += 1
+        # Windows 101-102 through 105-106 were seen; the ring holds the newest 4
+        assert segment_uris(playlist)[-1] == '/api/live/video01/95/106'
+        assert list(stream.segments) == [103, 104, 105, 106], list(stream.segments)
+        assert stream.get_segment(102) is None, 'an evicted segment was served'
+        # Dropped from the playlist but still in the ring, for slow viewers
+        assert stream.get_segment(103) == (b'segment 103.ts', 'video/mp2t')
+        for segment in list(stream.segments.values()):
+            segment.ready.wait(5)
+        assert stream.segment_fetches == 6, stream.segment_fetches
+    finally:
+        server.shutdown()
+
+
+def test_segment_requested_before_playlist():
+    server, url = start_server()
+    try:
+        # Another process served the playlist; this one opens the stream on the segment request
+        stream = LiveStream(lambda: url, '/api/live/video01/95', window=2, ring=4)
+        assert stream.get_segment(102) == (b'segment 102.ts', 'video/mp2t')
+        assert stream.playlist_fetches == 1 and list(stream.segments) == [101, 102]
+
+        # Listed upstream but outside this process's window: fetched for the request, not kept
+        assert stream.get_segment(100) == (b'segment 100.ts', 'video/mp2t')
+        assert 100 not in stream.segments and stream.direct_fetches == 1
+        assert stream.get_segment(99) is None, 'a segment no longer listed was served'
+
+        # A viewer ahead of this process's playlist gets it refreshed
+        server.first += 2
+        stream.next_poll = 0
+        assert stream.get_segment(104) == (b'segment 104.ts', 'video/mp2t')
+        assert stream.playlist_fetches == 2
+    finally:
+        server.shutdown()
+
+
+def test_stream_limit_and_idle_eviction():
+    proxy = LiveProxy(max_streams=2, idle_timeout=60)
+    first = proxy.get_stream('a/95', None, '/api/live/a/95')
+    proxy.get_stream('b/95', None, '/api/live/b/95')
+    time.sleep(0.01)
+    first.last_access = time.monotonic()  # A viewer still watching a
+    proxy.get_stream('c/95', None, '/api/live/c/95')
+    assert sorted(proxy.streams) == ['a/95', 'c/95'], sorted(proxy.streams)
+    assert proxy.get_stream('a/95', None, '/api/live/a/95') is first
+    assert proxy.stats()['evictions'] == 1
+
+    proxy.idle_timeout = 0.05
+    time.sleep(0.1)
+    proxy.get_stream('d/95', None, '/api/live/d/95')
+    assert sorted(proxy.streams) == ['d/95'], sorted(proxy.streams)
+    assert proxy.find_stream('a/95') is None
+    stats = proxy.stats()
+    assert stats['streams'] == 1 and stats['max_streams'] == 2 and stats['evictions'] == 3, stats
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing the live HLS proxy against a playlist stand-in\n")
+
+    tests = [
+        test_parse_media_playlist,
+        test_playlist_rewritten_to_proxy,
+        test_segments_fetched_once_for_all_viewers,
+        test_ring_keeps_newest_segments,
+        test_segment_requested_before_playlist,
+        test_stream_limit_and_idle_eviction,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Test script for the media segment cache
+Runs MediaCache against a local HTTP stand-in for googlevideo that can hold a
+response halfway, so readers can be checked against a partly filled .part
+segment, with no network needed
+"""
+
+import glob
+import http.server
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import media_cache  # noqa: E402
+import media_proxy  # noqa: E402
+
+SEGMENT = 256 * 1024
+MEDIA = os.urandom(SEGMENT * 2 + 1000)
+KEY = 'video01-18'
+
+
+class GatedHandler(http.server.BaseHTTPRequestHandler):
+    """Range-capable media server that stops halfway through a response until the gate opens
+
+    Bytes past server.cut_at are never sent: the connection is closed instead.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        first, last = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers['Range']).groups()
+        first = int(first)
+        last = min(int(last), len(MEDIA) - 1) if last else len(MEDIA) - 1
+        self.server.ranges.append((first, last))
+        self.send_response(206)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('ETag', '"media-v1"')
+        self.send_header('Content-Length', str(last - first + 1))
+        self.send_header('Content-Range', f'bytes {first}-{last}/{len(MEDIA)}')
+        self.end_headers()
+        middle = (first + last + 1) // 2
+        end = min(last + 1, self.server.cut_at)
+        # Cut short: the client sees the connection close before Content-Length bytes
+        self.close_connection = end <= last
+        try:
+            self.wfile.write(MEDIA[first:min(middle, end)])
+            self.wfile.flush()
+            self.server.gate.wait(10)
+            self.wfile.write(MEDIA[middle:end])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(cut_at=len(MEDIA)):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), GatedHandler)
+    server.daemon_threads = True
+    server.ranges = []
+    server.gate = threading.Event()
+    server.cut_at = cut_at
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/videoplayback?id=video01&itag=18'
+
+
+def new_cache():
+    return media_cache.MediaCache(tempfile.mkdtemp(prefix='debutube_media_cache_test_'), 64 * 1024 * 1024, SEGMENT)
+
+
+def read_in_thread(cache, url, client_range, results):
+    """Start reading client_range; results gets (chunks so far, final data or exception)"""
+    entry = results[client_range] = {'chunks': [], 'result': None}
+
+    def read():
+        try:
+            status, headers, body = cache.open_download(url, KEY, client_range)
+            for chunk in body:
+                entry['chunks'].append(chunk)
+            entry['result'] = b''.join(entry['chunks'])
+        except Exception as e:
+            entry['result'] = e
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_body(body):
+    """A download body's bytes: a SegmentFile for a cached single segment, else an iterable"""
+    if isinstance(body, media_cache.SegmentFile):
+        try:
+            return body.read()
+        finally:
+            body.close()
+    return b''.join(body)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_concurrent_readers_follow_part_file():
+    server, url = start_server()
+    cache = new_cache()
+    ranges = ['bytes=0-999', f'bytes=1000-{SEGMENT // 2 - 1}', f'bytes=100-{SEGMENT - 1}', f'bytes={SEGMENT - 500}-{SEGMENT - 1}']
+    results = {}
+    try:
+        threads = [read_in_thread(cache, url, client_range, results) for client_range in ranges]
+        part_files = lambda: glob.glob(os.path.join(cache.directory, KEY, '*.part'))  # noqa: E731
+        assert wait_for(lambda: part_files() and os.path.getsize(part_files()[0]) >= SEGMENT // 2)
+        # Ranges inside the written half are served while the fill is still running
+        assert wait_for(lambda: all(results[client_range]['result'] is not None for client_range in ranges[:2]))
+        assert results[ranges[0]]['result'] == MEDIA[:1000]
+        assert results[ranges[1]]['result'] == MEDIA[1000:SEGMENT // 2]
+        # The one straddling the written end has what was written, and waits for the rest
+        assert wait_for(lambda: sum(map(len, results[ranges[2]]['chunks'])) == SEGMENT // 2 - 100)
+        assert results[ranges[2]]['result'] is None and results[ranges[3]]['chunks'] == []
+
+        server.gate.set()
+        for thread in threads:
+            thread.join(10)
+        assert results[ranges[2]]['result'] == MEDIA[100:SEGMENT]
+        assert results[ranges[3]]['result'] == MEDIA[SEGMENT - 500:SEGMENT]
+        assert server.ranges == [(0, SEGMENT - 1)], f'upstream requests {server.ranges}'
+        assert not part_files() and os.path.exists(cache._segment_path(KEY, 0))
+        assert cache.stats()['segment_misses'] == 1
+    finally:
+        server.gate.set()
+        server.shutdown()
+
+
+def test_completed_segment_served_from_disk():
+    server, url = start_server()
+    server.gate.set()
+    cache = new_cache()
+    try:
+        status, headers, body = cache.open_download(url, KEY, 'bytes=10-99')
+        assert read_body(body) == MEDIA[10:100]
+        status, headers, body = cache.open_download(url, KEY, 'bytes=500-')
+        data = read_body(body)
+        assert status == 206 and data == MEDIA[500:], f'{len(data)} bytes'
+        requests_before = len(server.ranges)
+
+        status, headers, body = cache.open_download(url, KEY, 'bytes=200-299')
+        assert headers['X-Cache'] == 'HIT' and isinstance(body, media_cache.SegmentFile)
+        assert body.read() == MEDIA[200:300]
+        body.close()
+        assert read_body(cache.open_download(url, KEY)[2]) == MEDIA
+        assert len(server.ranges) == requests_before, 'cached segments were fetched again'
+    finally:
+        server.shutdown()
+
+
+def test_failed_fill_fails_its_readers():
+    server, url = start_server(cut_at=SEGMENT // 4)
+    server.gate.set()
+    cache = new_cache()
+    results = {}
+    try:
+        threads = [read_in_thread(cache, url, client_range, results) for client_range in ('bytes=0-99', f'bytes={SEGMENT // 2}-{SEGMENT - 1}')]
+        for thread in threads:
+            thread.join(10)
+        assert results['bytes=0-99']['result'] == MEDIA[:100]
+        assert isinstance(results[f'bytes={SEGMENT // 2}-{SEGMENT - 1}']['result'], media_proxy.SegmentFetchError), results
+        assert len(server.ranges) == media_proxy.SEGMENT_RETRIES, f'upstream requests {server.ranges}'
+        assert server.ranges[1][0] == SEGMENT // 4, 'the retry did not resume after the bytes written'
+        assert wait_for(lambda: not cache.fills), 'the failed fill was never removed'
+        assert not glob.glob(os.path.join(cache.directory, KEY, '*.part')), 'the .part file was left behind'
+
+        # The next download starts a new fill
+        server.cut_at = len(MEDIA)
+        assert read_body(cache.open_download(url, KEY, f'bytes={SEGMENT // 2}-{SEGMENT - 1}')[2]) == MEDIA[SEGMENT // 2:SEGMENT]
+    finally:
+        server.shutdown()
+
+
+def test_second_worker_follows_fill():
+    server, url = start_server()
+    directory = tempfile.mkdtemp(prefix='debutube_media_cache_test_')
+    # Two caches on one directory stand in for two workers on a host
+    workers = [media_cache.MediaCache(directory, 64 * 1024 * 1024, SEGMENT) for _ in range(2)]
+    results = {}
+    try:
+        first = read_in_thread(workers[0], url, 'bytes=0-999', results)
+        assert wait_for(lambda: results['bytes=0-999']['result'] is not None)
+        second = read_in_thread(workers[1], url, f'bytes=100-{SEGMENT - 1}', results)
+        assert wait_for(lambda: workers[1].fills)
+        server.gate.set()
+        first.join(10)
+        second.join(10)
+        assert results['bytes=0-999']['result'] == MEDIA[:1000]
+        assert results[f'bytes=100-{SEGMENT - 1}']['result'] == MEDIA[100:SEGMENT], results
+        assert server.ranges == [(0, SEGMENT - 1)], f'upstream requests {server.ranges}'
+        assert workers[0].stats()['segment_misses'] + workers[1].stats()['segment_misses'] == 1
+    finally:
+        server.gate.set()
+        server.shutdown()
+
+
+def test_abandoned_part_file_filled_again():
+    server, url = start_server()
+    server.gate.set()
+    cache = new_cache()
+    try:
+        # Left by a worker that crashed mid-fill
+        part_path = cache._segment_path(KEY, 0) + '.part'
+        os.makedirs(os.path.dirname(part_path))
+        with open(part_path, 'wb') as f:
+            f.write(MEDIA[:100])
+        old = time.time() - media_cache.STALLED_FILL_SECONDS - 1
+        os.utime(part_path, (old, old))
+        assert read_body(cache.open_download(url, KEY, 'bytes=0-999')[2]) == MEDIA[:1000]
+        assert server.ranges == [(0, SEGMENT - 1)], f'upstream requests {server.ranges}'
+    finally:
+        server.shutdown()
+
+
+def test_media_key_from_signed_url():
+    url = 'https://rr1.googlevideo.com/videoplayback?id=o-ABC&itag=18&sig=x'
+    assert media_cache.get_media_key(url) == 'o-ABC-18'
+    assert media_cache.get_media_key(url, 'dQw4w9WgXcQ') == 'dQw4w9WgXcQ-18'
+    assert media_cache.get_media_key('https://rr1.googlevideo.com/videoplayback?itag=18') is None
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing the media segment cache against a gated stand-in\n")
+
+    tests = [
+        test_concurrent_readers_follow_part_file,
+        test_completed_segment_served_from_disk,
+        test_failed_fill_fails_its_readers,
+        test_second_worker_follows_fill,
+        test_abandoned_part_file_filled_again,
+        test_media_key_from_signed_url,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Test script for server-side muxing
+Generates a video-only and an audio-only stand-in with ffmpeg, then remuxes them
+through MuxStream and /api/mux (served from a local HTTP stand-in, so no network
+is needed). Skipped when ffmpeg isn't installed; set DEBUTUBE_FFMPEG to point at one.
+"""
+
+import http.server
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import media_proxy  # noqa: E402
+import muxer  # noqa: E402
+
+STAND_INS = {}
+
+
+def make_stand_ins():
+    """Fragmented MP4 stand-ins for a DASH video-only and audio-only format"""
+    common = [muxer.FFMPEG, '-hide_banner', '-loglevel', 'error', '-y']
+    fragmented = ['-movflags', 'frag_keyframe+empty_moov', '-f', 'mp4']
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = os.path.join(temp_dir, 'video.mp4')
+        audio_path = os.path.join(temp_dir, 'audio.m4a')
+        subprocess.run(common + ['-f', 'lavfi', '-i', 'testsrc=duration=4:size=320x240:rate=25',
+                                 '-c:v', 'libx264', '-g', '25', '-pix_fmt', 'yuv420p', *fragmented, video_path], check=True)
+        subprocess.run(common + ['-f', 'lavfi', '-i', 'sine=frequency=440:duration=4',
+                                 '-c:a', 'aac', *fragmented, audio_path], check=True)
+        for name, path in (('video', video_path), ('audio', audio_path)):
+            with open(path, 'rb') as f:
+                STAND_INS[name] = f.read()
+
+
+def setup_module():
+    """Under pytest: build the stand-ins once, or skip the module without ffmpeg"""
+    if not muxer.is_available():
+        import pytest
+        pytest.skip('ffmpeg not found (set DEBUTUBE_FFMPEG to run these tests)', allow_module_level=True)
+    make_stand_ins()
+
+
+def chunks_of(data, size=16 * 1024):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+def probe(data):
+    """ffmpeg's description of the streams in data"""
+    result = subprocess.run([muxer.FFMPEG, '-hide_banner', '-i', 'pipe:0', '-f', 'null', '-'],
+                            input=data, capture_output=True)
+    assert result.returncode == 0, result.stderr.decode('utf-8', 'replace')[-500:]
+    return result.stderr.decode('utf-8', 'replace')
+
+
+class MediaHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the stand-ins at /video and /audio, with byte ranges"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = STAND_INS[self.path.strip('/')]
+        first, last, status = 0, len(data) - 1, 200
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            first = int(match.group(1))
+            last = min(int(match.group(2)), last) if match.group(2) else last
+            status = 206
+        body = data[first:last + 1]
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {first}-{last}/{len(data)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_mux_stream():
+    stream = muxer.MuxStream(chunks_of(STAND_INS['video']), chunks_of(STAND_INS['audio']))
+    output = b''.join(stream)
+    assert output[4:8] == b'ftyp'
+    assert b'moof' in output, 'output is not fragmented'
+    streams = probe(output)
+    assert 'Video: h264' in streams and 'Audio: aac' in streams, streams
+
+
+def test_output_streams_before_inputs_end():
+    def slow(data):
+        for chunk in chunks_of(data):
+            yield chunk
+            time.sleep(0.02)
+
+    stream = muxer.MuxStream(slow(STAND_INS['video']), slow(STAND_INS['audio']))
+    started = time.monotonic()
+    body = iter(stream)
+    first_chunk = next(body)
+    first_chunk_time = time.monotonic() - started
+    output = first_chunk + b''.join(body)
+    total_time = time.monotonic() - started
+    assert first_chunk_time < total_time / 2, f'first bytes after {first_chunk_time:.2f}s of {total_time:.2f}s'
+    assert b'moof' in output
+
+
+def test_close_stops_ffmpeg():
+    def endless(data):
+        while True:
+            yield from chunks_of(data)
+
+    stream = muxer.MuxStream(endless(STAND_INS['video']), endless(STAND_INS['audio']))
+    body = iter(stream)
+    next(body)
+    stream.close()  # What the WSGI server does when the client goes away
+    assert stream.process.poll() is not None, 'ffmpeg still running'
+    for thread in stream.feeders:
+        thread.join(5)
+        assert not thread.is_alive(), 'an input feeder is still running'
+
+
+def test_failed_start_closes_pipes():
+    ffmpeg = muxer.FFMPEG
+    muxer.FFMPEG = os.path.join(tempfile.gettempdir(), 'no-such-ffmpeg')
+    open_fds = len(os.listdir('/proc/self/fd'))
+    try:
+        for _ in range(3):
+            try:
+                muxer.MuxStream(iter([]), iter([]))
+            except OSError:
+                pass
+            else:
+                assert False, 'MuxStream started without ffmpeg'
+    finally:
+        muxer.FFMPEG = ffmpeg
+    assert len(os.listdir('/proc/self/fd')) == open_fds, 'pipe fds leaked'
+
+
+def test_mux_endpoint():
+    import app
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    allowed = media_proxy.is_allowed_media_url
+    media_proxy.is_allowed_media_url = lambda media_url: media_url.startswith('http://127.0.0.1')
+    try:
+        client = app.app.test_client()
+        response = client.get('/api/mux', query_string={
+            'videoUrl': f'{base_url}/video', 'audioUrl': f'{base_url}/audio', 'filename': 'video.mp4'})
+        assert response.status_code == 200 and response.mimetype == 'video/mp4'
+        assert 'video.mp4' in response.headers['Content-Disposition']
+        streams = probe(response.data)
+        assert 'Video: h264' in streams and 'Audio: aac' in streams, streams
+
+        response = client.get('/api/mux', query_string={
+            'videoUrl': f'{base_url}/video', 'audioUrl': f'{base_url}/audio', 'container': 'avi'})
+        assert response.status_code == 400
+
+        # H.264 and AAC don't fit in WebM; refused before anything is fetched or sent
+        response = client.get('/api/mux', query_string={
+            'videoUrl': f'{base_url}/video?itag=137&mime=video%2Fmp4',
+            'audioUrl': f'{base_url}/audio?itag=140&mime=audio%2Fmp4', 'container': 'webm'})
+        assert response.status_code == 400 and 'webm' in response.get_json()['error'], response.get_json()
+    finally:
+        media_proxy.is_allowed_media_url = allowed
+        server.shutdown()
+
+    response = client.get('/api/mux', query_string={
+        'videoUrl': 'https://example.com/video.mp4', 'audioUrl': 'https://example.com/audio.m4a'})
+    assert response.status_code == 400
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing server-side muxing against local stand-ins\n")
+
+    if not muxer.is_available():
+        print("⚠️ ffmpeg not found, skipping (set DEBUTUBE_FFMPEG to run these tests)")
+        return True
+    make_stand_ins()
+
+    tests = [
+        test_mux_stream,
+        test_output_streams_before_inputs_end,
+        test_close_stops_ffmpeg,
+        test_failed_start_closes_pipes,
+        test_mux_endpoint,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script for prefetching direct URLs after an extraction
+Checks which formats get_prefetch_picks chooses, and that prefetch_direct_urls
+caches the URLs it already has and stops resolving the others once the prefetch
+budget runs out, with resolve_direct_url stubbed so nothing is extracted
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('DEBUTUBE_JOB_WORKERS', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import app  # noqa: E402
+from format_records import classify_formats  # noqa: E402
+from refresh_scheduler import CircuitBreaker, RefreshBudget  # noqa: E402
+
+EXPIRE = int(time.time()) + 6 * 3600
+
+
+def video_format(format_id, height, vcodec='avc1', acodec='none', filesize=None, url='signed', **fields):
+    if url == 'signed':
+        url = f'https://rr1---sn-x.googlevideo.com/videoplayback?expire={EXPIRE}&itag={format_id}'
+    return {'format_id': format_id, 'ext': 'mp4', 'vcodec': vcodec, 'acodec': acodec, 'height': height,
+            'width': height and height * 16 // 9, 'filesize': filesize, 'protocol': 'https', 'url': url, **fields}
+
+
+def audio_format(format_id, abr, filesize=None, url='signed'):
+    return video_format(format_id, None, vcodec='none', acodec='mp4a.40.2', filesize=filesize, url=url, abr=abr)
+
+
+FORMATS = [
+    video_format('137', 1080),  # Best video, but the UI hides it: no file size
+    video_format('136', 720, filesize=40_000_000),
+    video_format('135', 480, filesize=20_000_000),
+    audio_format('251', 160),
+    audio_format('140', 129, filesize=5_000_000),
+    video_format('18', 360, acodec='mp4a.40.2', filesize=15_000_000),
+]
+
+
+class StubResolver:
+    """Records resolve_direct_url calls made by prefetch threads"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, url, format_id, cookie_file=None):
+        with self.lock:
+            self.calls.append(format_id)
+        return ['https://rr1---sn-x.googlevideo.com/videoplayback?itag=' + format_id], False
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and len(self.calls) < count:
+            time.sleep(0.02)
+        time.sleep(0.1)  # Give any extra thread the chance to show up
+        return sorted(self.calls)
+
+
+def with_stubs(test):
+    def run():
+        saved = app.resolve_direct_url, app.PREFETCH_BUDGET, app.EXTRACTION_BREAKER
+        app.resolve_direct_url = StubResolver()
+        try:
+            test(app.resolve_direct_url)
+        finally:
+            app.resolve_direct_url, app.PREFETCH_BUDGET, app.EXTRACTION_BREAKER = saved
+    run.__name__ = test.__name__
+    return run
+
+
+def test_picks_best_of_each_type_with_known_size():
+    _, video_formats, audio_formats = classify_formats(FORMATS)
+    picks = app.get_prefetch_picks(video_formats, audio_formats)
+    assert [(record.type, record.format_id) for record in picks] == [
+        ('video', '136'), ('audio', '140'), ('combined', '18')], [record.format_id for record in picks]
+
+    # Without any known sizes the best of each type is picked
+    _, video_formats, audio_formats = classify_formats([video_format('137', 1080), audio_format('251', 160)])
+    assert [record.format_id for record in app.get_prefetch_picks(video_formats, audio_formats)] == ['137', '251']
+
+
+@with_stubs
+def test_extracted_urls_cached_without_budget(resolver):
+    app.PREFETCH_BUDGET = RefreshBudget(0)
+    _, video_formats, audio_formats = classify_formats(FORMATS)
+    picks = app.get_prefetch_picks(video_formats, audio_formats)
+    app.prefetch_direct_urls('https://www.youtube.com/watch?v=prefetch001', 'prefetch001', picks, True)
+    for record in picks:
+        entry = json.loads(app.CACHE.get(app.get_direct_url_cache_key('prefetch001', record.format_id)))
+        assert entry == {'directUrl': record.url, 'using_file_cookies': True}, entry
+    assert resolver.wait_for(0) == [], 'formats with a URL were resolved again'
+
+
+@with_stubs
+def test_budget_stops_resolving(resolver):
+    # Formats without a URL in the extraction (manifest-only) need their own resolve
+    formats = [video_format('136', 720, filesize=1, url=None), audio_format('140', 129, filesize=1, url=None),
+               video_format('18', 360, acodec='mp4a.40.2', filesize=1, url=None)]
+    _, video_formats, audio_formats = classify_formats(formats)
+    picks = app.get_prefetch_picks(video_formats, audio_formats)
+    assert len(picks) == 3
+
+    app.PREFETCH_BUDGET = RefreshBudget(2)
+    app.prefetch_direct_urls('https://www.youtube.com/watch?v=prefetch002', 'prefetch002', picks, True)
+    assert resolver.wait_for(2) == ['136', '140'], f'resolved {resolver.calls}'
+    app.prefetch_direct_urls('https://www.youtube.com/watch?v=prefetch003', 'prefetch003', picks, True)
+    assert len(resolver.wait_for(3)) == 2, 'resolved past the budget'
+
+    # Nothing is resolved while bot detection has paused extraction
+    app.PREFETCH_BUDGET = RefreshBudget(10)
+    app.EXTRACTION_BREAKER = CircuitBreaker(threshold=1)
+    app.EXTRACTION_BREAKER.record_failure()
+    app.prefetch_direct_urls('https://www.youtube.com/watch?v=prefetch004', 'prefetch004', picks, True)
+    assert len(resolver.wait_for(3)) == 2, 'resolved while the breaker was open'
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing direct URL prefetching\n")
+
+    tests = [
+        test_picks_best_of_each_type_with_known_size,
+        test_extracted_urls_cached_without_budget,
+        test_budget_stops_resolving,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
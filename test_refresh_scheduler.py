@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test script for proactive refresh of hot videos
+Drives AccessTracker, RefreshBudget, CircuitBreaker and RefreshScheduler on a
+controllable clock with stubbed expiry and refresh callables, so nothing is
+extracted and no test waits
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import refresh_scheduler  # noqa: E402
+from refresh_scheduler import AccessTracker, CircuitBreaker, RefreshBudget, RefreshScheduler  # noqa: E402
+
+
+class Clock:
+    """Stands in for the time module in refresh_scheduler; only moves when told to"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def with_clock(test):
+    def run():
+        clock = Clock()
+        saved = refresh_scheduler.time
+        refresh_scheduler.time = clock
+        try:
+            test(clock)
+        finally:
+            refresh_scheduler.time = saved
+    run.__name__ = test.__name__
+    return run
+
+
+def hot_tracker(counts):
+    """Tracker where each key was requested counts[key] times just now"""
+    tracker = AccessTracker()
+    for key, count in counts.items():
+        for _ in range(count):
+            tracker.record(key)
+    return tracker
+
+
+def scheduler(tracker, expiry, budget, breaker, refreshed, **options):
+    return RefreshScheduler(tracker, expiry.get, refreshed.append, budget, breaker, **options)
+
+
+@with_clock
+def test_budget_limits_refreshes(clock):
+    tracker = hot_tracker({'a': 9, 'b': 8, 'c': 7, 'd': 6, 'e': 5})
+    refreshed = []
+    refresher = scheduler(tracker, {}, RefreshBudget(2), CircuitBreaker(), refreshed, min_score=1)
+    assert refresher.run_once() == 2
+    assert refreshed == ['a', 'b'], 'the hottest keys were not refreshed first'
+    assert refresher.run_once() == 0, 'refreshed past the budget'
+
+    # 2 a minute refills one token every 30 seconds, and never more than 2
+    clock.advance(30)
+    assert refresher.run_once() == 1
+    clock.advance(3600)
+    assert refresher.run_once() == 2
+    assert refreshed == ['a', 'b', 'a', 'a', 'b'] and refresher.stats()['scheduled'] == 5
+
+
+@with_clock
+def test_only_hot_expiring_keys_refreshed(clock):
+    tracker = hot_tracker({'fresh': 9, 'expiring': 8, 'expired': 7, 'uncached': 6, 'cold': 1})
+    expiry = {'fresh': clock.now + 3600, 'expiring': clock.now + 600, 'expired': clock.now - 60}
+    refreshed = []
+    refresher = scheduler(tracker, expiry, RefreshBudget(10), CircuitBreaker(), refreshed, min_score=3, lead=900)
+    assert refresher.run_once() == 3
+    assert refreshed == ['expiring', 'expired', 'uncached'], refreshed
+
+    # Requests decay: an hour later (two half-lives) nothing is hot enough
+    clock.advance(3600)
+    assert tracker.hottest(10, min_score=3) == []
+    assert refresher.run_once() == 0
+
+
+@with_clock
+def test_breaker_opens_and_retries_half_open(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=300)
+    refreshed = []
+    refresher = scheduler(hot_tracker({'a': 5}), {}, RefreshBudget(60), breaker, refreshed, min_score=1)
+    for _ in range(2):
+        breaker.record_failure()
+    assert not breaker.is_open(), 'opened before the threshold'
+    breaker.record_failure()
+    assert breaker.is_open() and refresher.stats()['breaker_open']
+    assert refresher.run_once() == 0 and refreshed == [], 'refreshed while the breaker was open'
+
+    # After the cooldown one attempt goes through; failing it reopens the breaker at once
+    clock.advance(301)
+    assert not breaker.is_open()
+    assert refresher.run_once() == 1
+    breaker.record_failure()
+    assert breaker.is_open(), 'a failed retry did not reopen the breaker'
+    clock.advance(299)
+    assert refresher.run_once() == 0
+
+    # A successful retry closes it, and the count starts over
+    clock.advance(2)
+    assert refresher.run_once() == 1
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open() and breaker.failures == 1
+    assert refreshed == ['a', 'a']
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing the hot video refresh scheduler\n")
+
+    tests = [
+        test_budget_limits_refreshes,
+        test_only_hot_expiring_keys_refreshed,
+        test_breaker_opens_and_retries_half_open,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
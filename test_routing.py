@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test script for consistent-hash routing of video IDs across API nodes
+Checks how the hash ring spreads and moves keys, and forwards requests through
+the standalone router to two local stand-in nodes, so no network is needed
+"""
+
+import gzip
+import http.server
+import os
+import socket
+import sys
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from routing import FORWARDED_HEADER, HashRing, NodeRouter, create_router_app  # noqa: E402
+
+KEYS = [f'video{n:06d}' for n in range(20000)]
+BODY = gzip.compress(os.urandom(512 * 1024))
+
+
+class StandInNodeHandler(http.server.BaseHTTPRequestHandler):
+    """API node that answers with a gzipped body, sent in two parts when ?slow=1"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.forwarded_by.append(self.headers.get(FORWARDED_HEADER))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.send_header('X-Node', self.server.name)
+        self.end_headers()
+        half = len(BODY) // 2
+        self.wfile.write(BODY[:half])
+        self.wfile.flush()
+        if 'slow=1' in self.path:
+            self.server.release.wait(5)
+        self.wfile.write(BODY[half:])
+
+
+class StandInNode(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The router's pooled keep-alive connections are reset when the test exits
+        pass
+
+
+def start_node(name):
+    server = StandInNode(('127.0.0.1', 0), StandInNodeHandler)
+    server.name = name
+    server.forwarded_by = []
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def key_owned_by(router, node):
+    return next(key for key in KEYS if router.owner(key) == node)
+
+
+def test_keys_spread_evenly():
+    nodes = [f'http://10.0.0.{n}:5000' for n in range(1, 5)]
+    ring = HashRing(nodes)
+    counts = Counter(ring.owner(key) for key in KEYS)
+    mean = len(KEYS) / len(nodes)
+    for node in nodes:
+        assert 0.75 * mean < counts[node] < 1.25 * mean, f'{node} owns {counts[node]} of {len(KEYS)} keys'
+
+
+def test_adding_a_node_moves_only_its_keys():
+    nodes = [f'http://10.0.0.{n}:5000' for n in range(1, 5)]
+    ring = HashRing(nodes)
+    before = {key: ring.owner(key) for key in KEYS}
+    ring.add_node('http://10.0.0.5:5000')
+    moved = [key for key in KEYS if ring.owner(key) != before[key]]
+    assert all(ring.owner(key) == 'http://10.0.0.5:5000' for key in moved), 'keys moved between old nodes'
+    assert 0.12 < len(moved) / len(KEYS) < 0.28, f'{len(moved)} of {len(KEYS)} keys moved'
+
+    ring.remove_node('http://10.0.0.5:5000')
+    assert all(ring.owner(key) == before[key] for key in KEYS), 'removing the node did not restore the owners'
+
+
+def test_owners_are_distinct_in_ring_order():
+    ring = HashRing(['a', 'b', 'c'])
+    owners = ring.owners('video000001')
+    assert sorted(owners) == ['a', 'b', 'c'], owners
+    assert owners[0] == ring.owner('video000001')
+    assert ring.owners('video000001', 2) == owners[:2]
+    assert HashRing().owner('video000001') is None
+
+
+def test_forwards_to_owner():
+    node_a, url_a = start_node('a')
+    node_b, url_b = start_node('b')
+    router = NodeRouter([url_a, url_b])
+    client = create_router_app(router, lambda request: request.args.get('v')).test_client()
+
+    for server, url in ((node_a, url_a), (node_b, url_b)):
+        response = client.get(f'/api/formats?v={key_owned_by(router, url)}')
+        assert response.status_code == 200
+        assert response.headers['X-Node'] == server.name and response.headers['X-Served-By'] == url
+        # Passed through still compressed
+        assert response.headers['Content-Encoding'] == 'gzip' and response.data == BODY
+        assert server.forwarded_by == ['router'], server.forwarded_by
+    assert router.stats()['forwarded'] == 2
+
+
+def test_response_is_streamed():
+    node, url = start_node('a')
+    router = NodeRouter([url])
+    client = create_router_app(router, lambda request: request.args.get('v')).test_client()
+    response = client.get('/api/formats?v=video000001&slow=1', buffered=False)
+    chunks = response.iter_encoded()
+    first = next(chunks)
+    # The node holds back the second half until released, so this arrived on its own
+    assert BODY.startswith(first) and len(first) < len(BODY), f'{len(first)} of {len(BODY)} bytes in the first read'
+    node.release.set()
+    assert first + b''.join(chunks) == BODY
+    response.close()
+
+
+def test_unreachable_owner_falls_over():
+    node, url = start_node('a')
+    dead = f'http://127.0.0.1:{unused_port()}'
+    router = NodeRouter([url, dead], timeout=5)
+    client = create_router_app(router, lambda request: request.args.get('v')).test_client()
+    video_id = key_owned_by(router, dead)
+    response = client.get(f'/api/formats?v={video_id}')
+    assert response.status_code == 200 and response.headers['X-Served-By'] == url
+    stats = router.stats()
+    assert stats['down'] == [dead] and stats['failures'] == 1, stats
+    assert router.owner(video_id) == url, 'the unreachable node is still on the ring'
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing video ID routing against local stand-in nodes\n")
+
+    tests = [
+        test_keys_spread_evenly,
+        test_adding_a_node_moves_only_its_keys,
+        test_owners_are_distinct_in_ring_order,
+        test_forwards_to_owner,
+        test_response_is_streamed,
+        test_unreachable_owner_falls_over,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Test script for segmented downloads in the media proxy
+Runs SegmentedDownload and /api/download against a local HTTP stand-in that
+throttles every connection, like googlevideo does, so no network is needed
+"""
+
+import http.server
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import media_proxy  # noqa: E402
+
+MEDIA = os.urandom(6 * 1024 * 1024)
+CONNECTION_RATE = 2 * 1024 * 1024  # bytes/s per connection
+CHUNK = 32 * 1024
+
+
+class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+    """Range-capable media server that sends at most CONNECTION_RATE per connection"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests += 1
+        first, last, status = 0, len(MEDIA) - 1, 200
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and (if_range is None or if_range == '"media-v1"'):
+            first = int(match.group(1))
+            last = min(int(match.group(2)), last) if match.group(2) else last
+            status = 206
+            if first >= len(MEDIA):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(MEDIA)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        body = MEDIA[first:last + 1]
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('ETag', '"media-v1"')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {first}-{last}/{len(MEDIA)}')
+        self.end_headers()
+        try:
+            for offset in range(0, len(body), CHUNK):
+                self.wfile.write(body[offset:offset + CHUNK])
+                time.sleep(CHUNK / CONNECTION_RATE)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/videoplayback'
+
+
+def timed_read(body):
+    started = time.monotonic()
+    data = b''.join(body)
+    return data, time.monotonic() - started
+
+
+def test_segmented_beats_single_connection():
+    server, url = start_server()
+    try:
+        single, single_time = timed_read(media_proxy.open_download(url)[2])
+        download = media_proxy.SegmentedDownload(url, 0, len(MEDIA) - 1)
+        segmented, segmented_time = timed_read(iter(download))
+        assert single == MEDIA
+        assert segmented == MEDIA
+        assert download.max_workers > media_proxy.SEGMENT_MIN_CONNECTIONS, 'connection count never grew'
+        assert segmented_time * 1.5 < single_time, f'{segmented_time:.2f}s segmented vs {single_time:.2f}s single'
+        print(f"   single connection {single_time:.2f}s, segmented {segmented_time:.2f}s "
+              f"with up to {download.max_workers} connections")
+    finally:
+        server.shutdown()
+
+
+def test_reorder_buffer_is_bounded():
+    server, url = start_server()
+    try:
+        buffer_bytes = 1024 * 1024
+        download = media_proxy.SegmentedDownload(url, 0, len(MEDIA) - 1, buffer_bytes=buffer_bytes)
+        chunks = []
+        for chunk in download:
+            chunks.append(chunk)
+            time.sleep(0.05)  # A slow client
+        assert b''.join(chunks) == MEDIA
+        assert download.max_buffered <= buffer_bytes, f'{download.max_buffered} bytes buffered'
+    finally:
+        server.shutdown()
+
+
+def test_ranges_pass_through():
+    server, url = start_server()
+    try:
+        status, headers, body = media_proxy.open_download(url, 'bytes=1000000-', segmented=True)
+        assert status == 206
+        assert headers['Content-Range'] == f'bytes 1000000-{len(MEDIA) - 1}/{len(MEDIA)}'
+        assert int(headers['Content-Length']) == len(MEDIA) - 1000000
+        assert b''.join(body) == MEDIA[1000000:]
+
+        status, headers, body = media_proxy.open_download(url, 'bytes=100-199', segmented=True)
+        assert status == 206 and b''.join(body) == MEDIA[100:200]
+
+        # A changed validator gets the whole file back, as a plain stream
+        status, headers, body = media_proxy.open_download(url, 'bytes=1000000-', '"media-v0"', segmented=True)
+        assert status == 200 and b''.join(body) == MEDIA
+
+        status, headers, body = media_proxy.open_download(url, f'bytes={len(MEDIA)}-', segmented=True)
+        assert status == 416
+        body.close()
+
+        status, headers, body = media_proxy.open_download(url, segmented=True)
+        assert status == 200 and 'Content-Range' not in headers
+        assert int(headers['Content-Length']) == len(MEDIA)
+        body.close()
+    finally:
+        server.shutdown()
+
+
+def test_disconnect_stops_fetching():
+    server, url = start_server()
+    try:
+        status, headers, body = media_proxy.open_download(url, segmented=True)
+        next(body)
+        next(body)
+        body.close()  # What the WSGI server does when the client goes away
+        time.sleep(1.5)
+        requests_after_close = server.requests
+        time.sleep(1.5)
+        assert server.requests == requests_after_close, 'segments were still being fetched'
+    finally:
+        server.shutdown()
+
+
+def test_download_endpoint():
+    import app
+
+    server, url = start_server()
+    allowed = media_proxy.is_allowed_media_url
+    media_proxy.is_allowed_media_url = lambda media_url: media_url.startswith('http://127.0.0.1')
+    try:
+        client = app.app.test_client()
+        response = client.get('/api/download', query_string={'url': url, 'filename': 'video.mp4'})
+        assert response.status_code == 200 and response.data == MEDIA
+        response = client.get('/api/download', query_string={'url': url}, headers={'Range': 'bytes=10-'})
+        assert response.status_code == 206 and response.data == MEDIA[10:]
+    finally:
+        media_proxy.is_allowed_media_url = allowed
+        server.shutdown()
+
+    response = client.get('/api/download', query_string={'url': 'https://example.com/video.mp4'})
+    assert response.status_code == 400
+
+    # IDs are checked before anything is resolved
+    for video_id, format_id in (('jNQXAC9IVRw', '18+140 -o /tmp/x'), ('jNQXAC9IVRw', '--exec=id'), ('short', '18')):
+        response = client.get('/api/download', query_string={'videoId': video_id, 'formatId': format_id})
+        assert response.status_code == 400 and response.get_json()['error'] == 'Invalid video or format ID'
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing segmented downloads against a throttling stand-in\n")
+
+    tests = [
+        test_segmented_beats_single_connection,
+        test_reorder_buffer_is_bounded,
+        test_ranges_pass_through,
+        test_disconnect_stops_fetching,
+        test_download_endpoint,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
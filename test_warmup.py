@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for the warm-up and the /ready readiness check
+Swaps the app's warm-up for one with stand-in steps the test controls, and checks
+that /ready answers 503 until it has finished and 200 after, with a failed step
+reported without holding readiness back
+"""
+
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('DEBUTUBE_JOB_WORKERS', '0')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import app  # noqa: E402
+from warmup import WarmUp  # noqa: E402
+
+
+def broken_step():
+    raise RuntimeError('cookie file unreadable')
+
+
+def with_warm_up(steps, required=True):
+    """Run the test with app.WARM_UP replaced by a WarmUp of steps"""
+    def decorate(test):
+        def run():
+            saved = app.WARM_UP
+            app.WARM_UP = WarmUp(steps, required=required)
+            try:
+                test(app.WARM_UP)
+            finally:
+                app.WARM_UP = saved
+        run.__name__ = test.__name__
+        return run
+    return decorate
+
+
+def wait_for_state(warm_up, state, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and warm_up.state != state:
+        time.sleep(0.02)
+    return warm_up.state
+
+
+RELEASE = threading.Event()
+
+
+@with_warm_up([('ytdlp', lambda: RELEASE.wait(10) and None), ('cookies', broken_step), ('connections', lambda: 'pooled')])
+def test_not_ready_until_warm_up_finishes(warm_up):
+    RELEASE.clear()
+    client = app.app.test_client()
+    response = client.get('/ready')
+    assert response.status_code == 503, response.status_code
+    assert response.get_json()['state'] in ('pending', 'running')
+    assert wait_for_state(warm_up, 'running') == 'running'
+    assert client.get('/ready').status_code == 503, 'ready while a step was still running'
+
+    RELEASE.set()
+    assert wait_for_state(warm_up, 'done') == 'done'
+    response = client.get('/ready')
+    assert response.status_code == 200, response.status_code
+    body = response.get_json()
+    assert body['ready'] and body['finished'] >= body['started']
+    # The failed step is reported, but doesn't hold readiness back
+    assert body['steps']['cookies'] == {'ok': False, 'error': 'cookie file unreadable',
+                                        'ms': body['steps']['cookies']['ms']}, body['steps']
+    assert body['steps']['ytdlp']['ok'] and body['steps']['connections']['detail'] == 'pooled'
+
+
+@with_warm_up([('ytdlp', lambda: None)], required=False)
+def test_ready_without_boot_warm_up(warm_up):
+    client = app.app.test_client()
+    response = client.get('/ready')
+    assert response.status_code == 200 and response.get_json()['state'] == 'idle'
+    assert warm_up.pid is None, 'a warm-up that was not asked for was started'
+
+    # Run on request, before responding with ?wait=1; only local callers may
+    response = client.post('/api/internal/warmup?wait=1')
+    assert response.status_code == 200 and response.get_json()['state'] == 'done', response.get_json()
+    response = client.post('/api/internal/warmup', headers={'X-Forwarded-For': '203.0.113.9'})
+    assert response.status_code == 403, response.status_code
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing the warm-up and readiness check\n")
+
+    tests = [
+        test_not_ready_until_warm_up_finishes,
+        test_ready_without_boot_warm_up,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for streamed ZIP archives
+Builds archives with ZipStream from in-memory entries and reads them back with
+zipfile, checking every entry's CRC with testzip
+"""
+
+import io
+import os
+import struct
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from zip_stream import ZipStream  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def opener(name, data, size='exact'):
+    """An entry opener for data sent in chunks; size is its length, or None for unknown"""
+    size = len(data) if size == 'exact' else size
+    return lambda: (name, size, (data[offset:offset + CHUNK] for offset in range(0, len(data), CHUNK)))
+
+
+def failing_opener():
+    raise RuntimeError('format no longer available')
+
+
+def build(openers):
+    archive = ZipStream(openers)
+    return b''.join(archive), archive
+
+
+def read_back(data):
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None, f'bad CRC in {archive.testzip()}'
+    return archive
+
+
+def test_entries_round_trip():
+    contents = [os.urandom(CHUNK * 3 + 17), b'', 'ünïcode'.encode('utf-8') * 100]
+    data, _ = build([opener(name, body) for name, body in zip(('video.mp4', 'empty.txt', 'Ürlaub.m4a'), contents)])
+    archive = read_back(data)
+    assert archive.namelist() == ['video.mp4', 'empty.txt', 'Ürlaub.m4a'], archive.namelist()
+    for info, body in zip(archive.infolist(), contents):
+        assert archive.read(info) == body
+        assert info.compress_type == zipfile.ZIP_STORED and info.flag_bits & 0x0008
+
+
+def test_duplicate_names_made_unique():
+    names = ['clip.mp4', 'clip.mp4', 'clip (2).mp4', 'README', 'README', 'clip.mp4']
+    data, _ = build([opener(name, name.encode('utf-8') + bytes([index])) for index, name in enumerate(names)])
+    archive = read_back(data)
+    expected = ['clip.mp4', 'clip (2).mp4', 'clip (2) (2).mp4', 'README', 'README (2)', 'clip (3).mp4']
+    assert archive.namelist() == expected, archive.namelist()
+    for index, (name, original) in enumerate(zip(expected, names)):
+        assert archive.read(name) == original.encode('utf-8') + bytes([index])
+
+
+def test_unknown_size_gets_zip64_headers():
+    body = os.urandom(CHUNK * 2 + 5)
+    data, archive_stream = build([opener('live.ts', body, size=None), opener('small.txt', b'known')])
+    assert [zip64 for *_, zip64 in archive_stream.records] == [True, False]
+    # The ZIP64 extra of the first local header: sizes follow in the data descriptor
+    name_length = struct.unpack('<H', data[26:28])[0]
+    assert struct.unpack('<2H', data[30 + name_length:34 + name_length]) == (0x0001, 16)
+    archive = read_back(data)
+    assert archive.read('live.ts') == body and archive.getinfo('live.ts').file_size == len(body)
+    assert archive.read('small.txt') == b'known'
+
+
+def test_zip64_end_record_past_65535_entries():
+    count = 0x10000
+    data, _ = build([opener(f'{index:05x}.txt', b'x') for index in range(count)])
+    assert b'PK\x06\x06' in data[-200:] and b'PK\x06\x07' in data[-200:], 'no ZIP64 end record'
+    archive = read_back(data)
+    assert len(archive.infolist()) == count
+    assert archive.read('0ffff.txt') == b'x'
+
+
+def test_failed_entries_listed_in_errors_txt():
+    data, archive_stream = build([opener('a.mp4', b'first'), failing_opener, opener('c.mp4', b'third')])
+    archive = read_back(data)
+    assert archive.namelist() == ['a.mp4', 'c.mp4', 'errors.txt'], archive.namelist()
+    assert archive.read('errors.txt') == b'Entry 2: format no longer available\n'
+    assert archive_stream.errors == ['Entry 2: format no longer available']
+
+
+def test_entry_failing_midway_ends_archive():
+    def broken_body():
+        yield b'partial'
+        raise OSError('connection reset')
+
+    try:
+        build([opener('a.mp4', b'first'), lambda: ('b.mp4', 100, broken_body())])
+        assert False, 'an archive with a truncated entry was completed'
+    except OSError as e:
+        assert 'connection reset' in str(e)
+
+
+def main():
+    """Main test function"""
+    print("🧪 Testing streamed ZIP archives\n")
+
+    tests = [
+        test_entries_round_trip,
+        test_duplicate_names_made_unique,
+        test_unknown_size_gets_zip64_headers,
+        test_zip64_end_record_past_65535_entries,
+        test_failed_entries_listed_in_errors_txt,
+        test_entry_failing_midway_ends_archive,
+    ]
+    success_count = 0
+
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+            success_count += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e or 'assertion failed'}")
+
+    print(f"\n📊 Results: {success_count}/{len(tests)} tests passed")
+    return success_count == len(tests)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)